@@ -0,0 +1,420 @@
+import argparse
+import asyncio
+import bisect
+import collections
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import profiling
+import run_history
+from content_catalog import CATALOG_DIR
+from content_planner import (CALENDAR_EARLY_MINUTES, CALENDAR_LATE_MINUTES, COUNTER_WORKFLOWS, POST_TYPES,
+                             POST_WORKFLOWS, finish_slot, load_calendar, plan_caption, read_prompts)
+from crosspost import CROSSPOST_POLL_INTERVAL, CROSSPOST_PROCESSING_TIMEOUT, create_post_container
+from media_hash_index import filter_duplicate_images, media_name, record_posted
+from media_validator import validate_media
+from origin_prewarm import COUNTER_FILES, RENDER_IMAGE_EXTENSION, load_slots, read_counter, upcoming_slots
+from structured_log import aflush, get_logger
+from threads_client import Account, ThreadsClient, probe_media, wait_until_ready
+
+log = get_logger("backfill")
+
+# slot time, post type, post ID, published at; committed like posted_media.tsv so
+# later backfills (and other runners) know which slots were already replayed
+BACKFILLS_PATH = os.environ.get('BACKFILLS_PATH', os.path.join(CATALOG_DIR, "backfills.tsv"))
+
+# How far back missed slots are looked for: 48h, 3d or an ISO date
+BACKFILL_WINDOW = os.environ.get('BACKFILL_WINDOW', '48h')
+# Seconds between two backfilled posts, so a catch-up doesn't flood followers' feeds
+BACKFILL_SPACING_SECONDS = float(os.environ.get('BACKFILL_SPACING_SECONDS', '300'))
+# Post types that get the publishing quota first when it can't cover every missed slot
+BACKFILL_PRIORITY = os.environ.get('BACKFILL_PRIORITY', 'image,video,text,poll')
+# Publishes left for the regular schedule
+BACKFILL_QUOTA_RESERVE = int(os.environ.get('BACKFILL_QUOTA_RESERVE', '10'))
+# Slots prepared (caption, media checks, ready container) while an earlier one waits to publish
+BACKFILL_PREPARE_AHEAD = int(os.environ.get('BACKFILL_PREPARE_AHEAD', '4'))
+
+# The media_type a published post of each type has in the account's post list; text and
+# poll posts are both TEXT_POST and told apart by the poll_attachment field
+POST_MEDIA_TYPES = {"text": ("TEXT_POST",), "poll": ("TEXT_POST",),
+                    "image": ("IMAGE", "CAROUSEL_ALBUM"), "video": ("VIDEO",)}
+POST_FIELDS = "id,timestamp,media_type,poll_attachment"
+# thread_image probes this many `{counter}_{idx}` images per day
+MAX_IMAGES = 20
+
+
+def backfilled(since, path=BACKFILLS_PATH):
+    """
+    Returns:
+        dict: (slot_at, post_type) -> post ID of the slots since `since` already backfilled.
+    """
+    done = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                slot_at, post_type, post_id, _ = line.rstrip("\n").split("\t")
+                if int(slot_at) >= since:
+                    done[(int(slot_at), post_type)] = post_id
+    return done
+
+
+def record_backfill(slot, post_id, path=BACKFILLS_PATH):
+    """Appends a replayed slot."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(f"{slot['slot_at']}\t{slot['type']}\t{post_id}\t{time.time():.0f}\n")
+
+
+def history_posts(since):
+    """
+    (published at, post ID, {post type}) for every published run in the run history.
+
+    On Actions the history only holds the backfill workflow's own runs (each workflow
+    keeps its own), so there the account's post list is what finds published slots.
+    """
+    try:
+        db = run_history.open_history()
+        rows = db.execute(
+            "SELECT started_at, post_id, post_type FROM runs WHERE result = 'published' AND started_at >= ?", (since,)
+        ).fetchall()
+        db.close()
+    except sqlite3.Error:
+        return []
+    return [(started_at, post_id, {post_type}) for started_at, post_id, post_type in rows if post_type in POST_TYPES]
+
+
+def api_posts(posts):
+    """The account's post list as (published at, post ID, post types it can be)."""
+    found = []
+    for post in posts:
+        published_at = datetime.strptime(post["timestamp"], "%Y-%m-%dT%H:%M:%S%z").timestamp()
+        types = {post_type for post_type, media in POST_MEDIA_TYPES.items() if post.get("media_type") in media}
+        if types == {"text", "poll"}:
+            types = {"poll"} if post.get("poll_attachment") else {"text"}
+        found.append((published_at, post["id"], types))
+    return found
+
+
+def find_missed(scheduled, posts, done, early=CALENDAR_EARLY_MINUTES * 60, late=CALENDAR_LATE_MINUTES * 60):
+    """
+    Matches scheduled slots to published posts; each post fills at most one slot.
+
+    Parameters:
+        scheduled (list): (slot_at, post_type), oldest first.
+        posts (list): (published at, post ID, post types); earlier entries win when
+            the same post ID appears twice, so pass the run history first.
+        done (set): (slot_at, post_type) known to be published, e.g. backfilled.
+        early, late (float): Seconds a post may be published before / after its slot.
+
+    Returns:
+        list: The (slot_at, post_type) no post was found for.
+    """
+    unique, seen = [], set()
+    for post in posts:
+        if post[1] not in seen:
+            seen.add(post[1])
+            unique.append(post)
+    unique.sort(key=lambda post: post[0])
+    times = [post[0] for post in unique]
+    used, missed = set(), []
+    for slot_at, post_type in scheduled:
+        if (slot_at, post_type) in done:
+            continue
+        i = bisect.bisect_left(times, slot_at - early)
+        while i < len(unique) and times[i] <= slot_at + late:
+            if i not in used and post_type in unique[i][2]:
+                used.add(i)
+                break
+            i += 1
+        else:
+            missed.append((slot_at, post_type))
+    return missed
+
+
+async def missed_slots(client, account, since, now, post_types=POST_TYPES):
+    """
+    Slots of `post_types` between `since` and the late window before `now` that
+    nothing was published for, per the run history, the account's post list,
+    the calendar and earlier backfills.
+
+    Image and video slots carry the media counter they would have used: the current
+    counter minus the counter workflow runs since the slot, so a backfill keeps the
+    media sequence instead of skipping it. A calendar slot whose planned counter
+    differs is logged and gets the counter file's value, as thread_image/thread_video do.
+
+    Returns:
+        list: Slot dicts (calendar entries where there is one), oldest first.
+    """
+    start = datetime.fromtimestamp(since, timezone.utc)
+    end = now - timedelta(minutes=CALENDAR_LATE_MINUTES)
+    minutes = max(int((end - start).total_seconds() // 60), 0)
+    scheduled = [(int(moment.timestamp()), post_type) for moment, post_type
+                 in upcoming_slots(load_slots(post_types, workflows=POST_WORKFLOWS), start, minutes)]
+
+    calendar = {(entry["slot_at"], entry["type"]): entry for entry in load_calendar() if entry["slot_at"] >= since}
+    done = backfilled(since)
+    published = {key for key, entry in calendar.items() if entry["status"] == "published"} | set(done)
+    posts = await client.published_posts(account, since - CALENDAR_EARLY_MINUTES * 60, fields=POST_FIELDS)
+    listed = [post for post in api_posts(posts) if post[1] not in done.values()]
+
+    counter_types = [kind for kind in COUNTER_WORKFLOWS if kind in post_types]
+    bumps = {kind: [] for kind in counter_types}
+    counter_minutes = int((now - start).total_seconds() // 60)
+    for moment, kind in upcoming_slots(load_slots(counter_types, workflows=COUNTER_WORKFLOWS), start, counter_minutes):
+        bumps[kind].append(int(moment.timestamp()))
+    counters = {kind: read_counter(COUNTER_FILES[kind]) for kind in counter_types}
+
+    slots = []
+    for slot_at, post_type in find_missed(scheduled, history_posts(since) + listed, published):
+        entry = calendar.get((slot_at, post_type)) or {
+            "slot": datetime.fromtimestamp(slot_at, timezone.utc).isoformat(), "slot_at": slot_at, "type": post_type,
+        }
+        if post_type in counters:
+            runs_since = len(bumps[post_type]) - bisect.bisect_right(bumps[post_type], slot_at)
+            counter = counters[post_type] - runs_since
+            if entry.get("counter", counter) != counter:
+                # The planner predicted the counter; the counter file is what the workflows actually advanced
+                log.warning("Planned counter drifted from the counter file, using the file",
+                            slot=entry["slot"], planned=entry["counter"], counter=counter)
+            entry["counter"] = counter
+        slots.append(entry)
+    return slots
+
+
+async def publish_budget(client, account, reserve=BACKFILL_QUOTA_RESERVE):
+    """Posts the account can still publish in the current quota window, minus `reserve`."""
+    limit = await client.publishing_limit(account)
+    return limit["config"]["quota_total"] - limit["quota_usage"] - reserve
+
+
+def select_slots(slots, budget, priority):
+    """
+    The `budget` slots to replay: by `priority` (post types, first wins) and then
+    oldest first, returned in schedule order.
+    """
+    rank = {post_type: index for index, post_type in enumerate(priority)}
+    chosen = sorted(slots, key=lambda slot: (rank.get(slot["type"], len(rank)), slot["slot_at"]))[:max(budget, 0)]
+    return sorted(chosen, key=lambda slot: (slot["slot_at"], POST_TYPES.index(slot["type"])))
+
+
+async def slot_media(client, slot, media_bases, validate=True, dedup=True):
+    """
+    The slot's media URLs, probed, with images posted recently left out like
+    thread_image does (unless `dedup` is off), and (unless `validate` is off)
+    checked against Threads' limits.
+
+    Returns:
+        tuple: (media URLs, name -> pHash of the images for record_posted)
+    """
+    counter = slot["counter"]
+    hashes = {}
+    if slot["type"] == "image":
+        urls = await probe_media(client, [f"{media_bases['image']}/{counter}_{index}.{RENDER_IMAGE_EXTENSION}"
+                                          for index in range(1, MAX_IMAGES + 1)])
+        if urls and dedup:
+            kept, hashes = await asyncio.to_thread(filter_duplicate_images, urls)
+            if not kept:
+                raise ValueError(f"The images for counter {counter} were already posted recently")
+            urls = kept
+    else:
+        urls = await probe_media(client, [f"{media_bases['video']}/Video_{counter}.mp4"])
+    if urls and validate:
+        results = await asyncio.gather(*(asyncio.to_thread(validate_media, url) for url in urls))
+        for url, result in zip(urls, results):
+            if not result["ok"]:
+                log.warning("Skipping media that fails Threads' requirements", url=url, errors=result["errors"])
+        urls = [url for url, result in zip(urls, results) if result["ok"]]
+    if not urls:
+        raise ValueError(f"No usable {slot['type']} media for counter {counter}")
+    kept_names = {media_name(url) for url in urls}
+    return urls, {name: phash for name, phash in hashes.items() if name in kept_names}
+
+
+async def prepare_slot(client, account, slot, run, prompts, media_bases, validate=True, use_model=True, dedup=True):
+    """
+    Everything a missed slot needs before publishing: the caption (the calendar's,
+    or generated now) and the media checks run concurrently, then the container is
+    created and polled until it can be published.
+
+    Returns:
+        tuple: (container ID, caption fields, name -> pHash of the images to record_posted)
+    """
+    post_type = slot["type"]
+
+    async def caption():
+        if "caption" in slot:
+            return slot
+        with run.phase("caption"):
+            return await asyncio.to_thread(plan_caption, post_type, prompts[post_type], use_model)
+
+    async def media():
+        if post_type not in ("image", "video"):
+            return [], {}
+        with run.phase("media_probe"):
+            return await slot_media(client, slot, media_bases, validate, dedup)
+
+    planned, (urls, hashes) = await asyncio.gather(caption(), media())
+    with run.phase("create_container"):
+        if post_type == "poll":
+            container_id = await client.create_container(account, "TEXT", text=planned["caption"],
+                                                         poll_options=json.dumps(planned["options"]))
+        elif post_type == "text":
+            container_id = await client.create_container(account, "TEXT", text=planned["caption"])
+        else:
+            container_id = await create_post_container(client, account, post_type, planned["caption"], urls)
+    with run.phase("processing_wait"):
+        await wait_until_ready(client, account, container_id, CROSSPOST_POLL_INTERVAL, CROSSPOST_PROCESSING_TIMEOUT)
+    return container_id, planned, hashes
+
+
+async def replay(client, account, slots, prompts, media_bases, spacing=BACKFILL_SPACING_SECONDS,
+                 ahead=BACKFILL_PREPARE_AHEAD, validate=True, use_model=True, record=True, dedup=True):
+    """
+    Publishes missed slots in schedule order, `spacing` seconds apart.
+
+    Up to `ahead` later slots are prepared while the current one waits, so caption
+    generation, media probes and container processing overlap with the spacing;
+    publish calls stay strictly sequential. A slot that fails is recorded and
+    skipped. Each slot is recorded as a `backfill_{type}` run.
+
+    Parameters:
+        record (bool): Store published slots in backfills.tsv and the calendar,
+            and their images in posted_media.tsv.
+        dedup (bool): Leave out images posted recently, per posted_media.tsv.
+
+    Returns:
+        list: (slot, post ID or None, error or None) per slot.
+    """
+    queue = iter(slots)
+    pending = collections.deque()
+
+    def prepare_next():
+        slot = next(queue, None)
+        if slot is not None:
+            run = run_history.RunRecorder(f"backfill_{slot['type']}")
+            task = asyncio.create_task(prepare_slot(client, account, slot, run, prompts, media_bases, validate,
+                                                    use_model, dedup))
+            pending.append((slot, run, task))
+
+    for _ in range(ahead + 1):
+        prepare_next()
+    results, last_publish = [], None
+    while pending:
+        slot, run, task = pending.popleft()
+        prepare_next()
+        post_id, error = None, None
+        try:
+            container_id, planned, hashes = await task
+            if last_publish is not None:
+                await asyncio.sleep(max(last_publish + spacing - time.monotonic(), 0.0))
+            with run.phase("publish"):
+                post_id = await client.publish(account, container_id)
+            last_publish = time.monotonic()
+            log.info("Slot backfilled", slot=slot["slot"], post_type=slot["type"], post_id=post_id,
+                     counter=slot.get("counter"))
+        except Exception as e:
+            error = e
+            log.exception("Backfill failed", slot=slot["slot"], post_type=slot["type"], error=f"{type(e).__name__}: {e}")
+        run.post_id = post_id
+        run.finish(error)
+        if record:
+            if post_id:
+                record_backfill(slot, post_id)
+                record_posted(hashes)
+            if "index" in slot:
+                finish_slot(slot, post_id)
+        results.append((slot, post_id, error))
+    return results
+
+
+async def run_backfill(base_url, account, since, post_types=POST_TYPES, spacing=BACKFILL_SPACING_SECONDS,
+                       priority=BACKFILL_PRIORITY.split(","), max_posts=None, reserve=BACKFILL_QUOTA_RESERVE,
+                       ahead=BACKFILL_PREPARE_AHEAD, dry_run=False, media_bases=None, validate=True,
+                       use_model=True, record=True, dedup=True):
+    """
+    Finds the missed slots since `since` and replays as many as the publishing
+    quota (less `reserve`) and `max_posts` allow.
+
+    Returns:
+        tuple: (missed slots, chosen slots, replay results; empty for a dry run)
+    """
+    media_bases = media_bases or {"image": os.environ.get('RENDER_BASE_IMAGE_URL'),
+                                  "video": os.environ.get('RENDER_BASE_VIDEO_URL')}
+    client = ThreadsClient(base_url, max_connections=16)
+    try:
+        slots = await missed_slots(client, account, since, datetime.now(timezone.utc), post_types)
+        budget = await publish_budget(client, account, reserve)
+        if max_posts is not None:
+            budget = min(budget, max_posts)
+        chosen = select_slots(slots, budget, priority)
+        log.info("Missed slots found", missed=len(slots), budget=budget, replaying=len(chosen))
+        if dry_run or not chosen:
+            return slots, chosen, []
+        prompts = read_prompts({slot["type"] for slot in chosen})
+        results = await replay(client, account, chosen, prompts, media_bases, spacing, ahead, validate,
+                               use_model, record, dedup)
+        return slots, chosen, results
+    finally:
+        await client.aclose()
+        await aflush()
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Publish the slots missed during an outage, oldest first")
+    parser.add_argument("--since", default=BACKFILL_WINDOW, help="48h, 3d or an ISO date (default: %(default)s)")
+    parser.add_argument("--types", nargs="+", choices=POST_TYPES, default=list(POST_TYPES))
+    parser.add_argument("--spacing", type=float, default=BACKFILL_SPACING_SECONDS, help="Seconds between posts")
+    parser.add_argument("--priority", default=BACKFILL_PRIORITY, help="Post types served first when quota is short")
+    parser.add_argument("--max-posts", type=int, help="Replay at most this many slots")
+    parser.add_argument("--reserve", type=int, default=BACKFILL_QUOTA_RESERVE,
+                        help="Publishes left for the regular schedule")
+    parser.add_argument("--ahead", type=int, default=BACKFILL_PREPARE_AHEAD, help="Slots prepared in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="List the missed slots without publishing")
+    parser.add_argument("--local", action="store_true", help="Generate missing captions without the model")
+    parser.add_argument("--fake-api", action="store_true", help="Replay against a local fake Graph API")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write cProfile and tracemalloc artifacts next to the run history")
+    args = parser.parse_args()
+
+    since = run_history.parse_since(args.since)
+    options = dict(post_types=tuple(args.types), spacing=args.spacing, priority=args.priority.split(","),
+                   max_posts=args.max_posts, reserve=args.reserve, ahead=args.ahead, dry_run=args.dry_run,
+                   use_model=not args.local)
+    server = None
+    try:
+        # Each replayed slot is its own backfill_<type> run; the profile covers the whole replay
+        with profiling.profiled("backfill", args.profile):
+            if args.fake_api:
+                from load_test import start_fake_api
+                server, base_url = start_fake_api({"sigma": 0.2, "latency_scale": 0.2, "media_per_day": 10 ** 6})
+                # Fake posts must not mark real slots as done, nor fake media be matched against posted images
+                missed, chosen, results = asyncio.run(run_backfill(
+                    base_url, Account("1000000", "fake-token"), since, media_bases={"image": f"{base_url}/media",
+                    "video": f"{base_url}/media"}, validate=False, record=False, dedup=False, **options
+                ))
+            else:
+                account = Account(os.environ['THREADS_USER_ID'], os.environ['THREADS_ACCESS_TOKEN'])
+                missed, chosen, results = asyncio.run(run_backfill(
+                    f"https://{os.environ['THREADS_BASE_URL']}", account, since, **options
+                ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    replaying = {(slot["slot_at"], slot["type"]) for slot in chosen}
+    if args.dry_run or not results:
+        for slot in missed:
+            mark = "→" if (slot["slot_at"], slot["type"]) in replaying else " "
+            print(f"{mark} {slot['slot'][:16]}  {slot['type']:<6}{slot.get('counter', '-')!s:>6}")
+        print(f"{len(missed)} missed slots, {len(chosen)} within the quota")
+    for slot, post_id, error in results:
+        if post_id:
+            print(f"✅ {slot['slot'][:16]} {slot['type']:<6} {post_id}")
+        else:
+            print(f"❌ {slot['slot'][:16]} {slot['type']:<6} {type(error).__name__}: {error}")
@@ -0,0 +1,232 @@
+import re
+import sys
+import unicodedata
+
+THREADS_TEXT_LIMIT = 500
+POLL_OPTION_LIMIT = 25
+POLL_MIN_OPTIONS = 2
+POLL_MAX_OPTIONS = 4
+
+
+class CaptionRejected(ValueError):
+    """Raised when generated text can't be repaired into a postable caption."""
+
+
+# One alternation handles every inline markdown construct in a single pass.
+MARKDOWN = re.compile(
+    r"(?P<heading>^[ \t]*#{1,6}[ \t]+)"
+    r"|(?P<quote>^[ \t]*>[ \t]?)"
+    r"|(?P<rule>^[ \t]*(?:[-*_][ \t]*){3,}$)"
+    r"|\[(?P<link>[^\]\n]+)\]\([^)\n]*\)"
+    r"|(?P<code>`{1,3})"
+    r"|(?P<emphasis>\*{1,3}|(?<!\w)_{2,3}|_{2,3}(?!\w))"
+    r"|(?P<quotes>[\"“”])",
+    re.MULTILINE,
+)
+
+# Intro/outro chatter models add around the caption
+CHATTER_LINE = re.compile(
+    r"^[ \t]*(?:(?:sure|okay|ok|of course|absolutely|here(?:'s| is| are))\b[^\n]*:"
+    r"|(?:caption|thread|post)[ \t]*:?"
+    r"|theme[ \t]*:[^\n]*"
+    r"|(?:chosen|selected) theme\b[^\n]*"
+    r"|i (?:chose|picked) (?:the )?theme\b[^\n]*)[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+LABEL_PREFIX = re.compile(r"^\s*(?:caption|thread|post|text)\s*:\s*", re.IGNORECASE)
+
+# The prompt leaking back into the output
+PROMPT_LEAK = re.compile(
+    r"requirements\s*:|strict rules|strict requirements|do not use markdown|randomly pick|"
+    r"act as a flirty|under 1000 characters|return the output|give only 1 response",
+    re.IGNORECASE,
+)
+# Assistant-style refusals only: a flirty "I'm sorry I kept you up" or "I can't help myself" is a caption
+REFUSAL = re.compile(
+    r"\bi(?:'m| am) sorry,? but i(?: can(?:'t|not)| won't|(?:'m| am) (?:not able|unable) to) "
+    r"(?:help|assist|create|write|provide|generate|produce|comply|fulfill?|do that|do this)\b"
+    r"|\bi(?: can(?:'t|not)| won't(?: be able to)?|(?:'m| am) (?:not able|unable) to) "
+    r"(?:help|assist|create|write|provide|generate|produce|comply|fulfill?)(?: you)?(?: with)? "
+    # The object has to be the request itself ("that request", "with that."), not "that smile of yours"
+    r"(?:(?:that|this|your|such|the) (?:request|content|prompt|task)s?\b|requests?\b"
+    r"|(?:that|this)(?=[ \t]*(?:[.!\n]|$))|(?:explicit|sexual|nsfw) (?:content|material|stories|posts?)\b)"
+    r"|\bas an ai\b|\bas a language model\b|\bagainst (?:my|the) (?:guidelines|policies)\b",
+    re.IGNORECASE,
+)
+# Captions REFUSAL must (True) and must not (False) reject; `caption_filter.py --check` runs them
+REFUSAL_CASES = {
+    "I'm sorry, but I can't help with that.": True,
+    "I can't assist with that request.": True,
+    "I'm unable to create explicit content.": True,
+    "I'm sorry, but I'm unable to write that.": True,
+    "As an AI, I have to keep things respectful.": True,
+    "I'm sorry I kept you up all night 😘": False,
+    "I can't help myself around you 🔥": False,
+    "I can't help this feeling when you look at me 😏": False,
+    "I won't create this drama, just come over 💋": False,
+    "I can't help you with that smile of yours 😘": False,
+}
+# Curly and modifier apostrophes, compared as ASCII ones in REFUSAL
+APOSTROPHES = str.maketrans("’‘ʼ`", "''''")
+BLANK_LINES = re.compile(r"\n{3,}")
+SPACES = re.compile(r"[ \t]+")
+
+
+def _markdown_replacement(match):
+    if match.lastgroup == "link":
+        return match.group("link")
+    return ""
+
+
+def _is_extender(char):
+    code = ord(char)
+    return (
+        unicodedata.category(char) in ("Mn", "Me", "Mc")
+        or code == 0x200D                      # zero width joiner
+        or 0xFE00 <= code <= 0xFE0F            # variation selectors
+        or 0x1F3FB <= code <= 0x1F3FF          # skin tone modifiers
+        or 0xE0020 <= code <= 0xE007F          # tag sequences (subdivision flags)
+        or 0xE0100 <= code <= 0xE01EF
+    )
+
+
+def _is_regional_indicator(char):
+    return 0x1F1E6 <= ord(char) <= 0x1F1FF
+
+
+def grapheme_clusters(text):
+    """
+    Splits text into user-perceived characters.
+
+    Covers what shows up in captions: combining marks, emoji modifiers and
+    variation selectors, ZWJ sequences, keycaps, tag sequences and flag pairs.
+
+    Returns:
+        list: The clusters, in order.
+    """
+    clusters = []
+    regional_run = 0
+    for char in text:
+        if clusters and (
+            _is_extender(char)
+            or clusters[-1].endswith("\u200d")
+            or (clusters[-1] == "\r" and char == "\n")
+            or (_is_regional_indicator(char) and regional_run % 2 == 1)
+        ):
+            clusters[-1] += char
+        else:
+            clusters.append(char)
+        regional_run = regional_run + 1 if _is_regional_indicator(char) else 0
+    return clusters
+
+
+def truncate(text, limit):
+    """
+    Cuts text to at most `limit` code points without splitting a grapheme cluster,
+    preferring to end on a word boundary.
+    """
+    if len(text) <= limit:
+        return text
+    kept, size = [], 0
+    for cluster in grapheme_clusters(text):
+        if size + len(cluster) > limit - 1:
+            break
+        kept.append(cluster)
+        size += len(cluster)
+    cut = "".join(kept)
+    boundary = cut.rfind(" ")
+    if boundary >= len(cut) * 0.8:
+        cut = cut[:boundary]
+    return cut.rstrip(" ,;:-—") + "…"
+
+
+def normalize_caption(text, limit=THREADS_TEXT_LIMIT):
+    """
+    Repairs generated text into a postable caption or rejects it.
+
+    Strips markdown and quote marks, drops intro/outro chatter and "Caption:"
+    labels, collapses whitespace and trims to `limit` by grapheme cluster.
+
+    Parameters:
+        text (str): Raw model output.
+        limit (int): Maximum length in code points.
+
+    Returns:
+        str: The normalized caption.
+
+    Raises:
+        CaptionRejected: For empty output, refusals or leaked prompt text.
+    """
+    if not text or not text.strip():
+        raise CaptionRejected("Empty caption.")
+    if REFUSAL.search(text.translate(APOSTROPHES)):
+        raise CaptionRejected("Model refused to write the caption.")
+
+    text = unicodedata.normalize("NFC", text.replace("\r\n", "\n"))
+    text = MARKDOWN.sub(_markdown_replacement, text)
+    text = CHATTER_LINE.sub("", text)
+    text = LABEL_PREFIX.sub("", text)
+    text = "\n".join(SPACES.sub(" ", line).strip() for line in text.split("\n"))
+    text = BLANK_LINES.sub("\n\n", text).strip()
+
+    if not text:
+        raise CaptionRejected("Caption was only formatting or chatter.")
+    if PROMPT_LEAK.search(text):
+        raise CaptionRejected("Caption contains leaked prompt instructions.")
+    return truncate(text, limit)
+
+
+def normalize_poll(question, options):
+    """
+    Validates and repairs a poll against Threads' limits.
+
+    Options longer than 25 characters are trimmed by grapheme cluster, empty
+    and duplicate options are dropped and at most four are kept.
+
+    Parameters:
+        question (str): Poll question.
+        options (dict): option_a..option_d -> text.
+
+    Returns:
+        tuple: (question, options) ready for create_poll_container.
+
+    Raises:
+        CaptionRejected: When fewer than two usable options remain or the question is unusable.
+    """
+    question = normalize_caption(question)
+    cleaned, seen = [], set()
+    for key in sorted(options):
+        value = MARKDOWN.sub(_markdown_replacement, options[key] or "")
+        value = SPACES.sub(" ", value).strip()
+        if not value:
+            continue
+        if len(value) > POLL_OPTION_LIMIT:
+            value = truncate(value, POLL_OPTION_LIMIT)
+        if value.lower() in seen:
+            continue
+        seen.add(value.lower())
+        cleaned.append(value)
+
+    if len(cleaned) < POLL_MIN_OPTIONS:
+        raise CaptionRejected(f"Poll needs at least {POLL_MIN_OPTIONS} distinct options.")
+    cleaned = cleaned[:POLL_MAX_OPTIONS]
+    return question, {f"option_{letter}": value for letter, value in zip("abcd", cleaned)}
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    if sys.argv[1:] == ["--check"]:
+        wrong = [text for text, refusal in REFUSAL_CASES.items()
+                 if bool(REFUSAL.search(text.translate(APOSTROPHES))) != refusal]
+        for text in wrong:
+            print(f"❌ {'Missed refusal' if REFUSAL_CASES[text] else 'Rejected caption'}: {text}")
+        if wrong:
+            sys.exit(1)
+        print(f"✅ All {len(REFUSAL_CASES)} refusal cases pass.")
+        sys.exit(0)
+    raw = sys.stdin.read()
+    try:
+        print(normalize_caption(raw))
+    except CaptionRejected as e:
+        print(f"❌ Rejected: {e}")
+        sys.exit(1)
@@ -0,0 +1,322 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+PROMPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPT_FILES = {
+    "thread": os.path.join(PROMPT_DIR, "prompt_text.txt"),
+    "poll": os.path.join(PROMPT_DIR, "prompt_polls.txt"),
+    "caption": os.path.join(PROMPT_DIR, "prompt_image_video.txt"),
+}
+
+THREADS_TEXT_LIMIT = 500
+POLL_OPTION_LIMIT = 25
+
+# Prompt section titles -> grammar theme (same names as the content catalog tags)
+THEME_KEYWORDS = [
+    ("flirty question", "flirty_questions"),
+    ("teasing", "teasing_updates"),
+    ("spicy", "spicy_opinions"),
+    ("good morning", "morning_night"),
+    ("confession", "confessions"),
+    ("fantasy", "fantasy_roleplay"),
+    ("engagement", "engagement"),
+    ("dare", "dares_games"),
+]
+
+# Each rule maps to weighted alternatives; {slot} references another rule.
+GRAMMAR = {
+    "emoji": [(3, "😏"), (3, "😉"), (3, "🔥"), (2, "💋"), (2, "😈"), (2, "👀"), (2, "🖤"), (1, "🫣"),
+              (1, "✨"), (1, "💭"), (1, "🥵"), (1, "🙈")],
+    "emojis": [(3, "{emoji}"), (4, "{emoji}{emoji}"), (1, "{emoji}{emoji}{emoji}")],
+    "opener": [(4, ""), (2, "Okay, real talk… "), (2, "Be honest… "), (1, "Quick question… "),
+               (1, "Not gonna lie… "), (1, "Confession time… "), (1, "Hey you… "), (1, "Soooo… ")],
+    "pet_name": [(3, "babe"), (2, "handsome"), (2, "trouble"), (1, "cutie"), (1, "stranger"), (1, "love")],
+    "time": [(3, "tonight"), (2, "right now"), (2, "this weekend"), (1, "after midnight"), (1, "this morning")],
+    "outfit": [(3, "your hoodie"), (2, "a little black dress"), (2, "red lace"), (2, "satin"),
+               (1, "heels and attitude"), (1, "my favorite oversized shirt"), (1, "something you'd like")],
+    "place": [(2, "in bed"), (2, "on the couch"), (1, "by the window"), (1, "in the shower"),
+              (1, "on a rooftop"), (1, "in your car")],
+    "mood": [(3, "dangerous"), (2, "bored"), (2, "cute"), (2, "a little naughty"), (1, "clingy"),
+             (1, "too confident"), (1, "soft")],
+    "pair": [(2, "Lace|Leather"), (2, "Morning cuddles|Midnight kisses"), (2, "Naughty|Nice"),
+             (2, "Texting|Calling"), (1, "Slow kiss|Quick kiss"), (1, "Beach date|Rooftop drinks"),
+             (1, "Soft hands|Strong hands"), (1, "My smile|My eyes"), (1, "Sweet talker|Bold talker"),
+             (1, "Coffee date|Wine date"), (1, "Red|Black"), (1, "Cuddle|Kiss")],
+    "hashtags": [(3, "#flirty #confidence #vibes #selflove #reels"),
+                 (2, "#mood #cute #instagood #girlvibes #explore"),
+                 (2, "#naughtyornice #smile #trending #love #viral"),
+                 (1, "#goodvibes #feminine #softgirl #aesthetic #fyp")],
+
+    "flirty_questions": [
+        (3, "Guess what I'm wearing {time}… hint: it's {outfit} {emojis}"),
+        (3, "{pair_question}"),
+        (2, "If I whispered 'come over' {time}… how fast would you be here? {emojis}"),
+        (2, "Which is more dangerous… my smile or my mind? {emojis}"),
+        (1, "Would you kiss me first… or let me make the first move? {emojis}"),
+    ],
+    "teasing_updates": [
+        (3, "Feeling {mood} {time}… someone distract me {emojis}"),
+        (2, "Just got out of the shower… my towel is doing a terrible job {emojis}"),
+        (2, "Wearing {outfit}… and nothing to do {time} {emojis}"),
+        (2, "My DMs are getting wild {time}… should I share? {emojis}"),
+        (1, "Lying {place} thinking about you, {pet_name} {emojis}"),
+    ],
+    "spicy_opinions": [
+        (3, "{pair_question}"),
+        (2, "Red flag if he replies 'k'? 🚩 or ❤️?"),
+        (2, "Unpopular opinion: confidence is the sexiest outfit {emojis}"),
+        (1, "Is teasing more fun… or giving in? {emojis}"),
+    ],
+    "morning_night": [
+        (3, "Good morning, {pet_name}… woke up feeling {mood} {emojis}"),
+        (3, "Good night… or should I say bad night? {emojis}"),
+        (2, "About to sleep… unless you text me something fun {emojis}"),
+        (1, "Morning kisses >>> morning coffee. Agree? {emojis}"),
+    ],
+    "confessions": [
+        (3, "I have a secret… but it's not safe for Threads {emojis}"),
+        (2, "Confession: I've been thinking about someone all day… it might be you {emojis}"),
+        (2, "Last night's dream? Let's just say I woke up blushing {emojis}"),
+        (1, "My guilty pleasure? Late-night flirty chats {place} {emojis}"),
+    ],
+    "fantasy_roleplay": [
+        (3, "POV: You walk in and see me {place} wearing {outfit} {emojis}"),
+        (2, "If I were your naughty secretary… what would you make me do? {emojis}"),
+        (2, "If I was your date {time}, what would we be doing? {emojis}"),
+        (1, "You + me + rain outside = ? {emojis}"),
+    ],
+    "engagement": [
+        (3, "Describe me using only 3 emojis {emojis}"),
+        (2, "Finish this: If we were together {time}… {emojis}"),
+        (2, "First word that comes to mind when you think of me? {emojis}"),
+        (1, "Tell me your go-to flirting line {emojis}"),
+    ],
+    "dares_games": [
+        (3, "Truth or dare in the comments — I'm playing {emojis}"),
+        (2, "First one to comment gets a personal question {emojis}"),
+        (2, "Dare me to post my next pic with no filter? {emojis}"),
+        (1, "Comment a color… and I'll tell you what I'd wear in it {emojis}"),
+    ],
+    "pair_question": [(1, "{pair_a} or {pair_b}? Which one gets you going? {emojis}"),
+                      (1, "{pair_a} or {pair_b} {time}? {emojis}")],
+
+    "thread": [(1, "{opener}{theme}")],
+    "caption": [(3, "{short_caption} {emojis}\n\n{hashtags}"), (1, "{short_caption}\n\n{hashtags}")],
+    "short_caption": [(2, "Just me being {mood}"), (2, "Dressed up for you {time}"), (2, "On your mind yet?"),
+                      (1, "Look, but don't blink"), (1, "I see you"), (1, "No rush. I'm not going anywhere."),
+                      (1, "Careful what you wish for, {pet_name}")],
+
+    "poll_question": [(3, "{pair_a} or {pair_b}? {emojis}"), (2, "Be honest: {pair_a} or {pair_b}? {emojis}"),
+                      (1, "Help me decide {time}… {emojis}")],
+}
+
+SLOT = re.compile(r"\{(\w+)\}")
+
+
+class Grammar:
+    """
+    Weighted template grammar with pre-computed cumulative weights.
+
+    Parameters:
+        rules (dict): Rule name -> list of (weight, template) alternatives.
+        rng: Random source (defaults to the `random` module).
+    """
+
+    def __init__(self, rules, rng=random):
+        self.rng = rng
+        self.alternatives = {}
+        self.rules = {}
+        for name, alternatives in rules.items():
+            self.add(name, alternatives)
+
+    def add(self, name, alternatives):
+        """Adds alternatives to rule `name` (creating it if needed)."""
+        merged = self.alternatives.get(name, []) + list(alternatives)
+        self.alternatives[name] = merged
+        total, cumulative = 0, []
+        for weight, _ in merged:
+            total += weight
+            cumulative.append(total)
+        self.rules[name] = ([template for _, template in merged], cumulative)
+
+    def choose(self, name):
+        templates, cumulative = self.rules[name]
+        return self.rng.choices(templates, cum_weights=cumulative)[0]
+
+    def expand(self, name, bindings=None, depth=0):
+        """Expands rule `name`; `bindings` fixes slot values for this expansion."""
+        if depth > 8:
+            raise RecursionError(f"Grammar recursion too deep at {name}")
+        bindings = {} if bindings is None else bindings
+        template = self.choose(name)
+
+        def replace(match):
+            slot = match.group(1)
+            if slot in bindings:
+                return bindings[slot]
+            if slot in ("pair_a", "pair_b"):
+                bindings["pair_a"], bindings["pair_b"] = self.choose("pair").split("|")
+                return bindings[slot]
+            return self.expand(slot, bindings, depth + 1)
+
+        return SLOT.sub(replace, template)
+
+    def size(self, name, seen=()):
+        """Approximate number of distinct expansions of `name`."""
+        if name in ("pair_a", "pair_b"):
+            return len(self.rules["pair"][0]) if name == "pair_a" else 1
+        if name in seen:
+            return 1
+        total = 0
+        for template in self.rules[name][0]:
+            combinations = 1
+            for slot in SLOT.findall(template):
+                combinations *= self.size(slot, seen + (name,))
+            total += combinations
+        return total
+
+
+def _literal(text):
+    # Example text is used verbatim, so braces must not be read as slots
+    return text.replace("{", "(").replace("}", ")")
+
+
+def parse_prompt_themes(prompt_file):
+    """
+    Extracts the numbered theme sections and their example lines from a prompt file.
+
+    "- Example N - ..." lines outside a theme section are returned under "examples".
+
+    Returns:
+        dict: Theme name -> list of example strings.
+    """
+    themes, current = {}, None
+    try:
+        with open(prompt_file, "r", encoding="utf-8") as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return themes
+    for line in lines:
+        line = line.strip()
+        heading = re.match(r"^\d+\.\s+(.*)$", line)
+        if heading:
+            title = heading.group(1).lower()
+            current = next((theme for keyword, theme in THEME_KEYWORDS if keyword in title), None)
+            continue
+        captioned = re.match(r"^-\s+Example \d+\s+-\s+(.*\S)$", line)
+        if captioned:
+            themes.setdefault("examples", []).append(captioned.group(1).replace("\\n", "").strip())
+            continue
+        example = re.match(r"^-\s+(.*\S)$", line)
+        if example and current:
+            text = example.group(1)
+            # Skip meta instructions and placeholder examples
+            if "[" not in text and not text.lower().endswith("style"):
+                themes.setdefault(current, []).append(text)
+        elif line and not example:
+            current = None
+    return themes
+
+
+def build_grammar(prompt_files=PROMPT_FILES, rng=random):
+    """Builds the grammar, folding the prompt files' examples into their themes."""
+    grammar = Grammar(GRAMMAR, rng)
+    for kind in ("thread", "poll"):
+        for theme, examples in parse_prompt_themes(prompt_files[kind]).items():
+            if theme in grammar.rules:
+                grammar.add(theme, [(1, _literal(example) + " {emojis}") for example in examples])
+    grammar.add("theme", [(1, "{" + theme + "}") for _, theme in THEME_KEYWORDS])
+    examples = parse_prompt_themes(prompt_files["caption"]).get("examples", [])
+    grammar.add("short_caption", [(1, _literal(example)) for example in examples])
+    return grammar
+
+
+_grammar = None
+
+
+def get_grammar():
+    global _grammar
+    if _grammar is None:
+        _grammar = build_grammar()
+    return _grammar
+
+
+def _fit(text, limit):
+    return text if len(text) <= limit else text[:limit].rstrip()
+
+
+def generate_caption(kind="thread", theme=None):
+    """
+    Generates a caption locally.
+
+    Parameters:
+        kind (str): "thread" for text posts, "caption" for image/video captions.
+        theme (str): Optional theme name (catalog tag) to force.
+
+    Returns:
+        str: A caption within the Threads text limit.
+    """
+    grammar = get_grammar()
+    if theme and kind == "thread" and theme in grammar.rules:
+        text = grammar.expand("opener") + grammar.expand(theme)
+    else:
+        text = grammar.expand(kind)
+    return _fit(re.sub(r"[ \t]+", " ", text).strip(), THREADS_TEXT_LIMIT)
+
+
+def generate_poll():
+    """
+    Generates a poll locally.
+
+    Returns:
+        tuple: (question, options dict with option_a..option_d).
+    """
+    grammar = get_grammar()
+    bindings = {}
+    question = grammar.expand("poll_question", bindings)
+    if "pair_a" in bindings:
+        choices = [bindings["pair_a"], bindings["pair_b"]]
+    else:
+        choices = grammar.choose("pair").split("|")
+    if grammar.rng.random() < 0.4:
+        choices.append(grammar.rng.choice(["Both 😏", "Surprise me 😈", "Can't choose 🙈"]))
+    options = {f"option_{letter}": _fit(f"{choice}", POLL_OPTION_LIMIT)
+               for letter, choice in zip("abcd", choices)}
+    return _fit(question.strip(), THREADS_TEXT_LIMIT), options
+
+
+def format_poll(question, options):
+    """Formats a poll as Question:/Option X: lines, which poll_schema.extract_poll also reads."""
+    lines = [f"Question: {question}"]
+    for key, value in options.items():
+        lines.append(f"Option {key[-1].upper()}: {value}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline caption and poll generator")
+    parser.add_argument("kind", choices=["thread", "caption", "poll"])
+    parser.add_argument("--count", type=int, default=5)
+    parser.add_argument("--theme")
+    parser.add_argument("--bench", action="store_true", help="Time 10,000 generations")
+    args = parser.parse_args()
+
+    grammar = get_grammar()
+    root = "poll_question" if args.kind == "poll" else args.kind
+    print(f"≈{grammar.size(root):,} distinct {args.kind} expansions")
+    for _ in range(args.count):
+        if args.kind == "poll":
+            print(format_poll(*generate_poll()), end="\n\n")
+        else:
+            print(generate_caption(args.kind, args.theme), end="\n\n")
+    if args.bench:
+        start = time.perf_counter()
+        for _ in range(10000):
+            generate_poll() if args.kind == "poll" else generate_caption(args.kind)
+        print(f"{(time.perf_counter() - start) / 10000 * 1e6:.1f} µs per generation")
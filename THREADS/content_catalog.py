@@ -0,0 +1,290 @@
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+# Catalogs live next to this file: <name>.jsonl holds one entry per line,
+# <name>.idx is the binary offset index and <name>.uses the usage counters.
+# The .uses files are committed by the workflows so least-used rotation carries across runs.
+CATALOG_DIR = os.environ.get(
+    'THREADS_CONTENT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+)
+
+INDEX_MAGIC = b"TCAT"
+INDEX_VERSION = 1
+# magic, version, reserved, entry count, data mtime_ns, data size, tag vocabulary length
+HEADER = struct.Struct("<4sHHQqQI")
+# byte offset, byte length, tag bitmask
+RECORD = struct.Struct("<QII")
+USAGE = struct.Struct("<I")
+MAX_TAGS = 32
+
+# How many random records a pick samples before falling back to a full scan
+PICK_SAMPLES = 16
+PICK_ATTEMPTS = 512
+
+# Used when the polls catalog is empty or no entry matches the requested tags
+DEFAULT_POLL = ("Would you rather cuddle all night or kiss all night? 🛌💋",
+                {"option_a": "Cuddle 🛌", "option_b": "Kiss 💋"})
+
+
+def _data_path(name, directory):
+    return os.path.join(directory, f"{name}.jsonl")
+
+
+def build_index(name, directory=CATALOG_DIR):
+    """
+    Builds `<name>.idx` from `<name>.jsonl` in a single streaming pass.
+
+    Parameters:
+        name (str): Catalog name, e.g. "polls".
+        directory (str): Directory holding the catalog files.
+
+    Returns:
+        int: Number of indexed entries.
+    """
+    data_path = _data_path(name, directory)
+    index_path = os.path.join(directory, f"{name}.idx")
+    tmp_path = index_path + ".tmp"
+    vocabulary = {}
+    count = 0
+
+    with open(data_path, "rb") as data, open(tmp_path, "wb") as index:
+        # Reserve room for the header; the vocabulary is appended after the records.
+        index.write(b"\0" * HEADER.size)
+        offset = 0
+        for line in data:
+            length = len(line)
+            stripped = line.strip()
+            if stripped:
+                tags = json.loads(stripped).get("tags", [])
+                mask = 0
+                for tag in tags:
+                    if tag not in vocabulary:
+                        if len(vocabulary) == MAX_TAGS:
+                            raise ValueError(f"Catalog {name} uses more than {MAX_TAGS} tags.")
+                        vocabulary[tag] = len(vocabulary)
+                    mask |= 1 << vocabulary[tag]
+                index.write(RECORD.pack(offset, len(line.rstrip(b"\r\n")), mask))
+                count += 1
+            offset += length
+
+        vocab_bytes = json.dumps(list(vocabulary), ensure_ascii=False).encode("utf-8")
+        index.write(vocab_bytes)
+        stat = os.fstat(data.fileno())
+        index.seek(0)
+        index.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, count, stat.st_mtime_ns, stat.st_size, len(vocab_bytes)))
+
+    os.replace(tmp_path, index_path)
+    return count
+
+
+class Catalog:
+    """
+    Random-access view of a JSON-lines content catalog.
+
+    Entries are located through the memory-mapped offset index, so reading entry
+    `i` is one seek and one read no matter how large the catalog grows, and tag
+    filters only touch the 16-byte index records.
+
+    Parameters:
+        name (str): Catalog name, e.g. "polls".
+        directory (str): Directory holding the catalog files.
+    """
+
+    def __init__(self, name, directory=CATALOG_DIR):
+        self.name = name
+        self.data_path = _data_path(name, directory)
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.usage_path = os.path.join(directory, f"{name}.uses")
+
+        if self._index_is_stale():
+            build_index(name, directory)
+
+        self._data = open(self.data_path, "rb")
+        with open(self.index_path, "rb") as index:
+            self._index = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, _, self.count, _, _, vocab_len = HEADER.unpack_from(self._index, 0)
+        vocab_start = HEADER.size + self.count * RECORD.size
+        self.tags = json.loads(self._index[vocab_start:vocab_start + vocab_len].decode("utf-8"))
+        self._tag_bits = {tag: 1 << bit for bit, tag in enumerate(self.tags)}
+        self._usage_file, self._usage = self._open_usage()
+
+    def _index_is_stale(self):
+        if not os.path.exists(self.index_path):
+            return True
+        with open(self.index_path, "rb") as index:
+            header = index.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return True
+        magic, version, _, _, mtime_ns, size, _ = HEADER.unpack(header)
+        stat = os.stat(self.data_path)
+        return (magic != INDEX_MAGIC or version != INDEX_VERSION
+                or mtime_ns != stat.st_mtime_ns or size != stat.st_size)
+
+    def _open_usage(self):
+        # Counters are positional, so appending entries to the catalog keeps existing counts.
+        size = self.count * USAGE.size
+        usage_file = open(self.usage_path, "r+b" if os.path.exists(self.usage_path) else "w+b")
+        if os.fstat(usage_file.fileno()).st_size != size:
+            usage_file.truncate(size)
+        if size == 0:
+            return usage_file, None
+        return usage_file, mmap.mmap(usage_file.fileno(), size)
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, i):
+        return RECORD.unpack_from(self._index, HEADER.size + i * RECORD.size)
+
+    def get(self, i):
+        """Returns entry `i` as a dict."""
+        if not 0 <= i < self.count:
+            raise IndexError(f"{self.name} catalog index out of range: {i}")
+        offset, length, _ = self._record(i)
+        self._data.seek(offset)
+        return json.loads(self._data.read(length))
+
+    def tag_mask(self, tags):
+        """Bitmask for `tags`; unknown tags match nothing."""
+        mask = 0
+        for tag in tags or ():
+            mask |= self._tag_bits.get(tag, 0)
+        return mask
+
+    def usage(self, i):
+        """How many times entry `i` has been picked."""
+        return USAGE.unpack_from(self._usage, i * USAGE.size)[0] if self._usage else 0
+
+    def record_use(self, i):
+        """Increments the usage counter of entry `i`."""
+        if self._usage:
+            USAGE.pack_into(self._usage, i * USAGE.size, self.usage(i) + 1)
+
+    def iter_matching(self, tags=None):
+        """Yields the numbers of entries carrying any of `tags` (all entries when empty)."""
+        mask = self.tag_mask(tags) if tags else None
+        if mask == 0:
+            return
+        view = memoryview(self._index)[HEADER.size:HEADER.size + self.count * RECORD.size]
+        try:
+            for i, (_, _, entry_mask) in enumerate(RECORD.iter_unpack(view)):
+                if mask is None or entry_mask & mask:
+                    yield i
+        finally:
+            view.release()
+
+    def pick(self, tags=None, rng=random):
+        """
+        Picks a rarely used entry, optionally restricted to `tags`, and records its use.
+
+        A handful of random index records are sampled and the least used match
+        wins, which keeps picks O(1) for large catalogs. Very selective filters
+        that sampling keeps missing fall back to one streaming scan.
+
+        Returns:
+            tuple: (entry number, entry dict), or (None, None) when nothing matches.
+        """
+        if not self.count:
+            return None, None
+        mask = self.tag_mask(tags) if tags else None
+        if mask == 0:
+            return None, None
+
+        best, best_usage, seen = None, None, 0
+        for _ in range(PICK_ATTEMPTS):
+            i = rng.randrange(self.count)
+            if mask is not None and not self._record(i)[2] & mask:
+                continue
+            used = self.usage(i)
+            if best is None or used < best_usage:
+                best, best_usage = i, used
+            seen += 1
+            if seen == PICK_SAMPLES:
+                break
+
+        if best is None:
+            matches = 0
+            for i in self.iter_matching(tags):
+                used = self.usage(i)
+                if best is None or used < best_usage:
+                    best, best_usage, matches = i, used, 1
+                elif used == best_usage:
+                    # Reservoir sampling among the least used matches
+                    matches += 1
+                    if rng.randrange(matches) == 0:
+                        best = i
+            if best is None:
+                return None, None
+
+        self.record_use(best)
+        return best, self.get(best)
+
+    def close(self):
+        if self._usage:
+            self._usage.flush()
+            self._usage.close()
+        self._usage_file.close()
+        self._index.close()
+        self._data.close()
+
+
+_open_catalogs = {}
+
+
+def open_catalog(name):
+    """Returns a process-wide Catalog instance for `name`."""
+    if name not in _open_catalogs:
+        _open_catalogs[name] = Catalog(name)
+    return _open_catalogs[name]
+
+
+def random_poll(tags=None):
+    """Returns a fallback poll from the polls catalog as (question, options), or DEFAULT_POLL."""
+    _, entry = open_catalog("polls").pick(tags)
+    if entry is None:
+        return DEFAULT_POLL[0], dict(DEFAULT_POLL[1])
+    return entry["question"], entry["options"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the fallback content catalogs")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="Rebuild the offset index")
+    build_parser.add_argument("name", nargs="?", help="Catalog name (default: all)")
+    stats_parser = subcommands.add_parser("stats", help="Show entry and usage counts")
+    stats_parser.add_argument("name")
+    pick_parser = subcommands.add_parser("pick", help="Pick an entry")
+    pick_parser.add_argument("name")
+    pick_parser.add_argument("--tag", action="append", help="Restrict to entries with this tag")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        names = [args.name] if args.name else sorted(
+            f[:-len(".jsonl")] for f in os.listdir(CATALOG_DIR) if f.endswith(".jsonl")
+        )
+        for name in names:
+            print(f"✅ Indexed {build_index(name)} {name} entries.")
+    elif args.command == "stats":
+        catalog = Catalog(args.name)
+        by_tag = {tag: 0 for tag in catalog.tags}
+        total_uses = 0
+        for i in range(len(catalog)):
+            total_uses += catalog.usage(i)
+        for tag in catalog.tags:
+            by_tag[tag] = sum(1 for _ in catalog.iter_matching([tag]))
+        print(f"{args.name}: {len(catalog)} entries, {total_uses} recorded uses")
+        for tag, count in by_tag.items():
+            print(f"  {tag:<20} {count}")
+        catalog.close()
+    elif args.command == "pick":
+        catalog = Catalog(args.name)
+        i, entry = catalog.pick(args.tag)
+        print(i, json.dumps(entry, ensure_ascii=False))
+        catalog.close()
@@ -0,0 +1,433 @@
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from caption_filter import normalize_caption, normalize_poll
+from caption_grammar import generate_caption, generate_poll
+from content_catalog import CATALOG_DIR
+from llm_client import complete_chat, mark_caption_used
+from origin_prewarm import COUNTER_FILES, load_slots, media_url, read_counter, upcoming_slots
+from poll_schema import POLL_REPAIR_MAX_TOKENS, POLL_RESPONSE_FORMAT, parse_poll
+from prompt_assembler import themed_prompt
+from structured_log import flush, get_logger
+
+log = get_logger("planner")
+
+PROMPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# How far ahead `plan` fills the calendar
+PLANNER_DAYS = int(os.environ.get('PLANNER_DAYS', '7'))
+# Actions crons often start late, so a publisher takes a slot up to this long after its time...
+CALENDAR_LATE_MINUTES = int(os.environ.get('CALENDAR_LATE_MINUTES', '120'))
+# ...and a manually dispatched run one this long before it
+CALENDAR_EARLY_MINUTES = int(os.environ.get('CALENDAR_EARLY_MINUTES', '30'))
+
+# The posting workflows whose cron lines are the slots, and the workflows that advance the media counters
+POST_WORKFLOWS = {
+    "text": "thread_text_scheduler.yml",
+    "poll": "thread_polls_scheduler.yml",
+    "image": "thread_image_scheduler.yml",
+    "video": "thread_video_scheduler.yml",
+}
+COUNTER_WORKFLOWS = {"image": "counter_image_scheduler.yml", "video": "counter_video_scheduler.yml"}
+POST_TYPES = tuple(POST_WORKFLOWS)
+PROMPT_FILES = {"text": "prompt_text.txt", "poll": "prompt_polls.txt",
+                "image": "prompt_image_video.txt", "video": "prompt_image_video.txt"}
+CAPTION_KEYS = {"text": "THREADS_TEXT_CAPTION_KEY", "poll": "THREADS_POLL_CAPTION_KEY",
+                "image": "THREADS_IMAGE_CAPTION_KEY", "video": "THREADS_VIDEO_CAPTION_KEY"}
+# caption_grammar kinds used when the model is off or fails
+LOCAL_KINDS = {"text": "thread", "image": "caption", "video": "caption"}
+STATUSES = ("planned", "claimed", "published", "failed")
+
+# calendar.jsonl holds one slot per line sorted by time and calendar.idx is the binary index.
+# Publishers append "slot_at<TAB>type<TAB>status<TAB>time" lines to calendar.log, the file that is
+# committed: it is append-only and merged with merge=union (.gitattributes), so the text and poll
+# (or image and video) runs that finish together never conflict. calendar.status is the local
+# one-byte-per-slot view of plan plus log, updated in place; like calendar.idx it is rebuilt.
+INDEX_MAGIC = b"TCAL"
+INDEX_VERSION = 1
+# magic, version, reserved, slot count, data mtime_ns, data size
+HEADER = struct.Struct("<4sHHQqQ")
+# slot time (Unix seconds), byte offset, byte length, post type
+RECORD = struct.Struct("<qQIB3x")
+# calendar.status starts with the calendar.log size already applied to it
+STATUS_HEADER = struct.Struct("<Q")
+
+
+def calendar_paths(directory=CATALOG_DIR):
+    base = os.path.join(directory, "calendar")
+    return base + ".jsonl", base + ".idx", base + ".status", base + ".log"
+
+
+def read_status_log(path, offset=0, end=None):
+    """(slot_at, post type, status) per calendar.log line between the byte offsets `offset` and `end`."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as file:
+        file.seek(offset)
+        data = file.read() if end is None else file.read(end - offset)
+    changes = []
+    for line in data.decode("utf-8").splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 3 and fields[1] in POST_TYPES and fields[2] in STATUSES:
+            changes.append((int(fields[0]), fields[1], fields[2]))
+    return changes
+
+
+def _timestamp(moment):
+    return int(moment.timestamp())
+
+
+def build_index(directory=CATALOG_DIR):
+    """
+    Builds calendar.idx from calendar.jsonl in a single streaming pass.
+
+    Returns:
+        int: Number of indexed slots.
+    """
+    data_path, index_path, _, _ = calendar_paths(directory)
+    tmp_path = index_path + ".tmp"
+    count = 0
+    with open(data_path, "rb") as data, open(tmp_path, "wb") as index:
+        index.write(b"\0" * HEADER.size)
+        offset = 0
+        for line in data:
+            if line.strip():
+                entry = json.loads(line)
+                index.write(RECORD.pack(entry["slot_at"], offset, len(line.rstrip(b"\r\n")),
+                                        POST_TYPES.index(entry["type"])))
+                count += 1
+            offset += len(line)
+        stat = os.fstat(data.fileno())
+        index.seek(0)
+        index.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, count, stat.st_mtime_ns, stat.st_size))
+    os.replace(tmp_path, index_path)
+    return count
+
+
+def write_calendar(entries, directory=CATALOG_DIR):
+    """
+    Writes the slots sorted by time, their statuses and a fresh index. The statuses
+    in `entries` already include calendar.log, so the log starts over empty.
+    """
+    entries = sorted(entries, key=lambda entry: (entry["slot_at"], POST_TYPES.index(entry["type"])))
+    data_path, _, status_path, log_path = calendar_paths(directory)
+    os.makedirs(directory, exist_ok=True)
+    with open(data_path + ".tmp", "wb") as data:
+        for entry in entries:
+            data.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+    with open(status_path + ".tmp", "wb") as status:
+        status.write(STATUS_HEADER.pack(0) + bytes(STATUSES.index(entry["status"]) for entry in entries))
+    os.replace(data_path + ".tmp", data_path)
+    os.replace(status_path + ".tmp", status_path)
+    open(log_path, "wb").close()
+    return build_index(directory)
+
+
+class Calendar:
+    """
+    Random-access view of the content calendar.
+
+    Slots are sorted by time, so finding the slot a publisher should take is a
+    binary search over the memory-mapped index and one read of its JSON line.
+    Statuses live in a separate byte-per-slot file, so marking a slot doesn't
+    touch calendar.jsonl or invalidate the index; each change is also appended
+    to calendar.log, and log lines pulled from other runs are applied on open.
+
+    Parameters:
+        directory (str): Directory holding the calendar files.
+    """
+
+    def __init__(self, directory=CATALOG_DIR):
+        self.directory = directory
+        self.data_path, self.index_path, self.status_path, self.log_path = calendar_paths(directory)
+        replanned = self._index_is_stale()
+        if replanned:
+            build_index(directory)
+
+        self._data = open(self.data_path, "rb")
+        with open(self.index_path, "rb") as index:
+            self._index = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = HEADER.unpack_from(self._index, 0)[3]
+        self._status_file, self._status = self._open_status(replanned)
+
+    def _index_is_stale(self):
+        if not os.path.exists(self.index_path):
+            return True
+        with open(self.index_path, "rb") as index:
+            header = index.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return True
+        magic, version, _, _, mtime_ns, size = HEADER.unpack(header)
+        stat = os.stat(self.data_path)
+        return (magic != INDEX_MAGIC or version != INDEX_VERSION
+                or mtime_ns != stat.st_mtime_ns or size != stat.st_size)
+
+    def _open_status(self, replanned):
+        status_file = open(self.status_path, "r+b" if os.path.exists(self.status_path) else "w+b")
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        applied = None
+        if os.fstat(status_file.fileno()).st_size == STATUS_HEADER.size + self.count and not replanned:
+            applied = STATUS_HEADER.unpack(status_file.read(STATUS_HEADER.size))[0]
+        if applied is None or applied > log_size:
+            # Missing, from another plan or the log started over: the statuses written with the slots, then the log
+            status_file.seek(0)
+            status_file.truncate()
+            status_file.write(STATUS_HEADER.pack(0))
+            status_file.write(bytes(STATUSES.index(self._entry(i)["status"]) for i in range(self.count)))
+            status_file.flush()
+            applied = 0
+        self._status = mmap.mmap(status_file.fileno(), STATUS_HEADER.size + self.count)
+        for slot_at, post_type, status in read_status_log(self.log_path, applied, log_size):
+            i = self.find(post_type, slot_at, slot_at, statuses=STATUSES)
+            if i is not None:
+                self._status[STATUS_HEADER.size + i] = STATUSES.index(status)
+        STATUS_HEADER.pack_into(self._status, 0, log_size)
+        return status_file, self._status
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _record(self, i):
+        return RECORD.unpack_from(self._index, HEADER.size + i * RECORD.size)
+
+    def slot_at(self, i):
+        return self._record(i)[0]
+
+    def _entry(self, i):
+        _, offset, length, _ = self._record(i)
+        self._data.seek(offset)
+        return json.loads(self._data.read(length))
+
+    def get(self, i):
+        """Returns slot `i` as a dict, with its current status and position."""
+        if not 0 <= i < self.count:
+            raise IndexError(f"calendar index out of range: {i}")
+        entry = self._entry(i)
+        entry["status"] = self.status(i)
+        entry["index"] = i
+        return entry
+
+    def status(self, i):
+        return STATUSES[self._status[STATUS_HEADER.size + i]]
+
+    def set_status(self, i, status):
+        self._status[STATUS_HEADER.size + i] = STATUSES.index(status)
+        line = f"{self.slot_at(i)}\t{POST_TYPES[self._record(i)[3]]}\t{status}\t{time.time():.0f}\n".encode("utf-8")
+        with open(self.log_path, "ab") as log_file:
+            log_file.write(line)
+            end = log_file.tell()
+        # Only skip the line on the next open when nothing else was appended before it
+        if STATUS_HEADER.unpack_from(self._status, 0)[0] == end - len(line):
+            STATUS_HEADER.pack_into(self._status, 0, end)
+
+    def find(self, post_type, start, end, statuses=("planned",)):
+        """
+        The first slot of `post_type` between the Unix times `start` and `end` whose
+        status is in `statuses`, or None.
+        """
+        code = POST_TYPES.index(post_type)
+        i = bisect.bisect_left(range(self.count), start, key=self.slot_at)
+        while i < self.count:
+            slot_at, _, _, slot_type = self._record(i)
+            if slot_at > end:
+                return None
+            if slot_type == code and self.status(i) in statuses:
+                return i
+            i += 1
+        return None
+
+    def close(self):
+        self._status.flush()
+        self._status.close()
+        self._status_file.close()
+        self._index.close()
+        self._data.close()
+
+
+def next_slot(post_type, now=None, directory=CATALOG_DIR):
+    """
+    The planned slot of `post_type` due around `now`, or None when there is no
+    calendar or nothing planned in the window.
+    """
+    if not os.path.exists(calendar_paths(directory)[0]):
+        return None
+    now = now or datetime.now(timezone.utc)
+    with Calendar(directory) as calendar:
+        i = calendar.find(post_type, _timestamp(now - timedelta(minutes=CALENDAR_LATE_MINUTES)),
+                          _timestamp(now + timedelta(minutes=CALENDAR_EARLY_MINUTES)))
+        return None if i is None else calendar.get(i)
+
+
+def claim_slot(post_type, now=None, directory=CATALOG_DIR):
+    """
+    The slot `post_type` should publish now, marked claimed so a second run in
+    the same window doesn't publish it again.
+
+    Returns:
+        dict: The slot (caption, counter, options for polls, ...), or None to
+        generate the post at post time as before.
+    """
+    slot = next_slot(post_type, now, directory)
+    if slot is None:
+        log.info("No planned slot, generating at post time", post_type=post_type)
+        return None
+    with Calendar(directory) as calendar:
+        calendar.set_status(slot["index"], "claimed")
+    log.info("Using planned slot", post_type=post_type, slot=slot["slot"], counter=slot.get("counter"))
+    return slot
+
+
+def finish_slot(slot, post_id, directory=CATALOG_DIR):
+    """Marks a claimed slot published or failed."""
+    if slot is None or not os.path.exists(calendar_paths(directory)[0]):
+        return
+    with Calendar(directory) as calendar:
+        # Found again by time and type in case the calendar was replanned meanwhile
+        i = calendar.find(slot["type"], slot["slot_at"], slot["slot_at"], statuses=STATUSES)
+        if i is not None:
+            calendar.set_status(i, "published" if post_id else "failed")
+
+
+def _model_reply(prompt, api_key, **options):
+    reply = complete_chat(prompt, api_key, **options)
+    # The calendar owns this reply now; the cache must not hand it to another slot
+    mark_caption_used(reply)
+    return reply
+
+
+def plan_caption(post_type, user_prompt, use_model=True):
+    """
+    Pre-generates the caption of one slot with the themed prompt, or locally with
+    caption_grammar when the model is off, has no key or fails.
+
+    Returns:
+        dict: caption (normalized; the question for polls), options (polls only),
+        generated (the raw model reply), theme and source ("model" or "local").
+    """
+    api_key = os.environ.get(CAPTION_KEYS[post_type]) if use_model else None
+    if api_key:
+        try:
+            with themed_prompt(user_prompt, post_type) as prompt:
+                options = {"response_format": POLL_RESPONSE_FORMAT} if post_type == "poll" else {}
+                reply = _model_reply(prompt.text, api_key, **options)
+            if post_type == "poll":
+                question, poll_options = parse_poll(reply, lambda repair: _model_reply(
+                    repair, api_key, max_tokens=POLL_REPAIR_MAX_TOKENS, response_format=POLL_RESPONSE_FORMAT))
+                return {"caption": question, "options": poll_options, "generated": reply,
+                        "theme": prompt.theme, "source": "model"}
+            return {"caption": normalize_caption(reply), "generated": reply, "theme": prompt.theme, "source": "model"}
+        except Exception as e:
+            log.warning("Model caption failed, generating locally", post_type=post_type, error=str(e))
+    if post_type == "poll":
+        question, poll_options = normalize_poll(*generate_poll())
+        return {"caption": question, "options": poll_options, "generated": question, "theme": None, "source": "local"}
+    caption = normalize_caption(generate_caption(LOCAL_KINDS[post_type]))
+    return {"caption": caption, "generated": caption, "theme": None, "source": "local"}
+
+
+def read_prompts(post_types):
+    """post type -> the text of its prompt file."""
+    prompts = {}
+    for post_type in post_types:
+        with open(os.path.join(PROMPTS_DIR, PROMPT_FILES[post_type]), encoding="utf-8") as file:
+            prompts[post_type] = file.read()
+    return prompts
+
+
+def load_calendar(directory=CATALOG_DIR):
+    """Every slot in the calendar, oldest first."""
+    if not os.path.exists(calendar_paths(directory)[0]):
+        return []
+    with Calendar(directory) as calendar:
+        return [calendar.get(i) for i in range(len(calendar))]
+
+
+def plan(days=PLANNER_DAYS, post_types=POST_TYPES, now=None, use_model=True, directory=CATALOG_DIR):
+    """
+    Fills the calendar for the next `days` days.
+
+    Slot times come from the posting workflows' cron lines. Image and video slots
+    get the media counter they will see: the current counter file plus the counter
+    workflow runs before the slot. Slots already planned keep their caption and
+    status; slots older than the late window are dropped.
+
+    Returns:
+        tuple: (slots planned now, slots in the calendar)
+    """
+    now = now or datetime.now(timezone.utc)
+    minutes = days * 24 * 60
+    cutoff = _timestamp(now - timedelta(minutes=CALENDAR_LATE_MINUTES))
+    entries = {(entry["slot_at"], entry["type"]): entry for entry in load_calendar(directory)
+               if entry["slot_at"] >= cutoff}
+    for entry in entries.values():
+        del entry["index"]
+
+    counter_types = [kind for kind in COUNTER_WORKFLOWS if kind in post_types]
+    bumps = {kind: [] for kind in counter_types}
+    for moment, kind in upcoming_slots(load_slots(counter_types, workflows=COUNTER_WORKFLOWS), now, minutes):
+        bumps[kind].append(moment)
+    counters = {kind: read_counter(COUNTER_FILES[kind]) for kind in counter_types}
+    prompts = read_prompts(post_types)
+
+    planned = 0
+    for moment, post_type in upcoming_slots(load_slots(post_types, workflows=POST_WORKFLOWS), now, minutes):
+        key = (_timestamp(moment), post_type)
+        if key in entries:
+            continue
+        entry = {"slot": moment.isoformat(), "slot_at": key[0], "type": post_type, "status": "planned"}
+        if post_type in counters:
+            counter = counters[post_type] + bisect.bisect_right(bumps[post_type], moment)
+            entry.update(counter=counter, media=media_url(post_type, counter))
+        entry.update(plan_caption(post_type, prompts[post_type], use_model))
+        entries[key] = entry
+        planned += 1
+        log.info("Slot planned", slot=entry["slot"], post_type=post_type, source=entry["source"], theme=entry["theme"])
+    write_calendar(entries.values(), directory)
+    return planned, len(entries)
+
+
+def parse_time(value):
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Plan posts ahead: slots, media counters and captions")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = subcommands.add_parser("plan", help="Fill the calendar for the next days")
+    plan_parser.add_argument("--days", type=int, default=PLANNER_DAYS)
+    plan_parser.add_argument("--types", nargs="+", choices=POST_TYPES, default=list(POST_TYPES))
+    plan_parser.add_argument("--local", action="store_true", help="Generate captions without the model")
+    show_parser = subcommands.add_parser("show", help="List the planned slots")
+    show_parser.add_argument("--all", action="store_true", help="Include published and failed slots")
+    next_parser = subcommands.add_parser("next", help="Show the slot a publisher would take")
+    next_parser.add_argument("post_type", choices=POST_TYPES)
+    next_parser.add_argument("--at", type=parse_time, help="ISO time to look from (default: now)")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        planned, total = plan(args.days, tuple(args.types), use_model=not args.local)
+        flush()
+        print(f"✅ Planned {planned} new slots, {total} in the calendar")
+    elif args.command == "show":
+        for entry in load_calendar():
+            if args.all or entry["status"] in ("planned", "claimed"):
+                counter = entry.get("counter", "-")
+                print(f"{entry['slot'][:16]}  {entry['type']:<6}{entry['status']:<10}{counter!s:>6}  "
+                      f"{entry['caption'][:60]!r}")
+    else:
+        slot = next_slot(args.post_type, args.at)
+        print(json.dumps(slot, ensure_ascii=False, indent=2) if slot else f"No {args.post_type} slot due.")
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+import profiling
+import run_history
+from instagram_client import INSTAGRAM_CAROUSEL_MAX, INSTAGRAM_GRAPH_URL, InstagramClient, instagram_account, jpeg_url
+from structured_log import flush, get_logger
+from threads_client import Account, ContainerFailed, ThreadsClient, probe_media, wait_until_ready
+
+log = get_logger("crosspost")
+
+CROSSPOST_POLL_INTERVAL = float(os.environ.get('CROSSPOST_POLL_INTERVAL', '5'))
+# Reels can take several minutes to process
+CROSSPOST_PROCESSING_TIMEOUT = float(os.environ.get('CROSSPOST_PROCESSING_TIMEOUT', '600'))
+# A container that ends in ERROR or EXPIRED is created again, up to this many containers per platform
+CROSSPOST_ATTEMPTS = int(os.environ.get('CROSSPOST_ATTEMPTS', '2'))
+KINDS = ("image", "video")
+
+
+def _phase(run, name):
+    return run.phase(name) if run is not None else nullcontext()
+
+
+async def create_post_container(client, account, kind, text, media_urls):
+    """Video, single image or carousel container; carousel items are created concurrently."""
+    if kind == "video":
+        return await client.create_container(account, "VIDEO", text=text, video_url=media_urls[0])
+    if len(media_urls) == 1:
+        return await client.create_container(account, "IMAGE", text=text, image_url=media_urls[0])
+    children = await asyncio.gather(*(
+        client.create_container(account, "IMAGE", image_url=url, is_carousel_item=True) for url in media_urls
+    ))
+    return await client.create_container(account, "CAROUSEL", text=text, children=list(children))
+
+
+async def publish_to(platform, client, account, kind, text, media_urls, run=None, interval=CROSSPOST_POLL_INTERVAL,
+                     timeout=CROSSPOST_PROCESSING_TIMEOUT, attempts=CROSSPOST_ATTEMPTS):
+    """
+    Creates a container, polls it until it is ready and publishes it.
+
+    Request-level retries (429, 5xx, connection errors) happen inside the client;
+    a container that fails processing is replaced by a new one. Publish calls are
+    never repeated, so a post can't go out twice.
+
+    Parameters:
+        platform (str): Label for logs, "threads" or "instagram".
+        run (RunRecorder): Receives the create_container/processing_wait/publish phases.
+
+    Returns:
+        str: The published post ID.
+
+    Raises:
+        GraphAPIError: When a call fails after retries or every container failed.
+    """
+    platform_log = log.bind(platform=platform)
+    for attempt in range(1, attempts + 1):
+        with _phase(run, "create_container"):
+            container_id = await create_post_container(client, account, kind, text, media_urls)
+        platform_log.info("Container created", container_id=container_id, attempt=attempt)
+        try:
+            with _phase(run, "processing_wait"):
+                await wait_until_ready(client, account, container_id, interval, timeout)
+        except ContainerFailed as e:
+            if attempt == attempts:
+                raise
+            if run is not None:
+                run.retries += 1
+            platform_log.warning("Container failed, creating a new one", container_id=container_id, error=str(e))
+            continue
+        with _phase(run, "publish"):
+            post_id = await client.publish(account, container_id)
+        platform_log.info("Post published", post_id=post_id)
+        return post_id
+
+
+async def instagram_media(client, kind, media_urls):
+    """
+    The day's media as Instagram takes it: the JPEG variant of each image (probed,
+    since only image_preprocess output has one) and at most 10 carousel items.
+    """
+    if kind == "video":
+        return media_urls[:1]
+    urls = [jpeg_url(url) for url in media_urls[:INSTAGRAM_CAROUSEL_MAX]]
+    if urls == media_urls[:INSTAGRAM_CAROUSEL_MAX]:
+        return urls
+    return await probe_media(client, urls)
+
+
+async def crosspost(kind, text, media_urls, threads_client, threads_account, instagram_client=None, ig_account=None):
+    """
+    Publishes one caption and one set of media to Threads and Instagram concurrently.
+
+    Each platform has its own client, so its own connection pool and retries, and
+    one failing platform doesn't stop the other. Threads phases go to the current
+    run; Instagram is recorded as its own `instagram_{kind}` run.
+
+    Returns:
+        dict: platform -> {"post_id", "error", "seconds"}
+    """
+    async def run_platform(platform, client, account, run, urls=None, own_run=False):
+        start = time.perf_counter()
+        post_id, error = None, None
+        try:
+            if urls is None:
+                with _phase(run, "media_probe"):
+                    urls = await instagram_media(client, kind, media_urls)
+                if not urls:
+                    raise ValueError("No JPEG variant of the day's images; run image_preprocess.py on the media")
+            post_id = await publish_to(platform, client, account, kind, text, urls, run)
+        except Exception as e:
+            error = e
+            log.exception("Cross-post failed", platform=platform, error=f"{type(e).__name__}: {e}")
+        if own_run:
+            run.post_id = post_id
+            run.finish(error)
+        return platform, {"post_id": post_id, "error": str(error) if error else None,
+                          "seconds": time.perf_counter() - start}
+
+    platforms = [run_platform("threads", threads_client, threads_account, run_history.current_run, media_urls)]
+    if instagram_client is not None and ig_account is not None:
+        run = run_history.RunRecorder(f"instagram_{kind}")
+        platforms.append(run_platform("instagram", instagram_client, ig_account, run, own_run=True))
+    return dict(await asyncio.gather(*platforms))
+
+
+async def run_crosspost(kind, text, media_urls, threads_base_url, threads_account,
+                        instagram_base_url=INSTAGRAM_GRAPH_URL, ig_account=None):
+    """`crosspost` with clients that are opened and closed around it."""
+    threads_client = ThreadsClient(threads_base_url, max_connections=16)
+    instagram_client = None
+    if ig_account is not None:
+        instagram_client = InstagramClient(instagram_base_url, max_connections=16)
+    else:
+        log.warning("INSTAGRAM_USER_ID / INSTAGRAM_ACCESS_TOKEN not set, posting to Threads only")
+    try:
+        return await crosspost(kind, text, media_urls, threads_client, threads_account, instagram_client, ig_account)
+    finally:
+        await threads_client.aclose()
+        if instagram_client is not None:
+            await instagram_client.aclose()
+
+
+def crosspost_from_env(kind, text, media_urls):
+    """Cross-posts with the Threads and Instagram credentials from the environment."""
+    threads_account = Account(os.environ['THREADS_USER_ID'], os.environ['THREADS_ACCESS_TOKEN'])
+    return asyncio.run(run_crosspost(kind, text, media_urls, f"https://{os.environ['THREADS_BASE_URL']}",
+                                     threads_account, ig_account=instagram_account()))
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Publish one caption and media set to Threads and Instagram")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("media_urls", nargs="*", help="Image URLs (several make a carousel) or one video URL")
+    parser.add_argument("--text", required=True, help="Caption for both platforms")
+    parser.add_argument("--fake-api", action="store_true", help="Post to a local fake Graph API serving both platforms")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write cProfile and tracemalloc artifacts next to the run history")
+    args = parser.parse_args()
+
+    if not args.media_urls and not args.fake_api:
+        parser.error("media_urls are required without --fake-api")
+
+    server = None
+    try:
+        with (profiling.profiled(f"crosspost_{args.kind}", args.profile),
+              run_history.recorded_run(f"crosspost_{args.kind}") as run):
+            if args.fake_api:
+                from load_test import start_fake_api
+                server, base_url = start_fake_api({"sigma": 0.2, "processing_seconds": 2.0})
+                media_urls = args.media_urls or (
+                    [f"{base_url}/media/Video_1.mp4"] if args.kind == "video"
+                    else [f"{base_url}/media/1_{index}.png" for index in range(1, 4)]
+                )
+                results = asyncio.run(run_crosspost(
+                    args.kind, args.text, media_urls, base_url, Account("1000000", "fake-token"),
+                    base_url, Account("2000000", "fake-ig-token", name="instagram:2000000")
+                ))
+            else:
+                results = crosspost_from_env(args.kind, args.text, args.media_urls)
+            run.post_id = results["threads"]["post_id"]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+    flush()
+    for platform, result in results.items():
+        if result["post_id"]:
+            print(f"✅ {platform}: {result['post_id']} in {result['seconds']:.2f}s")
+        else:
+            print(f"❌ {platform}: {result['error']} after {result['seconds']:.2f}s")
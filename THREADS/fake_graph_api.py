@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import math
+import random
+import re
+import sys
+import time
+import urllib.parse
+
+from mini_http import Request, Response, json_response, serve
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+# Median latency per endpoint in milliseconds, roughly what graph.threads.net shows from CI runners
+DEFAULT_LATENCY_MS = {"debug_token": 150, "create": 300, "publish": 450, "media": 40, "read": 120, "batch": 60}
+
+ROUTE = re.compile(r"^/(?P<version>v[\d.]+)/(?:(?P<debug>debug_token)|(?P<user>[^/]+)/(?P<edge>threads|threads_publish|threads_publishing_limit|media|media_publish))$")
+OBJECT_ROUTE = re.compile(r"^/(?P<version>v[\d.]+)/(?P<object>\d+)(?:/(?P<edge>insights|manage_reply))?$")
+MEDIA_NAME = re.compile(r"_(\d+)\.\w+$")
+CREATE_EDGES = ("threads", "media")
+# Containers of these types stay IN_PROGRESS for `processing_seconds`
+VIDEO_TYPES = ("VIDEO", "REELS")
+# Container media_type -> media_type of the published post in /{user}/threads listings
+POST_MEDIA_TYPES = {"TEXT": "TEXT_POST", "CAROUSEL": "CAROUSEL_ALBUM", "REELS": "VIDEO"}
+# Publishing quota per account and rolling window, as threads_publishing_limit reports it
+QUOTA_DURATION = 86400
+BATCH_MAX_SIZE = 50
+
+
+def _graph_error(status, message, code):
+    return json_response(status, {"error": {"message": message, "type": "OAuthException", "code": code}})
+
+
+class FakeGraphAPI:
+    """
+    Local stand-in for the Threads Graph API used by load tests.
+
+    Implements debug_token, container creation (including reply_to_id, which must name
+    an already published post), publishing, container status and insights reads,
+    hiding replies, media HEAD probes and Graph batch requests (POST / with a `batch` form field).
+    The Instagram content publishing calls (/{user}/media, /{user}/media_publish and
+    status_code reads) are served too, including Instagram's JPEG-only rule for photos.
+    Video and Reels containers stay IN_PROGRESS for `processing_seconds` and can't be
+    published before that. GET /{user}/threads (and /{user}/media) lists the account's posts and
+    /{user}/threads_publishing_limit reports its use of `publish_quota`, which
+    publishing enforces.
+    Every call waits for a log-normally distributed latency and fails with a 429
+    (with Retry-After) or a 5xx at the configured rates. Batched operations run
+    concurrently, so a batch costs one round trip plus its slowest operation.
+
+    Parameters:
+        latency_scale (float): Multiplier applied to DEFAULT_LATENCY_MS.
+        sigma (float): Log-normal shape; 0 gives constant latency.
+        rate_429 (float): Fraction of calls answered with 429.
+        rate_5xx (float): Fraction of calls answered with 500/502/503.
+        retry_after (float): Retry-After seconds sent with 429s.
+        media_per_day (int): `{counter}_{idx}` media with idx above this return 404.
+        seed (int): Random seed for reproducible runs.
+        batch (bool): False answers batch requests with 400, as a host without batch support would.
+        processing_seconds (float): How long video containers take to process.
+        publish_quota (int): Posts an account may publish per 24 hours.
+        rate_lost_publish (float): Fraction of publish calls that post but answer 502,
+            as when the response is lost on the way back.
+    """
+
+    def __init__(self, latency_scale=1.0, sigma=0.5, rate_429=0.0, rate_5xx=0.0,
+                 retry_after=1.0, media_per_day=3, seed=None, batch=True, processing_seconds=0.0,
+                 publish_quota=250, rate_lost_publish=0.0):
+        self.latency_ms = {name: value * latency_scale for name, value in DEFAULT_LATENCY_MS.items()}
+        self.sigma = sigma
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.media_per_day = media_per_day
+        self.random = random.Random(seed)
+        self.ids = itertools.count(17_840_000_000_000_000)
+        self.containers = {}
+        self.ready_at = {}
+        self.processing_seconds = processing_seconds
+        self.publish_quota = publish_quota
+        self.rate_lost_publish = rate_lost_publish
+        self.container_types = {}
+        # container/post ID -> poll options, for TEXT containers created with a poll_attachment
+        self.container_polls = {}
+        self.post_polls = {}
+        # container/post ID -> text (Threads) or caption (Instagram)
+        self.container_texts = {}
+        self.post_texts = {}
+        # post ID -> (user ID, published at, media_type)
+        self.posts = {}
+        # user ID -> publish times inside the quota window, oldest first
+        self.publish_times = collections.defaultdict(collections.deque)
+        self.batch = batch
+        self.stats = {"requests": 0, "containers": 0, "published": 0, "429": 0, "5xx": 0,
+                      "batches": 0, "batched_operations": 0, "hidden_replies": 0, "in_flight": 0, "max_in_flight": 0}
+
+    async def _delay(self, endpoint):
+        median = self.latency_ms[endpoint]
+        if median <= 0:
+            return
+        seconds = median / 1000
+        if self.sigma:
+            seconds = self.random.lognormvariate(math.log(seconds), self.sigma)
+        await asyncio.sleep(seconds)
+
+    def _injected_error(self):
+        roll = self.random.random()
+        if roll < self.rate_429:
+            self.stats["429"] += 1
+            response = _graph_error(429, "Application request limit reached", 4)
+            response.headers["Retry-After"] = f"{self.retry_after:g}"
+            return response
+        if roll < self.rate_429 + self.rate_5xx:
+            self.stats["5xx"] += 1
+            return _graph_error(self.random.choice((500, 502, 503)), "An unexpected error has occurred.", 2)
+        return None
+
+    async def handle(self, request):
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            return await self._route(request)
+        finally:
+            self.stats["in_flight"] -= 1
+
+    async def _route(self, request):
+        if request.path == "/__stats":
+            return json_response(200, {**self.stats, "pending_containers": len(self.containers)})
+        if request.path.startswith("/media/"):
+            await self._delay("media")
+            match = MEDIA_NAME.search(request.path)
+            found = match is None or int(match.group(1)) <= self.media_per_day
+            return Response(200 if found else 404, b"", {"Content-Type": "image/png"}, send_body=request.method != "HEAD")
+
+        if request.path == "/" and request.method == "POST":
+            return await self._batch(request)
+
+        match = ROUTE.match(request.path)
+        if match is None:
+            return await self._object(request)
+        query = request.query
+        if not query.get("access_token"):
+            return _graph_error(400, "An access token is required to request this resource.", 104)
+
+        if match.group("debug"):
+            await self._delay("debug_token")
+            return json_response(200, {"data": {"is_valid": True, "expires_at": int(time.time()) + 60 * 86400}})
+
+        edge = match.group("edge")
+        reading = request.method == "GET"
+        await self._delay("read" if reading else "create" if edge in CREATE_EDGES else "publish")
+        error = self._injected_error()
+        if error is not None:
+            return error
+
+        user_id = match.group("user")
+        if reading:
+            return self._user_read(user_id, edge, query)
+        if edge in CREATE_EDGES:
+            error = self._invalid_threads_container(query) if edge == "threads" else self._invalid_media_container(query)
+            if error is not None:
+                return error
+            container_id = str(next(self.ids))
+            self.containers[container_id] = user_id
+            self.container_types[container_id] = query.get("media_type", "IMAGE")
+            if query.get("text") or query.get("caption"):
+                self.container_texts[container_id] = query.get("text") or query.get("caption")
+            if query.get("poll_attachment"):
+                self.container_polls[container_id] = json.loads(query["poll_attachment"])
+            if query.get("media_type") in VIDEO_TYPES:
+                self.ready_at[container_id] = time.monotonic() + self.processing_seconds
+            self.stats["containers"] += 1
+            return json_response(200, {"id": container_id})
+
+        creation_id = query.get("creation_id")
+        if self.containers.get(creation_id) != user_id:
+            return _graph_error(400, "Invalid creation_id", 100)
+        if self._status(creation_id) != "FINISHED":
+            return _graph_error(400, "Media ID is not available", 9007)
+        if self._quota_usage(user_id) >= self.publish_quota:
+            return _graph_error(400, "The user has reached the publishing limit", 4)
+        del self.containers[creation_id]
+        self.ready_at.pop(creation_id, None)
+        media_type = self.container_types.pop(creation_id)
+        self.stats["published"] += 1
+        post_id = str(next(self.ids))
+        published_at = time.time()
+        self.posts[post_id] = (user_id, published_at, POST_MEDIA_TYPES.get(media_type, media_type))
+        self.publish_times[user_id].append(published_at)
+        if creation_id in self.container_polls:
+            self.post_polls[post_id] = self.container_polls.pop(creation_id)
+        if creation_id in self.container_texts:
+            self.post_texts[post_id] = self.container_texts.pop(creation_id)
+        if self.random.random() < self.rate_lost_publish:
+            self.stats["5xx"] += 1
+            return _graph_error(502, "An unexpected error has occurred.", 2)
+        return json_response(200, {"id": post_id})
+
+    def _quota_usage(self, user_id):
+        since = time.time() - QUOTA_DURATION
+        times = self.publish_times[user_id]
+        while times and times[0] < since:
+            times.popleft()
+        return len(times)
+
+    def _user_read(self, user_id, edge, query):
+        if edge == "threads_publishing_limit":
+            return json_response(200, {"data": [{
+                "quota_usage": self._quota_usage(user_id),
+                "config": {"quota_total": self.publish_quota, "quota_duration": QUOTA_DURATION},
+            }]})
+        if edge not in CREATE_EDGES:
+            return _graph_error(400, f"Unsupported get request on {edge}", 100)
+        since = float(query.get("since", 0))
+        posts = sorted(((published_at, post_id, media_type) for post_id, (owner, published_at, media_type)
+                        in self.posts.items() if owner == user_id and published_at >= since), reverse=True)
+        start = int(query.get("after", 0))
+        end = start + int(query.get("limit", 25))
+        data = [{"id": post_id, "media_type": media_type,
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime(published_at))}
+                for published_at, post_id, media_type in posts[start:end]]
+        fields = query.get("fields", "").split(",")
+        for post in data:
+            if "poll_attachment" in fields and post["id"] in self.post_polls:
+                post["poll_attachment"] = self.post_polls[post["id"]]
+            for field in ("text", "caption"):
+                if field in fields and post["id"] in self.post_texts:
+                    post[field] = self.post_texts[post["id"]]
+        paging = {"cursors": {"before": str(start), "after": str(end)}}
+        if end < len(posts):
+            paging["next"] = f"/{user_id}/threads?after={end}"
+        return json_response(200, {"data": data, "paging": paging})
+
+    def _invalid_threads_container(self, query):
+        if not query.get("media_type"):
+            return _graph_error(400, "media_type is required", 100)
+        if query.get("reply_to_id") and query["reply_to_id"] not in self.posts:
+            return _graph_error(400, "reply_to_id does not refer to a published post", 100)
+        return None
+
+    def _invalid_media_container(self, query):
+        media_type = query.get("media_type")
+        if media_type == "CAROUSEL":
+            return None if query.get("children") else _graph_error(400, "children is required for carousels", 100)
+        if media_type == "REELS":
+            return None if query.get("video_url") else _graph_error(400, "video_url is required for Reels", 100)
+        image_url = query.get("image_url")
+        if not image_url:
+            return _graph_error(400, "image_url is required", 100)
+        if not image_url.lower().endswith((".jpg", ".jpeg")):
+            return _graph_error(400, "Only JPEG images are supported", 9004)
+        return None
+
+    def _status(self, container_id):
+        return "IN_PROGRESS" if time.monotonic() < self.ready_at.get(container_id, 0) else "FINISHED"
+
+    async def _object(self, request):
+        match = OBJECT_ROUTE.match(request.path)
+        edge = match and match.group("edge")
+        if match is None or request.method != ("POST" if edge == "manage_reply" else "GET"):
+            return _graph_error(404, f"Unknown path {request.path}", 803)
+        if not request.query.get("access_token"):
+            return _graph_error(400, "An access token is required to request this resource.", 104)
+        await self._delay("read")
+        error = self._injected_error()
+        if error is not None:
+            return error
+
+        object_id = match.group("object")
+        if edge == "manage_reply":
+            # Replies come from other users, so any ID is accepted
+            if request.query.get("hide") == "true":
+                self.stats["hidden_replies"] += 1
+            return json_response(200, {"success": True})
+        if edge == "insights":
+            if object_id not in self.posts:
+                return _graph_error(400, "Insights are only available for published posts", 100)
+            metrics = request.query.get("metric", "views").split(",")
+            data = [{"name": name, "period": "lifetime", "values": [{"value": self.random.randint(0, 5000)}]} for name in metrics]
+            return json_response(200, {"data": data})
+        # Instagram asks for status_code, Threads for status
+        field = "status_code" if "status_code" in request.query.get("fields", "") else "status"
+        if object_id in self.containers:
+            return json_response(200, {"id": object_id, field: self._status(object_id)})
+        if object_id in self.posts:
+            return json_response(200, {"id": object_id, field: "PUBLISHED"})
+        return _graph_error(400, f"Object with ID '{object_id}' does not exist", 100)
+
+    async def _batch(self, request):
+        if not self.batch:
+            return _graph_error(400, "Unsupported post request.", 100)
+        form = dict(urllib.parse.parse_qsl(request.body.decode("utf-8")))
+        try:
+            operations = json.loads(form["batch"])
+        except (KeyError, ValueError):
+            return _graph_error(400, "The batch parameter is required and must be a JSON array", 100)
+        if not isinstance(operations, list) or not 0 < len(operations) <= BATCH_MAX_SIZE:
+            return _graph_error(400, f"A batch holds 1 to {BATCH_MAX_SIZE} operations", 100)
+        await self._delay("batch")
+        self.stats["batches"] += 1
+        self.stats["batched_operations"] += len(operations)
+
+        async def run(operation):
+            target = "/" + operation.get("relative_url", "").lstrip("/")
+            if operation.get("body"):
+                target += ("&" if "?" in target else "?") + operation["body"]
+            sub_request = Request(operation.get("method", "GET").upper(), target, {}, b"", True)
+            if "access_token" not in sub_request.query and form.get("access_token"):
+                sub_request.query["access_token"] = form["access_token"]
+            response = await self._route(sub_request)
+            headers = [{"name": name, "value": value} for name, value in response.headers.items()]
+            return {"code": response.status, "headers": headers, "body": response.body.decode("utf-8")}
+
+        return json_response(200, await asyncio.gather(*(run(operation) for operation in operations)))
+
+
+async def run_server(api, host="127.0.0.1", port=8787):
+    server = await serve(api.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def run_in_process(host, port, options):
+    """Process entry point; `options` are FakeGraphAPI keyword arguments."""
+    asyncio.run(run_server(FakeGraphAPI(**options), host, port))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Threads Graph API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for the default latencies")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Log-normal latency spread")
+    parser.add_argument("--rate-429", type=float, default=0.02)
+    parser.add_argument("--rate-5xx", type=float, default=0.01)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--no-batch", action="store_true", help="Reject batch requests like a host without batch support")
+    parser.add_argument("--processing-seconds", type=float, default=0.0, help="Time video containers stay IN_PROGRESS")
+    parser.add_argument("--publish-quota", type=int, default=250, help="Posts per account per 24 hours")
+    parser.add_argument("--rate-lost-publish", type=float, default=0.0, help="Publishes that post but answer 502")
+    args = parser.parse_args()
+
+    api = FakeGraphAPI(args.latency_scale, args.sigma, args.rate_429, args.rate_5xx, args.retry_after,
+                       seed=args.seed, batch=not args.no_batch, processing_seconds=args.processing_seconds,
+                       publish_quota=args.publish_quota, rate_lost_publish=args.rate_lost_publish)
+    print(f"✅ Fake Graph API listening on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(run_server(api, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
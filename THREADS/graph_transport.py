@@ -0,0 +1,178 @@
+import atexit
+import http.client
+import os
+import threading
+
+from structured_log import get_logger
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (only needed so httpx can negotiate HTTP/2)
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# "http1" keeps the classic one-request-per-connection http.client transport,
+# "h2" multiplexes every request to the same host over one shared connection.
+THREADS_HTTP_TRANSPORT = os.environ.get('THREADS_HTTP_TRANSPORT', 'http1').lower()
+THREADS_HTTP_TIMEOUT = float(os.environ.get('THREADS_HTTP_TIMEOUT', '60'))
+
+# Requests that can be replayed after a protocol error without doing anything twice;
+# a POST (e.g. threads_publish) may already have reached the server, so it fails up to the caller
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+log = get_logger("graph_transport")
+
+_clients = {}
+_downgraded_hosts = set()
+_clients_lock = threading.Lock()
+
+
+def _build_client(host, http2):
+    return httpx.Client(
+        base_url=f"https://{host}",
+        http2=http2,
+        timeout=THREADS_HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+    )
+
+
+def get_shared_client(host):
+    """
+    Returns the process-wide httpx client for `host`.
+
+    With HTTP/2 negotiated (ALPN), all threads share a single socket and their
+    requests run as concurrent streams. Servers that only speak HTTP/1.1 are
+    downgraded automatically by the TLS negotiation.
+    """
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = _build_client(host, HTTP2_AVAILABLE and host not in _downgraded_hosts)
+            _clients[host] = client
+        return client
+
+
+def _downgrade(host):
+    """Replace a host's client with an HTTP/1.1 one after an HTTP/2 protocol failure."""
+    with _clients_lock:
+        old = _clients.get(host)
+        _downgraded_hosts.add(host)
+        client = _build_client(host, False)
+        _clients[host] = client
+    if old is not None:
+        old.close()
+    log.warning("HTTP/2 failed, downgraded to HTTP/1.1.", host=host)
+    return client
+
+
+def close_all():
+    """Close every shared client."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+atexit.register(close_all)
+
+
+class MultiplexedResponse:
+    """Minimal http.client.HTTPResponse look-alike."""
+
+    def __init__(self, response):
+        self.status = response.status_code
+        self.reason = response.reason_phrase
+        self.http_version = response.http_version
+        self.headers = response.headers
+        self._content = response.content
+
+    def read(self):
+        return self._content
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+
+class MultiplexedConnection:
+    """
+    Drop-in replacement for http.client.HTTPSConnection backed by a shared HTTP/2 client.
+
+    Each instance keeps its own pending response, so create one per thread; the
+    instances themselves are cheap because the socket lives in the shared client.
+
+    Parameters:
+        host (str): Host name, e.g. graph.threads.net.
+    """
+
+    multiplexed = True
+
+    def __init__(self, host):
+        self.host = host
+        self._response = None
+
+    def request(self, method, url, body=None, headers=None):
+        client = get_shared_client(self.host)
+        try:
+            response = client.request(method, url, content=body, headers=headers)
+        except httpx.RemoteProtocolError as e:
+            if not HTTP2_AVAILABLE or self.host in _downgraded_hosts:
+                raise http.client.RemoteDisconnected(str(e)) from e
+            client = _downgrade(self.host)
+            if method.upper() not in IDEMPOTENT_METHODS:
+                raise http.client.RemoteDisconnected(str(e)) from e
+            response = client.request(method, url, content=body, headers=headers)
+        except httpx.ConnectError as e:
+            raise ConnectionError(str(e)) from e
+        except httpx.TransportError as e:
+            raise http.client.RemoteDisconnected(str(e)) from e
+        self._response = MultiplexedResponse(response)
+
+    def getresponse(self):
+        response, self._response = self._response, None
+        if response is None:
+            raise http.client.ResponseNotReady("No request has been sent")
+        return response
+
+    def close(self):
+        # The underlying connection is shared; it is closed at interpreter exit.
+        self._response = None
+
+
+def open_connection(host, transport=None):
+    """
+    Opens a connection to `host` using the configured transport.
+
+    Parameters:
+        host (str): Host name (no scheme).
+        transport (str): "http1" or "h2"; defaults to THREADS_HTTP_TRANSPORT.
+
+    Returns:
+        An object with the http.client.HTTPSConnection request/getresponse/close API.
+    """
+    transport = (transport or THREADS_HTTP_TRANSPORT).lower()
+    if transport == "h2":
+        if httpx is not None:
+            if not HTTP2_AVAILABLE:
+                log.warning("h2 package not installed, using pooled HTTP/1.1 instead of HTTP/2.")
+            return MultiplexedConnection(host)
+        log.warning("httpx not installed, falling back to http.client.")
+    return http.client.HTTPSConnection(host)
+
+
+def is_multiplexed(conn):
+    """True when requests on `conn` can safely run concurrently from several threads."""
+    return getattr(conn, "multiplexed", False)
+
+
+def sibling_connection(conn):
+    """Returns another connection that shares `conn`'s underlying socket (for worker threads)."""
+    return MultiplexedConnection(conn.host)
@@ -0,0 +1,179 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+# Threads accepts JPEG and PNG up to 8 MB and shows images at most 1440 px wide
+MAX_WIDTH = 1440
+MAX_HEIGHT = 2880
+JPEG_QUALITY = 90
+MANIFEST_NAME = ".preprocess_manifest.json"
+SOURCE_EXTENSIONS = (".png",)
+
+
+def content_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def output_path(source):
+    """The optimized asset is written next to the original: 12_1.png -> 12_1.jpg."""
+    return os.path.splitext(source)[0] + ".jpg"
+
+
+def optimize_image(source, quality=JPEG_QUALITY, max_width=MAX_WIDTH, max_height=MAX_HEIGHT):
+    """
+    Downscales, flattens transparency onto white and re-encodes one image as a
+    progressive JPEG without EXIF, ICC or text metadata.
+
+    Returns:
+        dict: Source and output sizes in bytes and the output dimensions.
+    """
+    target = output_path(source)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+        image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+        temporary = target + ".tmp"
+        progressive = True
+        try:
+            image.save(temporary, "JPEG", quality=quality, optimize=True, progressive=True, subsampling="4:4:4")
+        except OSError:
+            # libjpeg's optimize/progressive passes can overflow Pillow's buffer on
+            # high-entropy images ("broken data stream"); a baseline JPEG still encodes
+            progressive = False
+            image.save(temporary, "JPEG", quality=quality, subsampling="4:4:4")
+        width, height = image.size
+    os.replace(temporary, target)
+    return {
+        "source_bytes": os.path.getsize(source),
+        "output_bytes": os.path.getsize(target),
+        "width": width,
+        "height": height,
+        "progressive": progressive,
+    }
+
+
+def _process(job):
+    source, digest, settings = job
+    try:
+        result = optimize_image(source, **settings)
+    except Exception as e:
+        temporary = output_path(source) + ".tmp"
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return source, digest, {"error": str(e)}
+    return source, digest, result
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    return {}
+
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def preprocess_directory(directory, workers=None, quality=JPEG_QUALITY, max_width=MAX_WIDTH, force=False):
+    """
+    Optimizes every PNG in `directory`, skipping files whose content hash and settings
+    match the manifest and whose output still exists.
+
+    Returns:
+        dict: Counts of processed, skipped and failed files and the bytes saved,
+        counted over the images that have a current JPEG.
+    """
+    settings = {"quality": quality, "max_width": max_width, "max_height": MAX_HEIGHT}
+    manifest = load_manifest(directory)
+    sources = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(SOURCE_EXTENSIONS)
+    )
+
+    jobs, converted = [], set()
+    for source in sources:
+        name = os.path.basename(source)
+        digest = content_hash(source)
+        entry = manifest.get(name)
+        if (not force and entry and entry.get("hash") == digest and entry.get("settings") == settings
+                and os.path.exists(output_path(source))):
+            converted.add(name)
+            continue
+        jobs.append((source, digest, settings))
+    skipped = len(converted)
+
+    processed, failed = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for source, digest, result in pool.map(_process, jobs, chunksize=4):
+            name = os.path.basename(source)
+            if "error" in result:
+                print(f"❌ {name}: {result['error']}")
+                # An entry from an earlier version of the file would be skipped as unchanged next time
+                manifest.pop(name, None)
+                failed += 1
+                continue
+            manifest[name] = {"hash": digest, "settings": settings, **result}
+            converted.add(name)
+            processed += 1
+
+    save_manifest(directory, manifest)
+    entries = [manifest[name] for name in converted]
+    source_bytes = sum(entry["source_bytes"] for entry in entries)
+    output_bytes = sum(entry["output_bytes"] for entry in entries)
+    return {
+        "processed": processed,
+        "skipped": skipped,
+        "failed": failed,
+        "source_bytes": source_bytes,
+        "output_bytes": output_bytes,
+        "saved_bytes": source_bytes - output_bytes,
+    }
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Create Threads-optimized JPEGs next to the PNG media library")
+    parser.add_argument("directory", help="Directory with the {counter}_{idx}.png files")
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count)")
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY)
+    parser.add_argument("--max-width", type=int, default=MAX_WIDTH)
+    parser.add_argument("--force", action="store_true", help="Re-encode even unchanged files")
+    args = parser.parse_args()
+
+    if Image is None:
+        print("❌ Pillow is required: pip install -r requirements.txt")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    report = preprocess_directory(args.directory, args.workers, args.quality, args.max_width, args.force)
+    elapsed = time.perf_counter() - start
+    mib = 1024 * 1024
+    print(f"✅ Processed {report['processed']}, skipped {report['skipped']} unchanged, "
+          f"{report['failed']} failed in {elapsed:.1f}s")
+    if report["source_bytes"]:
+        print(f"Library: {report['source_bytes'] / mib:.1f} MiB PNG -> {report['output_bytes'] / mib:.1f} MiB JPEG, "
+              f"saved {report['saved_bytes'] / mib:.1f} MiB ({report['saved_bytes'] / report['source_bytes']:.0%})")
@@ -0,0 +1,98 @@
+import os
+import posixpath
+import urllib.parse
+
+from threads_client import Account, ThreadsClient
+
+INSTAGRAM_GRAPH_URL = os.environ.get('INSTAGRAM_GRAPH_URL', 'https://graph.facebook.com')
+INSTAGRAM_API_VERSION = os.environ.get('INSTAGRAM_API_VERSION', 'v21.0')
+# Instagram carousels hold at most 10 items, Threads carousels 20
+INSTAGRAM_CAROUSEL_MAX = 10
+# Instagram only accepts JPEG photos; image_preprocess writes a .jpg next to every .png
+INSTAGRAM_IMAGE_EXTENSIONS = (".jpg", ".jpeg")
+
+# Threads media_type -> Instagram media_type (single photos send none)
+MEDIA_TYPES = {"IMAGE": None, "VIDEO": "REELS", "CAROUSEL": "CAROUSEL"}
+
+
+def instagram_account():
+    """
+    The Instagram professional account linked to the Threads profile, or None when
+    INSTAGRAM_USER_ID / INSTAGRAM_ACCESS_TOKEN aren't set.
+    """
+    user_id = os.environ.get('INSTAGRAM_USER_ID')
+    access_token = os.environ.get('INSTAGRAM_ACCESS_TOKEN')
+    if not user_id or not access_token:
+        return None
+    return Account(user_id, access_token, name=f"instagram:{user_id}")
+
+
+def jpeg_url(url):
+    """The JPEG variant of a media URL: .../12_1.png -> .../12_1.jpg."""
+    parsed = urllib.parse.urlsplit(url)
+    root, extension = posixpath.splitext(parsed.path)
+    if extension.lower() in INSTAGRAM_IMAGE_EXTENSIONS:
+        return url
+    return urllib.parse.urlunsplit(parsed._replace(path=root + ".jpg"))
+
+
+class InstagramClient(ThreadsClient):
+    """
+    Instagram Graph API content publishing over the ThreadsClient transport, so
+    Instagram calls get the same connection pools, retries and batching.
+
+    The container calls take the Threads arguments (media_type IMAGE/VIDEO/CAROUSEL
+    and `text`), so a post flow written against ThreadsClient runs unchanged on
+    Instagram. Videos are published as Reels; publishing goes to /media_publish with
+    ThreadsClient's lost-response checks against the /media post list.
+
+    Parameters:
+        base_url (str): Graph API origin, https://graph.facebook.com by default.
+        api_version (str): Version path segment.
+        **kwargs: ThreadsClient options (max_connections, max_retries, ...).
+    """
+
+    PUBLISH_EDGE = "media_publish"
+    POSTS_EDGE = "media"
+    TEXT_FIELD = "caption"
+
+    def __init__(self, base_url=INSTAGRAM_GRAPH_URL, api_version=INSTAGRAM_API_VERSION, **kwargs):
+        super().__init__(base_url, api_version, **kwargs)
+
+    async def create_container(self, account, media_type, text=None, image_url=None, video_url=None,
+                               is_carousel_item=False, children=None):
+        """
+        Creates a media container.
+
+        Returns:
+            str: The container ID.
+
+        Raises:
+            ValueError: For post types Instagram has no equivalent for (text-only posts).
+        """
+        if media_type not in MEDIA_TYPES:
+            raise ValueError(f"Instagram has no {media_type} posts")
+        params = {}
+        if MEDIA_TYPES[media_type]:
+            params["media_type"] = MEDIA_TYPES[media_type]
+        if text and not is_carousel_item:
+            params["caption"] = text
+        if image_url:
+            params["image_url"] = image_url
+        if video_url:
+            params["video_url"] = video_url
+        if is_carousel_item:
+            params["is_carousel_item"] = "true"
+        if children:
+            params["children"] = ",".join(children)
+        result = await self.request("POST", f"/{account.user_id}/media", params, account, batchable=True)
+        if not is_carousel_item:
+            self._unpublished[result["id"]] = (params.get("media_type", "IMAGE"), text)
+        return result["id"]
+
+    async def container_status(self, account, container_id):
+        """
+        Returns:
+            dict: status_code (IN_PROGRESS, FINISHED, PUBLISHED, ERROR, EXPIRED) and status.
+        """
+        return await self.request("GET", f"/{container_id}", {"fields": "status_code,status"}, account, batchable=True)
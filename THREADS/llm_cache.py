@@ -0,0 +1,170 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+# The posting workflows restore and save THREADS/.cache with actions/cache, one cache per post type
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', os.path.join(CACHE_DIR, "llm_cache.sqlite3"))
+LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', str(7 * 86400)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '500'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    response TEXT NOT NULL,
+    response_hash TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_lookup ON entries (key, used, created_at);
+CREATE INDEX IF NOT EXISTS entries_response ON entries (response_hash);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def cache_key(prompt, model, temperature, max_tokens):
+    """Hash of everything that determines the model's output distribution."""
+    material = json.dumps([prompt, model, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _response_hash(response):
+    return hashlib.sha256(response.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Disk-backed cache of LLM responses that have not been published yet.
+
+    A response is stored as "unused" when it is generated and marked used once
+    it has been published (or rejected). Lookups only return unused entries, so
+    a caption that was paid for but never posted is served first on the next
+    run, while a published caption is never repeated.
+
+    Parameters:
+        path (str): SQLite database file.
+        ttl (float): Seconds after which an entry expires.
+        max_entries (int): Entries kept before least-recently-used ones are evicted.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _count(self, name):
+        self.db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+
+    def get(self, key):
+        """
+        Returns the oldest unexpired, unused response for `key`, or None.
+        """
+        now = time.time()
+        row = self.db.execute(
+            "SELECT id, response FROM entries WHERE key = ? AND used = 0 AND created_at >= ? "
+            "ORDER BY created_at LIMIT 1", (key, now - self.ttl)
+        ).fetchone()
+        self.db.execute("BEGIN")
+        if row is None:
+            self._count("misses")
+        else:
+            self.db.execute("UPDATE entries SET last_access = ? WHERE id = ?", (now, row[0]))
+            self._count("hits")
+        self.db.execute("COMMIT")
+        return row[1] if row else None
+
+    def put(self, key, response):
+        """Stores a freshly generated response as unused and applies TTL/LRU eviction."""
+        now = time.time()
+        self.db.execute("BEGIN")
+        self.db.execute(
+            "INSERT INTO entries (key, response, response_hash, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, response, _response_hash(response), now, now)
+        )
+        self._count("stores")
+        self._evict(now)
+        self.db.execute("COMMIT")
+
+    def mark_used(self, response):
+        """Marks every cached copy of `response` as used so it is never served again."""
+        self.db.execute(
+            "UPDATE entries SET used = 1, last_access = ? WHERE response_hash = ?",
+            (time.time(), _response_hash(response))
+        )
+
+    def _evict(self, now):
+        self.db.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM entries WHERE id IN ("
+            "SELECT id FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        """Returns entry counts and the hit rate."""
+        counters = dict(self.db.execute("SELECT name, value FROM counters"))
+        total, unused = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(used = 0), 0) FROM entries"
+        ).fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": total,
+            "unused": unused,
+            "hits": hits,
+            "misses": misses,
+            "stores": counters.get("stores", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def clear(self):
+        self.db.execute("DELETE FROM entries")
+        self.db.execute("DELETE FROM counters")
+
+    def close(self):
+        self.db.close()
+
+
+_cache = None
+
+
+def get_cache():
+    """Returns the process-wide cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = LLMCache()
+    return _cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the LLM response cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    args = parser.parse_args()
+
+    cache = get_cache()
+    if args.command == "stats":
+        stats = cache.stats()
+        print(f"Entries: {stats['entries']} ({stats['unused']} unused)")
+        print(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Stores: {stats['stores']}")
+        print(f"Hit rate: {stats['hit_rate']:.1%}")
+    else:
+        cache.clear()
+        print("✅ LLM cache cleared.")
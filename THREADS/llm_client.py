@@ -0,0 +1,120 @@
+import os
+import sqlite3
+from functools import lru_cache
+
+from llm_cache import cache_key, get_cache
+from structured_log import get_logger
+
+log = get_logger("llm_client")
+
+# Set LLM_CACHE=off to always call the model
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE', 'on').lower() not in ("0", "off", "false")
+
+# Where the last complete_chat reply came from ("model" or "cache") and the token usage the API reported
+last_call = {}
+# Set by prompt_assembler.themed_prompt: replies to any rendering of the same template share one cache key
+cache_scope = None
+
+
+@lru_cache(maxsize=None)
+def get_llm_client(api_key, base_url="https://openrouter.ai/api/v1"):
+    """
+    Returns a shared OpenAI SDK client for the given key and endpoint.
+
+    The client owns an HTTP connection pool, so reusing it across posts in the
+    same process saves a TLS handshake per caption.
+
+    Parameters:
+        api_key (str): Your OpenRouter API key.
+        base_url (str): API endpoint URL.
+
+    Returns:
+        OpenAI: The cached client.
+    """
+    # Imported here so runs served from the cache or the grammar never pay for the SDK import
+    from openai import OpenAI
+    return OpenAI(base_url=base_url, api_key=api_key)
+
+
+def _cache_call(method, *args):
+    # The cache is an optimisation; a broken cache file must never block a post.
+    try:
+        return getattr(get_cache(), method)(*args)
+    except sqlite3.Error as e:
+        log.warning("LLM cache unavailable, continuing without it.", error=str(e))
+        return None
+
+
+def complete_chat(
+    prompt,
+    api_key,
+    base_url="https://openrouter.ai/api/v1",
+    model="google/gemini-2.0-flash-exp:free",
+    temperature=0.7,
+    max_tokens=500,
+    extra_headers=None,
+    extra_body=None,
+    response_format=None,
+):
+    """
+    Sends a single-message chat completion, serving unpublished cached replies first.
+    Inside prompt_assembler.themed_prompt the cache is keyed on the template and post
+    type instead of the rendered prompt, so a reply generated for another theme is reused.
+
+    Parameters:
+        prompt (str): Prompt to send to the model.
+        api_key (str): Your OpenRouter API key.
+        base_url (str): API endpoint URL.
+        model (str): Model name.
+        temperature (float): Sampling temperature.
+        max_tokens (int): Maximum tokens in the reply.
+        extra_headers (dict): Optional extra headers for OpenRouter.
+        extra_body (dict): Optional extra body for OpenRouter.
+        response_format (dict): Optional structured output format, e.g. a JSON schema.
+
+    Returns:
+        str: The model's reply.
+    """
+    last_call.clear()
+    key = cache_key(cache_scope or prompt, model, temperature, max_tokens)
+    if LLM_CACHE_ENABLED:
+        cached = _cache_call("get", key)
+        if cached is not None:
+            log.info("Using cached caption that was never published.")
+            last_call["source"] = "cache"
+            return cached
+
+    client = get_llm_client(api_key, base_url)
+    options = {"response_format": response_format} if response_format else {}
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt}
+                ]
+            }
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        extra_headers=extra_headers or {},
+        extra_body=extra_body or {},
+        **options
+    )
+    reply = response.choices[0].message.content.strip()
+    usage = getattr(response, "usage", None)
+    last_call.update(
+        source="model",
+        prompt_tokens=getattr(usage, "prompt_tokens", None),
+        completion_tokens=getattr(usage, "completion_tokens", None),
+    )
+    if LLM_CACHE_ENABLED and reply:
+        _cache_call("put", key, reply)
+    return reply
+
+
+def mark_caption_used(reply):
+    """Marks a reply as consumed (published or rejected) so the cache never serves it again."""
+    if LLM_CACHE_ENABLED and reply:
+        _cache_call("mark_used", reply)
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import socket
+import sys
+import time
+import tracemalloc
+
+from caption_filter import normalize_caption, normalize_poll
+from caption_grammar import generate_caption, generate_poll
+from fake_graph_api import run_in_process
+from threads_client import (Account, GraphAPIError, ThreadsClient, probe_media, publish_images, publish_poll,
+                            publish_text, publish_video)
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+POST_TYPES = ("text", "poll", "image", "video")
+MAX_IMAGES = 5
+# Throughput must grow by this factor for the next concurrency level to count as progress
+SATURATION_GAIN = 1.10
+
+
+def make_accounts(count):
+    """Synthetic personas with distinct user IDs and tokens."""
+    return [Account(str(1_000_000 + i), f"load-test-token-{i}", f"persona-{i}") for i in range(count)]
+
+
+async def run_post(client, account, post_type, counter, processing_wait):
+    """
+    Runs one post through the same Graph API call sequence as the posting scripts,
+    including caption generation and normalization.
+    """
+    media_base = f"/media/{account.user_id}"
+    if post_type == "text":
+        return await publish_text(client, account, normalize_caption(generate_caption("thread")))
+    if post_type == "poll":
+        question, options = normalize_poll(*generate_poll())
+        return await publish_poll(client, account, question, options)
+    caption = normalize_caption(generate_caption("caption"))
+    if post_type == "image":
+        urls = await probe_media(client, [f"{media_base}/{counter}_{idx}.png" for idx in range(1, MAX_IMAGES + 1)])
+        return await publish_images(client, account, urls, caption) if urls else None
+    return await publish_video(client, account, f"{media_base}/Video_{counter}.mp4", caption, processing_wait)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_level(base_url, accounts, types, posts_per_account, concurrency, arrival_rate,
+                    max_connections, processing_wait, batch_window=0.0):
+    """
+    Publishes posts_per_account posts for every account with `concurrency` workers.
+
+    Jobs arrive at `arrival_rate` per second (0 = all at once); the time a job waits
+    for a free worker is its queueing delay. `batch_window` > 0 lets the client
+    coalesce container creation into batch requests.
+
+    Returns:
+        dict: Throughput, latency and queueing delay percentiles, error counts.
+    """
+    client = ThreadsClient(base_url, max_connections=min(concurrency, max_connections), backoff=0.2,
+                           batch_window=batch_window)
+    queue = asyncio.Queue()
+    latencies, delays, errors = [], [], {}
+    published = 0
+
+    async def dispatch():
+        start = time.perf_counter()
+        index = 0
+        for round_index in range(posts_per_account):
+            for account_index, account in enumerate(accounts):
+                if arrival_rate:
+                    wait = start + index / arrival_rate - time.perf_counter()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                post_type = types[(account_index + round_index) % len(types)]
+                queue.put_nowait((time.perf_counter(), account, post_type, round_index + 1))
+                index += 1
+        for _ in range(concurrency):
+            queue.put_nowait(None)
+
+    async def worker():
+        nonlocal published
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            enqueued, account, post_type, counter = job
+            started = time.perf_counter()
+            delays.append(started - enqueued)
+            try:
+                post_id = await run_post(client, account, post_type, counter, processing_wait)
+            except GraphAPIError as e:
+                errors[f"http_{e.status}"] = errors.get(f"http_{e.status}", 0) + 1
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            else:
+                if post_id:
+                    published += 1
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors["no_media"] = errors.get("no_media", 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(dispatch(), *(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+
+    return {
+        "concurrency": concurrency,
+        "posts": len(accounts) * posts_per_account,
+        "published": published,
+        "elapsed_s": elapsed,
+        "posts_per_s": published / elapsed if elapsed else 0.0,
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+        "queue_p50": _percentile(delays, 50),
+        "queue_p95": _percentile(delays, 95),
+        "errors": errors,
+        "client": dict(client.stats),
+    }
+
+
+def saturation_level(levels):
+    """The lowest concurrency after which more workers no longer raise throughput meaningfully."""
+    for current, following in zip(levels, levels[1:]):
+        if following["posts_per_s"] < current["posts_per_s"] * SATURATION_GAIN:
+            return current["concurrency"]
+    return None
+
+
+def account_state_bytes(count):
+    """Memory held per synthetic account (the Account objects and their strings)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    accounts = make_accounts(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return accounts, (after - before) / count
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Fake Graph API did not start on port {port}")
+
+
+def start_fake_api(options):
+    """
+    Starts FakeGraphAPI in a separate process so its CPU use doesn't skew the client.
+
+    Parameters:
+        options (dict): FakeGraphAPI keyword arguments.
+
+    Returns:
+        tuple: (process, base_url). Terminate the process when done.
+    """
+    port = _free_port()
+    server = multiprocessing.Process(target=run_in_process, args=("127.0.0.1", port, options), daemon=True)
+    server.start()
+    _wait_for_port(port)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def print_results(levels, per_account_bytes, rss_per_account, saturation):
+    print(f"\n{'conc':>6}{'posts/s':>10}{'published':>11}{'lat p50':>9}{'lat p95':>9}"
+          f"{'queue p50':>11}{'queue p95':>11}{'retries':>9}{'requests':>10}{'batches':>9}  errors")
+    for level in levels:
+        errors = ", ".join(f"{name}={count}" for name, count in level["errors"].items()) or "-"
+        print(f"{level['concurrency']:>6}{level['posts_per_s']:>10.1f}{level['published']:>6}/{level['posts']:<4}"
+              f"{level['latency_p50']:>9.3f}{level['latency_p95']:>9.3f}{level['queue_p50']:>11.3f}"
+              f"{level['queue_p95']:>11.3f}{level['client']['retries']:>9}{level['client']['requests']:>10}"
+              f"{level['client']['batches']:>9}  {errors}")
+    print(f"\nAccount state: {per_account_bytes:.0f} B/account, "
+          f"peak RSS growth: {rss_per_account / 1024:.1f} KiB/account")
+    if saturation:
+        print(f"Throughput saturates at concurrency {saturation} "
+              f"({max(level['posts_per_s'] for level in levels):.1f} posts/s sustained)")
+    else:
+        print("Throughput was still growing at the highest concurrency tested.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the posting flows against a local fake Graph API")
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--posts-per-account", type=int, default=1)
+    parser.add_argument("--types", default=",".join(POST_TYPES), help="Comma separated post types to cycle through")
+    parser.add_argument("--concurrency", default="16,64,256,1024", help="Comma separated worker counts to step through")
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="Jobs per second; 0 enqueues everything at once")
+    parser.add_argument("--max-connections", type=int, default=512, help="Client connection pool cap")
+    parser.add_argument("--processing-wait", type=float, default=0.5, help="Video processing wait in seconds")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--rate-429", type=float, default=0.02)
+    parser.add_argument("--rate-5xx", type=float, default=0.01)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--batch-window-ms", type=float, default=0.0,
+                        help="Coalesce container creation into batch requests within this window; 0 disables")
+    parser.add_argument("--no-batch", action="store_true", help="Make the fake API reject batch requests")
+    parser.add_argument("--url", help="Use an already running API instead of starting the fake one")
+    args = parser.parse_args()
+
+    types = [t.strip() for t in args.types.split(",") if t.strip() in POST_TYPES]
+    levels_to_run = [int(value) for value in args.concurrency.split(",")]
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url = start_fake_api({
+            "latency_scale": args.latency_scale, "sigma": args.sigma, "rate_429": args.rate_429,
+            "rate_5xx": args.rate_5xx, "retry_after": args.retry_after, "batch": not args.no_batch,
+        })
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    accounts, per_account_bytes = account_state_bytes(args.accounts)
+    print(f"Load test: {args.accounts} accounts x {args.posts_per_account} posts ({', '.join(types)}) against {base_url}")
+
+    levels = []
+    try:
+        for concurrency in levels_to_run:
+            print(f"Running concurrency {concurrency}...")
+            levels.append(asyncio.run(run_level(
+                base_url, accounts, types, args.posts_per_account, concurrency,
+                args.arrival_rate, args.max_connections, args.processing_wait, args.batch_window_ms / 1000
+            )))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+    print_results(levels, per_account_bytes, rss_growth / args.accounts, saturation_level(levels))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+import io
+import itertools
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+from structured_log import get_logger
+
+try:
+    import numpy as np
+    from PIL import Image
+    HASHING_AVAILABLE = True
+except ImportError:
+    np = Image = None
+    HASHING_AVAILABLE = False
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+MEDIA_HASHES_PATH = os.environ.get('MEDIA_HASHES_PATH', os.path.join(CONTENT_DIR, "media_hashes.tsv"))
+POSTED_MEDIA_PATH = os.environ.get('POSTED_MEDIA_PATH', os.path.join(CONTENT_DIR, "posted_media.tsv"))
+# pHash bits that may differ for two images to count as the same picture
+MEDIA_DEDUP_THRESHOLD = int(os.environ.get('MEDIA_DEDUP_THRESHOLD', '6'))
+MEDIA_DEDUP_WINDOW_DAYS = float(os.environ.get('MEDIA_DEDUP_WINDOW_DAYS', '180'))
+# skip: leave out images that were posted recently, reject: skip the whole day, off: no check
+MEDIA_DEDUP = os.environ.get('MEDIA_DEDUP', 'skip').lower()
+
+HASH_BITS = 64
+CHUNK_SIZE = 64
+_DCT = None
+
+log = get_logger("media_hash_index")
+
+
+def _dct_matrix(size=32):
+    global _DCT
+    if _DCT is None:
+        k = np.arange(size)[:, None]
+        n = np.arange(size)[None, :]
+        matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+        matrix[0] /= np.sqrt(2)
+        _DCT = matrix
+    return _DCT
+
+
+def _pack(bits):
+    """(N, 64) booleans -> list of 64-bit ints."""
+    packed = np.packbits(bits.reshape(len(bits), HASH_BITS), axis=1)
+    return [int(value) for value in packed.view(">u8").ravel()]
+
+
+def dhash_batch(gray9x8):
+    """Difference hashes for a (N, 8, 9) stack: each bit says whether a pixel is brighter than its right neighbour."""
+    return _pack(gray9x8[:, :, 1:] > gray9x8[:, :, :-1])
+
+
+def phash_batch(gray32):
+    """DCT hashes for a (N, 32, 32) stack: low 8x8 frequencies compared with their median (DC term excluded)."""
+    dct = _dct_matrix()
+    coefficients = (dct @ gray32 @ dct.T)[:, :8, :8].reshape(len(gray32), HASH_BITS)
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    return _pack(coefficients > median)
+
+
+def _load_gray(source):
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            source = io.BytesIO(response.read())
+    with Image.open(source) as image:
+        image = image.convert("L")
+        small = np.asarray(image.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+        tiny = np.asarray(image.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    return small, tiny
+
+
+def hash_sources(sources):
+    """
+    Hashes a chunk of files or URLs; the chunk is hashed with one vectorized pass.
+
+    Returns:
+        list: (source, dhash, phash) for every readable source.
+    """
+    loaded, names = [], []
+    for source in sources:
+        try:
+            loaded.append(_load_gray(source))
+            names.append(source)
+        except urllib.error.HTTPError as e:
+            if e.code != 404:  # counters have a varying number of images
+                log.error("Could not hash media", source=source, error=str(e))
+        except Exception as e:
+            log.error("Could not hash media", source=source, error=str(e))
+    if not loaded:
+        return []
+    small = np.stack([pair[0] for pair in loaded])
+    tiny = np.stack([pair[1] for pair in loaded])
+    return list(zip(names, dhash_batch(tiny), phash_batch(small)))
+
+
+def media_name(source):
+    """Library key of a file path or URL: its base name, e.g. 12_1.png."""
+    return os.path.basename(urllib.parse.urlparse(source).path)
+
+
+class MultiIndexHashTable:
+    """
+    Hamming-distance index over 64-bit hashes.
+
+    Each hash is split into `chunks` substrings with one exact-match table per
+    substring. Two hashes within distance t differ in at most t // chunks bits in
+    at least one substring (pigeonhole), so a query only probes the buckets of
+    those few variants and verifies the candidates with a popcount.
+
+    Parameters:
+        chunks (int): Substrings per hash; 4 x 16 bits suits thresholds up to 7.
+    """
+
+    def __init__(self, chunks=4):
+        self.chunks = chunks
+        self.width = HASH_BITS // chunks
+        self.mask = (1 << self.width) - 1
+        self.tables = [{} for _ in range(chunks)]
+        self.size = 0
+        self._masks = {}
+
+    def _substrings(self, value):
+        return [(value >> (index * self.width)) & self.mask for index in range(self.chunks)]
+
+    def add(self, value, item):
+        for table, substring in zip(self.tables, self._substrings(value)):
+            table.setdefault(substring, []).append((value, item))
+        self.size += 1
+
+    def _flip_masks(self, radius):
+        """XOR masks reaching every substring within `radius` bits, computed once per radius."""
+        masks = self._masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for flips in range(1, radius + 1):
+                for positions in itertools.combinations(range(self.width), flips):
+                    masks.append(sum(1 << position for position in positions))
+            self._masks[radius] = masks
+        return masks
+
+    def query(self, value, threshold):
+        """
+        Returns (distance, item) pairs within `threshold` bits, closest first.
+        """
+        masks = self._flip_masks(threshold // self.chunks)
+        found = {}
+        for table, substring in zip(self.tables, self._substrings(value)):
+            for mask in masks:
+                bucket = table.get(substring ^ mask)
+                if bucket:
+                    for candidate, item in bucket:
+                        distance = (candidate ^ value).bit_count()
+                        if distance <= threshold:
+                            found[item] = distance
+        return sorted((distance, item) for item, distance in found.items())
+
+
+def load_library(path=MEDIA_HASHES_PATH):
+    """Reads name -> (dhash, phash) from the library index."""
+    library = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                name, dhash, phash = line.rstrip("\n").split("\t")
+                library[name] = (int(dhash, 16), int(phash, 16))
+    return library
+
+
+def save_library(library, path=MEDIA_HASHES_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        for name in sorted(library, key=_natural_key):
+            dhash, phash = library[name]
+            file.write(f"{name}\t{dhash:016x}\t{phash:016x}\n")
+
+
+def _natural_key(name):
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in name.replace(".", "_").split("_")]
+
+
+def load_posted(path=POSTED_MEDIA_PATH, window_days=MEDIA_DEDUP_WINDOW_DAYS):
+    """Index of the pHashes posted within the last `window_days`, keyed to their media names."""
+    index = MultiIndexHashTable()
+    cutoff = time.time() - window_days * 86400
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                name, phash, posted_at = line.rstrip("\n").split("\t")
+                if float(posted_at) >= cutoff:
+                    index.add(int(phash, 16), name)
+    return index
+
+
+def record_posted(hashes, path=POSTED_MEDIA_PATH):
+    """Appends name -> pHash entries for media that were just published."""
+    now = time.time()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as file:
+        for name, phash in hashes.items():
+            file.write(f"{name}\t{phash:016x}\t{now:.0f}\n")
+
+
+def build_index(sources, workers=None, library=None):
+    """
+    Hashes `sources` in a process pool and merges them into the library.
+
+    Returns:
+        dict: The updated library, name -> (dhash, phash).
+    """
+    library = {} if library is None else library
+    chunks = [sources[i:i + CHUNK_SIZE] for i in range(0, len(sources), CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(hash_sources, chunks):
+            for source, dhash, phash in results:
+                library[media_name(source)] = (dhash, phash)
+    return library
+
+
+def find_duplicates(image_urls, threshold=MEDIA_DEDUP_THRESHOLD):
+    """
+    Checks the day's images against recently posted media.
+
+    Images missing from the library index are downloaded and hashed on the spot.
+
+    Returns:
+        tuple: (duplicates, hashes) where duplicates maps an image URL to the
+        (distance, name) of the closest recent post and hashes maps every image
+        name to its pHash for record_posted.
+    """
+    library = load_library()
+    missing = [url for url in image_urls if media_name(url) not in library]
+    if missing:
+        for source, dhash, phash in hash_sources(missing):
+            library[media_name(source)] = (dhash, phash)
+    posted = load_posted()
+    duplicates, hashes = {}, {}
+    for url in image_urls:
+        name = media_name(url)
+        if name not in library:
+            continue
+        phash = library[name][1]
+        hashes[name] = phash
+        matches = posted.query(phash, threshold)
+        if matches:
+            duplicates[url] = matches[0]
+    return duplicates, hashes
+
+
+def filter_duplicate_images(image_urls, mode=MEDIA_DEDUP):
+    """
+    Checks the day's images against recently posted media by perceptual hash;
+    shared by thread_image and the backfill's image slots.
+
+    Returns:
+        tuple: (image URLs to post, name -> pHash of those images for record_posted)
+    """
+    if mode == "off" or not HASHING_AVAILABLE or not image_urls:
+        return image_urls, {}
+    duplicates, hashes = find_duplicates(image_urls)
+    for url, (distance, name) in duplicates.items():
+        log.info("Image matches an already posted one", url=url, posted=name, distance=distance)
+    if duplicates and mode == "reject":
+        return [], {}
+    kept = [url for url in image_urls if url not in duplicates]
+    return kept, {media_name(url): hashes[media_name(url)] for url in kept if media_name(url) in hashes}
+
+
+def _expand_counters(spec):
+    start, _, end = spec.partition("-")
+    return range(int(start), int(end or start) + 1)
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Perceptual-hash index of the media library")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="Hash the media library")
+    build_parser.add_argument("--dir", help="Local directory with {counter}_{idx}.png files")
+    build_parser.add_argument("--url", help="Base URL, e.g. $RENDER_BASE_IMAGE_URL")
+    build_parser.add_argument("--counters", default="1-365", help="Counter range for --url, e.g. 1-400")
+    build_parser.add_argument("--max-images", type=int, default=10, help="Images per counter for --url")
+    build_parser.add_argument("--workers", type=int, help="Hashing processes (default: CPU count)")
+    duplicates_parser = subcommands.add_parser("duplicates", help="List near-duplicate pairs in the library")
+    duplicates_parser.add_argument("--threshold", type=int, default=MEDIA_DEDUP_THRESHOLD)
+    check_parser = subcommands.add_parser("check", help="Check images against recently posted media")
+    check_parser.add_argument("sources", nargs="+")
+    check_parser.add_argument("--threshold", type=int, default=MEDIA_DEDUP_THRESHOLD)
+    args = parser.parse_args()
+
+    if not HASHING_AVAILABLE:
+        print("❌ numpy and Pillow are required: pip install -r requirements.txt")
+        sys.exit(1)
+
+    if args.command == "build":
+        if args.dir:
+            sources = [os.path.join(args.dir, name) for name in sorted(os.listdir(args.dir), key=_natural_key)
+                       if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))]
+        elif args.url:
+            sources = [f"{args.url.rstrip('/')}/{counter}_{idx}.png"
+                       for counter in _expand_counters(args.counters) for idx in range(1, args.max_images + 1)]
+        else:
+            parser.error("build needs --dir or --url")
+        start = time.perf_counter()
+        library = build_index(sources, args.workers, load_library())
+        save_library(library)
+        print(f"✅ Indexed {len(library)} images in {time.perf_counter() - start:.1f}s -> {MEDIA_HASHES_PATH}")
+    elif args.command == "duplicates":
+        library = load_library()
+        index = MultiIndexHashTable()
+        pairs = 0
+        for name, (_, phash) in library.items():
+            for distance, other in index.query(phash, args.threshold):
+                print(f"{distance:>3}  {other}  ~  {name}")
+                pairs += 1
+            index.add(phash, name)
+        print(f"{pairs} near-duplicate pairs among {len(library)} images")
+    else:
+        duplicates, _ = find_duplicates(args.sources, args.threshold)
+        for source in args.sources:
+            match = duplicates.get(source)
+            print(f"{'❌' if match else '✅'} {source}" + (f"  ~ {match[1]} (distance {match[0]})" if match else ""))
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import mimetypes
+import os
+import posixpath
+import stat
+import sys
+import urllib.parse
+from email.utils import formatdate, parsedate_to_datetime
+
+from mini_http import Response, serve
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+MEDIA_ORIGIN_ROOT = os.environ.get('MEDIA_ORIGIN_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+MEDIA_ORIGIN_PORT = int(os.environ.get('MEDIA_ORIGIN_PORT', '8080'))
+# Library files never change in place (a new day gets a new counter), so caches may keep them for a year
+MEDIA_ORIGIN_MAX_AGE = int(os.environ.get('MEDIA_ORIGIN_MAX_AGE', str(365 * 86400)))
+
+mimetypes.add_type("video/mp4", ".mp4")
+mimetypes.add_type("image/webp", ".webp")
+
+
+def make_etag(st):
+    """Validator built from size and mtime, so no file content is read to compute it."""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range `Range` header.
+
+    Returns:
+        tuple: (start, end) inclusive, None to serve the whole file (absent, malformed
+        or multi-range headers), or False when the range can't be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header, etag):
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+class MediaOrigin:
+    """
+    Serves the media library from local disk as a drop-in replacement for the
+    RENDER_BASE_IMAGE_URL / RENDER_BASE_VIDEO_URL host.
+
+    File bodies go out with loop.sendfile, so the kernel copies pages straight from
+    the page cache to the socket. HEAD, single byte ranges, ETag/If-None-Match,
+    If-Modified-Since and If-Range are supported, and every file is sent with a long
+    Cache-Control lifetime.
+
+    Parameters:
+        root (str): Directory served at `/`.
+        max_age (int): Cache-Control max-age in seconds.
+    """
+
+    def __init__(self, root=MEDIA_ORIGIN_ROOT, max_age=MEDIA_ORIGIN_MAX_AGE):
+        self.root = os.path.realpath(root)
+        self.cache_control = f"public, max-age={max_age}"
+        self.stats = {"requests": 0, "full": 0, "partial": 0, "not_modified": 0, "not_found": 0, "bytes": 0}
+
+    def resolve(self, path):
+        """Maps a URL path to a regular file under the root, or None."""
+        relative = posixpath.normpath(urllib.parse.unquote(path)).lstrip("/")
+        if relative in ("", ".") or relative.startswith("..") or "\x00" in relative:
+            return None
+        filename = os.path.realpath(os.path.join(self.root, relative))
+        if os.path.commonpath((self.root, filename)) != self.root:
+            return None
+        return filename
+
+    def _not_modified(self, request, etag, st):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, etag)
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def handle(self, request):
+        """HTTP entry point passed to mini_http.serve."""
+        self.stats["requests"] += 1
+        if request.method not in ("GET", "HEAD"):
+            return Response(405, "Method Not Allowed", {"Allow": "GET, HEAD"})
+        filename = self.resolve(request.path)
+        fd = None
+        try:
+            if filename is None:
+                raise FileNotFoundError(request.path)
+            # fstat on the opened file keeps the metadata and the bytes we send consistent
+            fd = os.open(filename, os.O_RDONLY)
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode):
+                raise FileNotFoundError(request.path)
+        except OSError:
+            if fd is not None:
+                os.close(fd)
+            self.stats["not_found"] += 1
+            return Response(404, "Not Found")
+
+        etag = make_etag(st)
+        headers = {
+            "Content-Type": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            "ETag": etag,
+            "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+            "Cache-Control": self.cache_control,
+            "Accept-Ranges": "bytes",
+        }
+        if self._not_modified(request, etag, st):
+            os.close(fd)
+            self.stats["not_modified"] += 1
+            return Response(304, b"", headers)
+
+        size = st.st_size
+        byte_range = parse_range(request.headers.get("range"), size)
+        if_range = request.headers.get("if-range")
+        if byte_range and if_range and if_range.strip() != etag:
+            byte_range = None
+        if byte_range is False:
+            os.close(fd)
+            return Response(416, b"", {**headers, "Content-Range": f"bytes */{size}"})
+
+        status, offset, count = 200, 0, size
+        if byte_range:
+            start, end = byte_range
+            status, offset, count = 206, start, end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            self.stats["partial"] += 1
+        else:
+            self.stats["full"] += 1
+
+        if request.method == "HEAD":
+            os.close(fd)
+            headers["Content-Length"] = str(count)
+            return Response(status, b"", headers, send_body=False)
+        self.stats["bytes"] += count
+        return Response(status, headers=headers, file=(os.fdopen(fd, "rb", buffering=0), offset, count))
+
+
+async def run_server(origin, host="0.0.0.0", port=MEDIA_ORIGIN_PORT):
+    server = await serve(origin.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the media library with zero-copy sendfile")
+    parser.add_argument("--root", default=MEDIA_ORIGIN_ROOT, help="Directory with the image and video files")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=MEDIA_ORIGIN_PORT)
+    parser.add_argument("--max-age", type=int, default=MEDIA_ORIGIN_MAX_AGE, help="Cache-Control max-age in seconds")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"❌ Media root {args.root} does not exist.")
+        sys.exit(1)
+    print(f"✅ Serving {args.root} on http://{args.host}:{args.port}/")
+    print("   Point RENDER_BASE_IMAGE_URL / RENDER_BASE_VIDEO_URL at this host (behind HTTPS for Threads).")
+    try:
+        asyncio.run(run_server(MediaOrigin(args.root, args.max_age), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,346 @@
+import argparse
+import http.client
+import json
+import os
+import struct
+import sys
+import threading
+import urllib.parse
+
+from graph_transport import open_connection
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+MEDIA_VALIDATION_CACHE = os.environ.get('MEDIA_VALIDATION_CACHE', os.path.join(CACHE_DIR, "media_validation.json"))
+
+# Threads media requirements
+VIDEO_CODECS = {"avc1": "H.264", "avc3": "H.264", "hvc1": "HEVC", "hev1": "HEVC"}
+AUDIO_CODECS = {"mp4a": "AAC"}
+VIDEO_MAX_BYTES = 1024 ** 3
+VIDEO_MAX_SECONDS = 300
+VIDEO_MAX_WIDTH = 1920
+IMAGE_MAX_BYTES = 8 * 1024 ** 2
+IMAGE_MAX_ASPECT = 10.0
+
+HEAD_BYTES = 64 * 1024
+# Boxes whose children are parsed; everything else is skipped by size
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts"}
+
+
+class MediaInvalid(ValueError):
+    """Raised when media can't be parsed at all."""
+
+
+class MediaUnavailable(MediaInvalid):
+    """Raised when the media URL answers with an HTTP error instead of the file."""
+
+
+class RangeReader:
+    """
+    Reads byte ranges of one URL over a single keep-alive connection.
+
+    Parameters:
+        url (str): Media URL.
+        etag (str): Cached ETag; the first read returns None on 304 Not Modified.
+
+    Attributes:
+        fresh_etag (str): The ETag of a 200/206 response read by this reader, or None.
+    """
+
+    def __init__(self, url, etag=None):
+        parsed = urllib.parse.urlparse(url)
+        self.path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        self.conn = (http.client.HTTPConnection(parsed.netloc) if parsed.scheme == "http"
+                     else open_connection(parsed.netloc))
+        self.etag = etag
+        self.fresh_etag = None
+        self.size = None
+        self.requests = 0
+
+    def read(self, offset, length, conditional=False):
+        headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        if conditional and self.etag:
+            headers["If-None-Match"] = self.etag
+        self.conn.request("GET", self.path, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        self.requests += 1
+        if response.status == 304:
+            return None
+        if response.status not in (200, 206):
+            raise MediaUnavailable(f"HTTP {response.status} fetching bytes {offset}-{offset + length - 1}")
+        self.etag = self.fresh_etag = response.getheader("ETag") or self.fresh_etag
+        content_range = response.getheader("Content-Range") or ""
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            self.size = int(content_range.rsplit("/", 1)[1])
+        elif response.status == 200:
+            # No range support: the whole file came back
+            self.size = len(data)
+            return data[offset:offset + length]
+        return data
+
+    def close(self):
+        self.conn.close()
+
+
+def _boxes(data, start=0, end=None):
+    """Yields (type, payload_start, box_end) for the ISO-BMFF boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _parse_track(data, start, end, info):
+    track = {}
+    for kind, payload, box_end in _boxes(data, start, end):
+        if kind == b"tkhd":
+            # width and height are 16.16 fixed point at the end of the box
+            track["width"] = struct.unpack(">I", data[box_end - 8:box_end - 4])[0] >> 16
+            track["height"] = struct.unpack(">I", data[box_end - 4:box_end])[0] >> 16
+        elif kind == b"edts":
+            info["edit_lists"] = True
+        elif kind == b"mdia":
+            for child, child_payload, child_end in _boxes(data, payload, box_end):
+                if child == b"hdlr":
+                    track["handler"] = data[child_payload + 8:child_payload + 12].decode("latin-1")
+                elif child == b"minf":
+                    _find_sample_entry(data, child_payload, child_end, track)
+    if track.get("handler") == "vide":
+        info["video_codec"] = track.get("codec")
+        info["width"], info["height"] = track.get("width"), track.get("height")
+    elif track.get("handler") == "soun":
+        info["audio_codec"] = track.get("codec")
+
+
+def _find_sample_entry(data, start, end, track):
+    for kind, payload, box_end in _boxes(data, start, end):
+        if kind == b"stbl":
+            _find_sample_entry(data, payload, box_end, track)
+        elif kind == b"stsd" and payload + 16 <= box_end:
+            # version/flags, entry count, then the first sample entry's size and format
+            track["codec"] = data[payload + 12:payload + 16].decode("latin-1")
+
+
+def parse_moov(data):
+    """Duration, codecs and video resolution from a complete moov box payload."""
+    info = {}
+    for kind, payload, box_end in _boxes(data):
+        if kind == b"mvhd":
+            version = data[payload]
+            if version == 1:
+                timescale, duration = struct.unpack(">IQ", data[payload + 20:payload + 32])
+            else:
+                timescale, duration = struct.unpack(">II", data[payload + 12:payload + 20])
+            info["duration_s"] = round(duration / timescale, 3) if timescale else None
+        elif kind == b"trak":
+            _parse_track(data, payload, box_end, info)
+    return info
+
+
+def inspect_mp4(reader, head):
+    """
+    Walks the top-level boxes with range reads until moov is found.
+
+    Returns:
+        dict: brand, moov position, duration, codecs and resolution.
+    """
+    info = {"type": "mp4"}
+    offset, moov_seen_before_mdat, mdat_seen = 0, None, False
+    buffer, buffer_start = head, 0
+    while reader.size is None or offset < reader.size:
+        if offset + 16 > buffer_start + len(buffer):
+            buffer, buffer_start = reader.read(offset, 16), offset
+            if len(buffer) < 8:
+                break
+        local = offset - buffer_start
+        size, kind = struct.unpack(">I4s", buffer[local:local + 8])
+        header = 8
+        if size == 1:
+            size, header = struct.unpack(">Q", buffer[local + 8:local + 16])[0], 16
+        elif size == 0:
+            size = (reader.size or offset) - offset
+        if size < header:
+            raise MediaInvalid(f"Corrupt box at offset {offset}")
+
+        if kind == b"ftyp":
+            info["brand"] = buffer[local + header:local + header + 4].decode("latin-1")
+        elif kind == b"mdat":
+            mdat_seen = True
+        elif kind == b"moov":
+            moov_seen_before_mdat = not mdat_seen
+            if offset + size <= buffer_start + len(buffer):
+                moov = buffer[local + header:local + size]
+            else:
+                moov = reader.read(offset + header, size - header)
+            info.update(parse_moov(moov))
+            break
+        offset += size
+
+    if "brand" not in info:
+        raise MediaInvalid("No ftyp box: not an MP4/MOV file")
+    info["moov_found"] = moov_seen_before_mdat is not None
+    info["faststart"] = bool(moov_seen_before_mdat)
+    return info
+
+
+def inspect_png(head):
+    if head[:8] != b"\x89PNG\r\n\x1a\n" or head[12:16] != b"IHDR":
+        raise MediaInvalid("Not a PNG file")
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", head[16:26])
+    return {"type": "png", "width": width, "height": height, "bit_depth": bit_depth, "color_type": color_type}
+
+
+def inspect_jpeg(head):
+    if head[:2] != b"\xff\xd8":
+        raise MediaInvalid("Not a JPEG file")
+    offset = 2
+    while offset + 9 < len(head):
+        if head[offset] != 0xFF:
+            offset += 1
+            continue
+        marker = head[offset + 1]
+        if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            height, width = struct.unpack(">HH", head[offset + 5:offset + 9])
+            return {"type": "jpeg", "width": width, "height": height, "progressive": marker == 0xC2}
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        offset += 2 + struct.unpack(">H", head[offset + 2:offset + 4])[0]
+    raise MediaInvalid("No JPEG frame header in the first bytes")
+
+
+def check_requirements(info, size):
+    """Lists the ways `info` breaks Threads' media rules (errors) or recommendations (warnings)."""
+    errors, warnings = [], []
+    if info["type"] == "mp4":
+        if size and size > VIDEO_MAX_BYTES:
+            errors.append(f"file is {size / 1024 ** 2:.0f} MB, limit is 1 GB")
+        if not info.get("moov_found"):
+            errors.append("no moov box found")
+        else:
+            codec = info.get("video_codec")
+            if codec not in VIDEO_CODECS:
+                errors.append(f"video codec {codec!r} is not H.264 or HEVC")
+            if info.get("audio_codec") and info["audio_codec"] not in AUDIO_CODECS:
+                errors.append(f"audio codec {info['audio_codec']!r} is not AAC")
+            duration = info.get("duration_s") or 0
+            if not 0 < duration <= VIDEO_MAX_SECONDS:
+                errors.append(f"duration {duration}s is outside 0-{VIDEO_MAX_SECONDS}s")
+            if (info.get("width") or 0) > VIDEO_MAX_WIDTH:
+                errors.append(f"width {info['width']}px exceeds {VIDEO_MAX_WIDTH}px")
+            if not info.get("faststart"):
+                warnings.append("moov is after mdat; Threads recommends faststart files")
+            if info.get("edit_lists"):
+                warnings.append("file has edit lists, which Threads recommends against")
+    else:
+        if size and size > IMAGE_MAX_BYTES:
+            errors.append(f"file is {size / 1024 ** 2:.1f} MB, limit is 8 MB")
+        width, height = info.get("width") or 0, info.get("height") or 0
+        if not width or not height:
+            errors.append("image has no dimensions")
+        elif max(width, height) / min(width, height) > IMAGE_MAX_ASPECT:
+            errors.append(f"aspect ratio {width}x{height} exceeds 10:1")
+    return errors, warnings
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(MEDIA_VALIDATION_CACHE, encoding="utf-8") as file:
+                _cache = json.load(file)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache():
+    os.makedirs(os.path.dirname(MEDIA_VALIDATION_CACHE) or ".", exist_ok=True)
+    with open(MEDIA_VALIDATION_CACHE + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(_cache, file)
+    os.replace(MEDIA_VALIDATION_CACHE + ".tmp", MEDIA_VALIDATION_CACHE)
+
+
+def validate_media(url, etag=None):
+    """
+    Checks a PNG, JPEG or MP4 against Threads' media requirements using range requests.
+
+    Results are cached per URL and ETag: a known ETag skips the network entirely and
+    otherwise the first range request is conditional, so an unchanged file costs one
+    304 round trip. Only results parsed from a fresh 200/206 response are cached;
+    transport and HTTP errors are returned but checked again on the next call.
+
+    Parameters:
+        url (str): Media URL.
+        etag (str): ETag from an earlier HEAD probe, if any.
+
+    Returns:
+        dict: {"ok", "errors", "warnings", "info", "size", "etag", "requests"}
+    """
+    with _cache_lock:
+        cached = _load_cache().get(url)
+    if cached and etag and cached.get("etag") == etag:
+        return {**cached, "requests": 0}
+
+    reader = RangeReader(url, cached.get("etag") if cached else None)
+    try:
+        head = reader.read(0, HEAD_BYTES, conditional=cached is not None)
+        if head is None:
+            return {**cached, "requests": reader.requests}
+        if head[4:8] == b"ftyp":
+            info = inspect_mp4(reader, head)
+        elif head[:8] == b"\x89PNG\r\n\x1a\n":
+            info = inspect_png(head)
+        else:
+            info = inspect_jpeg(head)
+        errors, warnings = check_requirements(info, reader.size)
+        cacheable = True
+    except (MediaUnavailable, OSError, http.client.HTTPException) as e:
+        info, errors, warnings, cacheable = {}, [str(e)], [], False
+    except (MediaInvalid, struct.error) as e:
+        info, errors, warnings, cacheable = {}, [str(e)], [], True
+    finally:
+        reader.close()
+
+    result = {"ok": not errors, "errors": errors, "warnings": warnings, "info": info,
+              "size": reader.size, "etag": reader.fresh_etag}
+    if cacheable and reader.fresh_etag:
+        with _cache_lock:
+            _load_cache()[url] = result
+            _save_cache()
+    return {**result, "requests": reader.requests}
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Check media URLs against Threads' requirements")
+    parser.add_argument("urls", nargs="+")
+    args = parser.parse_args()
+
+    failed = False
+    for url in args.urls:
+        result = validate_media(url)
+        print(f"{'✅' if result['ok'] else '❌'} {url} ({result['requests']} requests)")
+        print(f"   {json.dumps(result['info'])}")
+        for message in result["errors"]:
+            print(f"   error: {message}")
+        for message in result["warnings"]:
+            print(f"   warning: {message}")
+        failed = failed or not result["ok"]
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,316 @@
+import asyncio
+import json
+import ssl
+import urllib.parse
+from http import HTTPStatus
+
+from structured_log import get_logger
+
+# Upper bounds that keep a single bad client from exhausting memory
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+# Methods a client may send again when it can't tell whether the server got them
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+log = get_logger("mini_http")
+
+
+class Request:
+    """A parsed HTTP/1.1 request."""
+
+    __slots__ = ("method", "target", "path", "query", "headers", "body", "keep_alive")
+
+    def __init__(self, method, target, headers, body, keep_alive):
+        self.method = method
+        self.target = target
+        parsed = urllib.parse.urlsplit(target)
+        self.path = parsed.path
+        self.query = dict(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+        self.headers = headers
+        self.body = body
+        self.keep_alive = keep_alive
+
+
+class Response:
+    """
+    An HTTP response to be written by `serve`.
+
+    Parameters:
+        status (int): HTTP status code.
+        body (bytes | str): Response body (ignored when `file` is given).
+        headers (dict): Extra response headers.
+        file (tuple): Optional (file object, offset, count) sent with loop.sendfile; closed once written.
+        send_body (bool): False for HEAD requests, headers are still computed from the body.
+    """
+
+    __slots__ = ("status", "body", "headers", "file", "send_body")
+
+    def __init__(self, status=200, body=b"", headers=None, file=None, send_body=True):
+        self.status = status
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.headers = headers or {}
+        self.file = file
+        self.send_body = send_body
+
+
+def json_response(status, payload, headers=None):
+    """Build a JSON response from a dict."""
+    merged = {"Content-Type": "application/json"}
+    merged.update(headers or {})
+    return Response(status, json.dumps(payload), merged)
+
+
+async def read_request(reader):
+    """
+    Read one request from the stream.
+
+    Returns:
+        Request: The parsed request, or None when the peer closed the connection.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("Request header too large")
+    if len(head) > MAX_HEADER_BYTES:
+        raise ValueError("Request header too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise ValueError(f"Malformed request line: {lines[0]!r}")
+
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return Request(method.upper(), target, headers, body, keep_alive)
+
+
+def _head_bytes(response, content_length, keep_alive):
+    try:
+        reason = HTTPStatus(response.status).phrase
+    except ValueError:
+        reason = ""
+    lines = [f"HTTP/1.1 {response.status} {reason}"]
+    headers = {"Content-Length": str(content_length)}
+    headers.update(response.headers)
+    if not keep_alive:
+        headers["Connection"] = "close"
+    for name, value in headers.items():
+        lines.append(f"{name}: {value}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def write_response(writer, response, keep_alive=True):
+    """Write a Response, using zero-copy sendfile for file bodies when available."""
+    if response.file is not None:
+        fileobj, offset, count = response.file
+        try:
+            writer.write(_head_bytes(response, count, keep_alive))
+            if response.send_body and count:
+                await writer.drain()
+                loop = asyncio.get_running_loop()
+                await loop.sendfile(writer.transport, fileobj, offset, count)
+        finally:
+            fileobj.close()
+    else:
+        writer.write(_head_bytes(response, len(response.body), keep_alive))
+        if response.send_body and response.body:
+            writer.write(response.body)
+    await writer.drain()
+
+
+async def serve(handler, host="0.0.0.0", port=8080, limit=MAX_HEADER_BYTES):
+    """
+    Start an HTTP/1.1 keep-alive server.
+
+    Parameters:
+        handler: Coroutine function taking a Request and returning a Response.
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        limit (int): StreamReader buffer limit.
+
+    Returns:
+        asyncio.Server: The started server.
+    """
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as e:
+                    await write_response(writer, Response(400, str(e)), keep_alive=False)
+                    break
+                if request is None:
+                    break
+                try:
+                    response = await handler(request)
+                except Exception as e:
+                    log.exception("Handler error", method=request.method, path=request.path, error=str(e))
+                    response = Response(500, "Internal Server Error")
+                await write_response(writer, response, request.keep_alive)
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    return await asyncio.start_server(on_connection, host, port, limit=limit)
+
+
+class ConnectFailed(ConnectionError):
+    """No connection could be opened, so the request never left the client and is safe to send again."""
+
+
+class ClientResponse:
+    """A response read by ConnectionPool."""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+    @property
+    def text(self):
+        return self.body.decode("utf-8", "replace")
+
+
+async def _read_response(reader, method):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    if method == "HEAD" or status in (204, 304):
+        body = b""
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                await reader.readuntil(b"\r\n")
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        headers["connection"] = "close"
+    return ClientResponse(status, headers, body)
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 client for one origin.
+
+    Idle connections are reused LIFO and at most `max_connections` requests are
+    in flight; it stays flat at thousands of concurrent callers where generic
+    async clients spend their time managing the pool.
+
+    Parameters:
+        origin (str): Scheme and host, e.g. https://graph.threads.net.
+        max_connections (int): Upper bound on open connections.
+        timeout (float): Seconds allowed for connect plus one request/response.
+    """
+
+    def __init__(self, origin, max_connections=100, timeout=60.0):
+        parsed = urllib.parse.urlsplit(origin)
+        self.host = parsed.hostname
+        self.tls = parsed.scheme == "https"
+        self.port = parsed.port or (443 if self.tls else 80)
+        self.host_header = parsed.netloc
+        self.timeout = timeout
+        self._ssl = ssl.create_default_context() if self.tls else None
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def request(self, method, target, headers=None, body=b"", idempotent=None):
+        """
+        Sends one request and reads the whole response.
+
+        A request that fails on a reused keep-alive connection is sent again on a fresh
+        one, since the server may have closed it while idle. Non-idempotent requests are
+        never sent twice: they skip idle connections that are already closed and
+        otherwise let the failure through.
+
+        Parameters:
+            idempotent (bool): Whether the request may be sent twice; by default
+                true for IDEMPOTENT_METHODS.
+
+        Raises:
+            ConnectFailed: When no connection could be opened (the request wasn't sent).
+            OSError, asyncio.TimeoutError, asyncio.IncompleteReadError: On other transport failures.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host_header}", f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+        async with self._slots:
+            while self._idle:
+                reader, writer = self._idle.pop()
+                if reader.at_eof() or writer.is_closing():
+                    writer.close()
+                    continue
+                if not idempotent:
+                    return await self._exchange(reader, writer, payload, method)
+                try:
+                    return await self._exchange(reader, writer, payload, method)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    # The server closed an idle keep-alive connection; retry once on a fresh one
+                    break
+            try:
+                connection = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self._ssl), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                raise ConnectFailed(f"Could not connect to {self.host}:{self.port}: {e!r}") from e
+            return await self._exchange(*connection, payload, method)
+
+    async def _exchange(self, reader, writer, payload, method):
+        try:
+            writer.write(payload)
+            response = await asyncio.wait_for(_read_response(reader, method), self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if response.headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self._idle.append((reader, writer))
+        return response
+
+    async def aclose(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
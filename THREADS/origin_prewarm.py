@@ -0,0 +1,251 @@
+import argparse
+import http.client
+import os
+import re
+import sys
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+
+import run_history
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKFLOWS_DIR = os.path.join(REPO_ROOT, ".github", "workflows")
+# The posting workflows whose cron lines define the slots, and the media they fetch
+SLOT_WORKFLOWS = {"image": "thread_image_scheduler.yml", "video": "thread_video_scheduler.yml"}
+COUNTER_FILES = {"image": "counter_image.txt", "video": "counter_video.txt"}
+
+# A probe slower than this means the origin instance is still starting
+PREWARM_THRESHOLD_MS = float(os.environ.get('PREWARM_THRESHOLD_MS', '1500'))
+# Render spins idle instances down after ~15 minutes, so keep probing at a shorter interval until the slot
+PREWARM_KEEPALIVE_SECONDS = float(os.environ.get('PREWARM_KEEPALIVE_SECONDS', '300'))
+PREWARM_TIMEOUT_SECONDS = float(os.environ.get('PREWARM_TIMEOUT_SECONDS', '120'))
+RENDER_IMAGE_EXTENSION = os.environ.get('RENDER_IMAGE_EXTENSION', 'png')
+
+CRON_LINE = re.compile(r"""^\s*-\s*cron:\s*['"]([^'"]+)['"]""")
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def _cron_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (int(value) for value in spec.split("-"))
+        else:
+            start = end = int(spec)
+            if step:
+                end = high
+        values.update(range(start, end + 1, int(step or 1)))
+    return values
+
+
+def parse_cron(expression):
+    """Five-field cron expression -> list of allowed value sets (minute, hour, day, month, weekday)."""
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Unsupported cron expression: {expression!r}")
+    sets = [_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_RANGES)]
+    sets[4] = {day % 7 for day in sets[4]}  # 7 is also Sunday
+    return sets
+
+
+def cron_matches(sets, moment):
+    minute, hour, day, month, weekday = sets
+    return (moment.minute in minute and moment.hour in hour and moment.day in day
+            and moment.month in month and (moment.isoweekday() % 7) in weekday)
+
+
+def load_slots(kinds=tuple(SLOT_WORKFLOWS), workflows_dir=WORKFLOWS_DIR, workflows=SLOT_WORKFLOWS):
+    """
+    Reads the schedule of the posting workflows (`workflows`: kind -> workflow file).
+
+    Returns:
+        dict: kind -> list of parsed cron expressions.
+    """
+    slots = {}
+    for kind in kinds:
+        with open(os.path.join(workflows_dir, workflows[kind]), encoding="utf-8") as file:
+            slots[kind] = [parse_cron(match.group(1)) for match in map(CRON_LINE.match, file) if match]
+    return slots
+
+
+def upcoming_slots(slots, now, within_minutes):
+    """
+    GitHub Actions crons run in UTC; returns (slot time, kind) for slots in the next `within_minutes`.
+    """
+    start = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    found = []
+    for offset in range(within_minutes):
+        moment = start + timedelta(minutes=offset)
+        for kind, expressions in slots.items():
+            if any(cron_matches(sets, moment) for sets in expressions):
+                found.append((moment, kind))
+    return found
+
+
+def media_url(kind, counter):
+    """The URL the posting script will probe first for `kind`, or None if its base URL isn't configured."""
+    if kind == "image":
+        base = os.environ.get('RENDER_BASE_IMAGE_URL')
+        return f"{base}/{counter}_1.{RENDER_IMAGE_EXTENSION}" if base else None
+    base = os.environ.get('RENDER_BASE_VIDEO_URL')
+    return f"{base}/Video_{counter}.mp4" if base else None
+
+
+def read_counter(counter_file):
+    """Read the current counter value from the file, or initialize it."""
+    path = os.path.join(REPO_ROOT, counter_file)
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            return int(file.read())
+    return 0
+
+
+def probe(url, timeout=PREWARM_TIMEOUT_SECONDS):
+    """
+    HEADs `url` on a fresh connection, as Threads' fetcher would.
+
+    Returns:
+        tuple: (status or None on a transport error, elapsed milliseconds)
+    """
+    parsed = urllib.parse.urlparse(url)
+    connection_class = http.client.HTTPConnection if parsed.scheme == "http" else http.client.HTTPSConnection
+    conn = connection_class(parsed.netloc, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        conn.request("HEAD", parsed.path or "/")
+        response = conn.getresponse()
+        response.read()
+        status = response.status
+    except (OSError, http.client.HTTPException):
+        status = None
+    finally:
+        conn.close()
+    return status, (time.perf_counter() - start) * 1000
+
+
+def prewarm(url, threshold_ms=PREWARM_THRESHOLD_MS, deadline=None, interval=5.0):
+    """
+    Probes `url` until the origin answers within `threshold_ms` or `deadline` passes.
+
+    Returns:
+        dict: cold_ms (first probe), warm_ms (first fast probe or None), warmup_ms
+        (time until warm), attempts and the last status.
+    """
+    start = time.perf_counter()
+    samples = []
+    while True:
+        status, elapsed = probe(url)
+        samples.append(elapsed)
+        warm = status == 200 and elapsed <= threshold_ms
+        if warm or (deadline is not None and time.time() >= deadline):
+            break
+        time.sleep(interval)
+    return {
+        "cold_ms": samples[0],
+        "warm_ms": elapsed if warm else None,
+        "warmup_ms": (time.perf_counter() - start) * 1000,
+        "attempts": len(samples),
+        "status": status,
+    }
+
+
+def prewarm_and_record(kind, url, threshold_ms=PREWARM_THRESHOLD_MS, deadline=None):
+    """
+    Runs `prewarm` as a `prewarm_{kind}` run, so `run_history report` shows cold and
+    warm fetch percentiles next to the posting runs' media_probe phase.
+    """
+    run = run_history.RunRecorder(f"prewarm_{kind}")
+    with run.phase("warmup"):
+        result = prewarm(url, threshold_ms, deadline)
+    run.phases["cold_fetch"] = result["cold_ms"] / 1000
+    if result["warm_ms"] is not None:
+        run.phases["warm_fetch"] = result["warm_ms"] / 1000
+    run.retries = result["attempts"] - 1
+    run.ok = result["warm_ms"] is not None
+    run.finish()
+    return result
+
+
+def keep_warm(slots, interval=PREWARM_KEEPALIVE_SECONDS):
+    """
+    Re-probes every URL in `slots` (url -> slot time) every `interval` seconds until
+    its slot, so no instance can idle out in between.
+    """
+    pending = {url: slot.timestamp() for url, slot in slots.items()}
+    while True:
+        pending = {url: until for url, until in pending.items() if time.time() + interval < until}
+        if not pending:
+            return
+        time.sleep(interval)
+        for url in pending:
+            status, elapsed = probe(url)
+            print(f"   keep-alive {url}: {status} in {elapsed:.0f} ms")
+
+
+def warm_upcoming(within_minutes, threshold_ms=PREWARM_THRESHOLD_MS, kinds=tuple(SLOT_WORKFLOWS), keepalive=True):
+    """
+    Pre-warms the origin for every slot starting in the next `within_minutes`.
+
+    Returns:
+        bool: True when every origin answered within the threshold.
+    """
+    now = datetime.now(timezone.utc)
+    upcoming = upcoming_slots(load_slots(kinds), now, within_minutes)
+    if not upcoming:
+        print(f"No slots in the next {within_minutes} minutes.")
+        return True
+
+    all_warm, warmed = True, {}
+    for slot, kind in upcoming:
+        url = media_url(kind, read_counter(COUNTER_FILES[kind]))
+        if url is None or url in warmed:
+            continue
+        print(f"Pre-warming {kind} origin for the {slot:%H:%M} UTC slot: {url}")
+        result = prewarm_and_record(kind, url, threshold_ms, deadline=slot.timestamp())
+        if result["warm_ms"] is not None:
+            print(f"✅ Warm after {result['attempts']} probes: cold {result['cold_ms']:.0f} ms, "
+                  f"warm {result['warm_ms']:.0f} ms, warm-up took {result['warmup_ms'] / 1000:.1f}s")
+        else:
+            all_warm = False
+            print(f"❌ Origin still slow or failing at the slot (status {result['status']}, "
+                  f"cold {result['cold_ms']:.0f} ms, {result['attempts']} probes)")
+        warmed[url] = slot
+
+    if keepalive and warmed:
+        keep_warm(warmed)
+    return all_warm
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Wake the media origin before scheduled posts")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    warm_parser = subcommands.add_parser("warm", help="Pre-warm for slots starting soon")
+    warm_parser.add_argument("--within", type=int, default=45, help="Minutes ahead to look for slots")
+    warm_parser.add_argument("--threshold-ms", type=float, default=PREWARM_THRESHOLD_MS)
+    warm_parser.add_argument("--types", default=",".join(SLOT_WORKFLOWS), help="Comma-separated: image,video")
+    warm_parser.add_argument("--no-keepalive", action="store_true", help="Exit once warm instead of waiting for the slot")
+    probe_parser = subcommands.add_parser("probe", help="Warm one URL now and record the timings")
+    probe_parser.add_argument("url")
+    probe_parser.add_argument("--type", default="image", choices=tuple(SLOT_WORKFLOWS))
+    probe_parser.add_argument("--threshold-ms", type=float, default=PREWARM_THRESHOLD_MS)
+    probe_parser.add_argument("--timeout", type=float, default=180.0, help="Give up after this many seconds")
+    subcommands.add_parser("slots", help="List the slots of the next 24 hours")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        ok = warm_upcoming(args.within, args.threshold_ms, tuple(args.types.split(",")), not args.no_keepalive)
+        sys.exit(0 if ok else 1)
+    elif args.command == "probe":
+        result = prewarm_and_record(args.type, args.url, args.threshold_ms, deadline=time.time() + args.timeout)
+        if result["warm_ms"] is not None:
+            print(f"✅ cold {result['cold_ms']:.0f} ms, warm {result['warm_ms']:.0f} ms after {result['attempts']} probes")
+        else:
+            print(f"❌ Not warm after {result['attempts']} probes (status {result['status']}, cold {result['cold_ms']:.0f} ms)")
+    else:
+        for slot, kind in upcoming_slots(load_slots(), datetime.now(timezone.utc), 24 * 60):
+            print(f"{slot:%Y-%m-%d %H:%M} UTC  {kind}")
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+from caption_filter import POLL_MAX_OPTIONS, POLL_MIN_OPTIONS, POLL_OPTION_LIMIT, THREADS_TEXT_LIMIT, normalize_poll
+
+POLL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string", "minLength": 1, "maxLength": THREADS_TEXT_LIMIT},
+        "options": {
+            "type": "array",
+            "minItems": POLL_MIN_OPTIONS,
+            "maxItems": POLL_MAX_OPTIONS,
+            "items": {"type": "string", "minLength": 1, "maxLength": POLL_OPTION_LIMIT},
+        },
+    },
+    "required": ["question", "options"],
+    "additionalProperties": False,
+}
+# OpenAI-style structured output; OpenRouter passes it on to Gemini as a response schema
+POLL_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "threads_poll", "strict": True, "schema": POLL_SCHEMA}}
+# A repair only rewrites a few fields, so it gets a small reply budget
+POLL_REPAIR_MAX_TOKENS = int(os.environ.get('POLL_REPAIR_MAX_TOKENS', '150'))
+
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+# "Question:" / "Option A:" lines of the old prompt format and the local generator, tolerating
+# bold markers, numbering, bullets and indentation
+POLL_LINE = re.compile(
+    r"^[\s*_#>\-\d.)]*(?:(?P<question>question)|option\s*(?P<letter>[a-d]))[\s*_]*[:\-–][\s*_]*(?P<value>.*?)[\s*_]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+REPAIR_PROMPT = """Fix this Threads poll. Change only what the problems below mention and keep the wording and tone otherwise.
+Rules: a question, and {min_options} to {max_options} different options of 1 to {limit} characters each.
+Problems:
+{problems}
+Poll:
+{poll}
+Return only the corrected JSON object: {{"question": "...", "options": ["...", "..."]}}"""
+
+
+class PollInvalid(ValueError):
+    """
+    A generated poll that breaks the schema.
+
+    Attributes:
+        errors (list): One readable problem per field, used for the repair prompt.
+        data (dict): What could be parsed, or None.
+    """
+
+    def __init__(self, errors, data=None):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+        self.data = data
+
+
+def poll_json(question, options):
+    """Serializes a (question, option_a..option_d) poll in the schema's shape."""
+    return json.dumps({"question": question, "options": [options[key] for key in sorted(options)]}, ensure_ascii=False)
+
+
+def extract_poll(text):
+    """
+    Reads a poll from a model reply: the JSON object in it (code fences and chatter
+    around it are ignored) or, failing that, Question:/Option X: lines.
+
+    Returns:
+        dict: {"question", "options"} as found, unvalidated, or None.
+    """
+    match = JSON_OBJECT.search(text)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            return data
+    question, options = None, {}
+    for line in POLL_LINE.finditer(text):
+        if line.group("letter"):
+            options.setdefault(line.group("letter").lower(), line.group("value"))
+        elif question is None:
+            question = line.group("value")
+    if question is None and not options:
+        return None
+    return {"question": question, "options": [options[letter] for letter in sorted(options)]}
+
+
+def tidy_poll(data):
+    """
+    The fixes that need no model: strips whitespace, drops empty and repeated
+    options and keeps the first four.
+    """
+    question = data.get("question")
+    options = data.get("options")
+    if not isinstance(options, list):
+        return {"question": question, "options": options}
+    kept, seen = [], set()
+    for option in options:
+        if not isinstance(option, str):
+            option = "" if option is None else str(option)
+        option = option.strip()
+        if option and option.lower() not in seen:
+            seen.add(option.lower())
+            kept.append(option)
+    return {"question": question.strip() if isinstance(question, str) else question, "options": kept[:POLL_MAX_OPTIONS]}
+
+
+def poll_errors(data):
+    """
+    Checks a poll against Threads' limits.
+
+    Returns:
+        list: Problems in words, empty when the poll is valid.
+    """
+    errors = []
+    question = data.get("question")
+    if not isinstance(question, str) or not question.strip():
+        errors.append("the question is missing")
+    elif len(question) > THREADS_TEXT_LIMIT:
+        errors.append(f"the question is {len(question)} characters, the limit is {THREADS_TEXT_LIMIT}")
+    options = data.get("options")
+    if not isinstance(options, list):
+        return errors + ["options must be a list"]
+    if len(options) < POLL_MIN_OPTIONS:
+        errors.append(f"there are {len(options)} options, at least {POLL_MIN_OPTIONS} different ones are needed")
+    if len(options) > POLL_MAX_OPTIONS:
+        errors.append(f"there are {len(options)} options, the limit is {POLL_MAX_OPTIONS}")
+    for index, option in enumerate(options):
+        if not isinstance(option, str) or not option.strip():
+            errors.append(f"option {index + 1} is empty")
+        elif len(option) > POLL_OPTION_LIMIT:
+            errors.append(f"option {index + 1} \"{option}\" is {len(option)} characters, the limit is {POLL_OPTION_LIMIT}")
+    return errors
+
+
+def repair_prompt(data, errors, reply):
+    """A short prompt that asks the model to fix only the fields named in `errors`."""
+    poll = json.dumps(data, ensure_ascii=False) if data is not None else reply.strip()[:THREADS_TEXT_LIMIT]
+    return REPAIR_PROMPT.format(min_options=POLL_MIN_OPTIONS, max_options=POLL_MAX_OPTIONS, limit=POLL_OPTION_LIMIT,
+                                problems="\n".join(f"- {error}" for error in errors), poll=poll)
+
+
+def validated_poll(reply):
+    """
+    Returns:
+        dict: The tidied poll from a model reply.
+
+    Raises:
+        PollInvalid: With the problems to send in a repair prompt.
+    """
+    data = extract_poll(reply)
+    if data is None:
+        raise PollInvalid(["the reply is not a poll JSON object"])
+    data = tidy_poll(data)
+    errors = poll_errors(data)
+    if errors:
+        raise PollInvalid(errors, data)
+    return data
+
+
+def parse_poll(reply, repair=None):
+    """
+    Validates a model reply against the poll schema, asking for one targeted repair
+    when fields break it.
+
+    Parameters:
+        reply (str): The model's reply.
+        repair (callable): prompt -> reply, used at most once; None disables repairs.
+
+    Returns:
+        tuple: (question, options) ready for create_poll_container.
+
+    Raises:
+        ValueError: When the poll (after the repair, if any) is still unusable.
+    """
+    try:
+        data = validated_poll(reply)
+    except PollInvalid as e:
+        if repair is None:
+            raise
+        data = validated_poll(repair(repair_prompt(e.data, e.errors, reply)))
+    options = {f"option_{letter}": option for letter, option in zip("abcd", data["options"])}
+    return normalize_poll(data["question"], options)
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Validate poll replies against the poll schema")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("schema", help="Print the JSON schema sent to the model")
+    check_parser = subcommands.add_parser("check", help="Validate a reply read from stdin")
+    check_parser.add_argument("--show-repair", action="store_true", help="Print the repair prompt for invalid replies")
+    args = parser.parse_args()
+
+    if args.command == "schema":
+        print(json.dumps(POLL_RESPONSE_FORMAT, indent=2))
+    else:
+        reply = sys.stdin.read()
+        try:
+            question, options = parse_poll(reply)
+        except PollInvalid as e:
+            print(f"❌ {e}")
+            if args.show_repair:
+                print(repair_prompt(e.data, e.errors, reply))
+            sys.exit(1)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ {poll_json(question, options)}")
@@ -0,0 +1,248 @@
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import socket
+import ssl
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from run_history import HISTORY_DIR
+
+# Profiles are written next to the run history database
+THREADS_PROFILE_DIR = os.environ.get('THREADS_PROFILE_DIR', os.path.join(HISTORY_DIR, "profiles"))
+TOP_ALLOCATIONS = 25
+
+# Blocking socket calls; the SSL ones cover the TLS handshake and encrypted reads/writes.
+SOCKET_METHODS = {
+    socket.socket: ("connect", "send", "sendall", "recv", "recv_into", "accept"),
+    ssl.SSLSocket: ("send", "sendall", "recv", "recv_into", "read", "write", "do_handshake"),
+}
+
+# Function key patterns grouped so diffs show which kind of work regressed
+CATEGORIES = {
+    "import": ("<frozen importlib", "importlib", "<method 'exec_module'", "<built-in method _imp."),
+    "json": ("/json/", "<built-in method _json.", "of '_json."),
+    "string": ("of 'str' objects>", "<built-in method builtins.print>", "unicodedata", "caption_filter"),
+    "regex": ("/re/", "_sre", "of 're.Pattern' objects>"),
+    "socket": ("socket.py", "ssl.py", "of '_socket.socket' objects>", "of '_ssl._SSLSocket' objects>"),
+    "sqlite": ("sqlite3", "of 'sqlite3."),
+}
+
+
+class IOTimer:
+    """
+    Accumulates wall-clock time spent blocked in socket calls and time.sleep.
+
+    Like cProfile, only the thread that installed the timer is measured. Nested
+    calls (SSLSocket.sendall calling send) are only counted once.
+    """
+
+    def __init__(self):
+        self.socket_s = 0.0
+        self.socket_calls = 0
+        self.sleep_s = 0.0
+        self._thread = threading.get_ident()
+        self._inside = False
+        self._originals = []
+
+    def _wrap(self, original, bucket):
+        timer = self
+
+        def timed(*args, **kwargs):
+            if timer._inside or threading.get_ident() != timer._thread:
+                return original(*args, **kwargs)
+            timer._inside = True
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                timer._inside = False
+                if bucket == "sleep":
+                    timer.sleep_s += elapsed
+                else:
+                    timer.socket_s += elapsed
+                    timer.socket_calls += 1
+        return timed
+
+    def install(self):
+        for cls, names in SOCKET_METHODS.items():
+            for name in names:
+                # recv_into and friends are inherited from the C _socket.socket type
+                self._originals.append((cls, name, cls.__dict__.get(name)))
+                setattr(cls, name, self._wrap(getattr(cls, name), "socket"))
+        self._originals.append((time, "sleep", time.sleep))
+        time.sleep = self._wrap(time.sleep, "sleep")
+
+    def uninstall(self):
+        for owner, name, original in reversed(self._originals):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._originals.clear()
+
+
+@contextmanager
+def profiled(name, enabled=True, directory=THREADS_PROFILE_DIR):
+    """
+    Profiles the block with cProfile and tracemalloc and writes
+    `<name>-<timestamp>.prof` plus a `.json` summary to `directory`.
+
+    The summary splits wall-clock time into CPU, socket wait and sleep so a
+    slow network and a slow script can be told apart.
+
+    Parameters:
+        name (str): Prefix for the artifact files, usually the post type.
+        enabled (bool): When False the block runs untouched.
+        directory (str): Where the artifacts are written.
+    """
+    if not enabled:
+        yield
+        return
+
+    io_timer = IOTimer()
+    profiler = cProfile.Profile()
+    tracemalloc.start(10)
+    io_timer.install()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall_s = time.perf_counter() - wall_start
+        cpu_s = time.process_time() - cpu_start
+        io_timer.uninstall()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        profiler.dump_stats(base + ".prof")
+        summary = {
+            "name": name,
+            "wall_s": round(wall_s, 4),
+            "cpu_s": round(cpu_s, 4),
+            "socket_s": round(io_timer.socket_s, 4),
+            "socket_calls": io_timer.socket_calls,
+            "sleep_s": round(io_timer.sleep_s, 4),
+            "other_wait_s": round(max(0.0, wall_s - cpu_s - io_timer.socket_s - io_timer.sleep_s), 4),
+            "tracemalloc_peak_bytes": peak,
+            "top_allocations": [
+                {"where": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+            ],
+            "categories": category_times(pstats.Stats(profiler)),
+        }
+        with open(base + ".json", "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+        print(f"Profile written to {base}.prof "
+              f"(wall {wall_s:.2f}s, cpu {cpu_s:.2f}s, socket {io_timer.socket_s:.2f}s, "
+              f"sleep {io_timer.sleep_s:.2f}s, peak {peak / 1024:.0f} KiB)")
+
+
+def _function_label(key):
+    filename, line, function = key
+    if filename == "~":
+        return function
+    return f"{filename}:{line}({function})"
+
+
+def category_of(key):
+    label = _function_label(key)
+    for category, patterns in CATEGORIES.items():
+        if any(pattern in label for pattern in patterns):
+            return category
+    return None
+
+
+def category_times(stats):
+    """Own (tottime) seconds per category, so nested calls are not counted twice."""
+    totals = {category: 0.0 for category in CATEGORIES}
+    for key, (_, _, tottime, _, _) in stats.stats.items():
+        category = category_of(key)
+        if category:
+            totals[category] += tottime
+    return {category: round(seconds, 4) for category, seconds in totals.items()}
+
+
+def _load(path):
+    base = path[:-len(".prof")] if path.endswith(".prof") else path
+    stats = pstats.Stats(base + ".prof")
+    summary = {}
+    if os.path.exists(base + ".json"):
+        with open(base + ".json", encoding="utf-8") as file:
+            summary = json.load(file)
+    return stats, summary
+
+
+def diff_profiles(before_path, after_path, top=20):
+    """
+    Compares two profiles.
+
+    Returns:
+        dict: Summary deltas, per-category deltas and the functions whose own time
+        grew or shrank the most.
+    """
+    before_stats, before_summary = _load(before_path)
+    after_stats, after_summary = _load(after_path)
+
+    summary = {}
+    for field in ("wall_s", "cpu_s", "socket_s", "sleep_s", "other_wait_s", "socket_calls", "tracemalloc_peak_bytes"):
+        if field in before_summary and field in after_summary:
+            summary[field] = (before_summary[field], after_summary[field])
+
+    before_categories = category_times(before_stats)
+    after_categories = category_times(after_stats)
+    categories = {name: (before_categories[name], after_categories[name]) for name in CATEGORIES}
+
+    functions = []
+    for key in set(before_stats.stats) | set(after_stats.stats):
+        before = before_stats.stats.get(key, (0, 0, 0.0, 0.0, {}))
+        after = after_stats.stats.get(key, (0, 0, 0.0, 0.0, {}))
+        delta = after[2] - before[2]
+        if delta:
+            functions.append((delta, _function_label(key), before[1], after[1], before[2], after[2]))
+    functions.sort(key=lambda row: abs(row[0]), reverse=True)
+
+    return {"summary": summary, "categories": categories, "functions": functions[:top]}
+
+
+def print_diff(result):
+    print(f"{'':<24}{'before':>14}{'after':>14}{'delta':>14}")
+    for field, (before, after) in result["summary"].items():
+        print(f"{field:<24}{before:>14}{after:>14}{after - before:>+14.4g}")
+    print("\nOwn time by category (s)")
+    for name, (before, after) in result["categories"].items():
+        print(f"  {name:<22}{before:>14.4f}{after:>14.4f}{after - before:>+14.4f}")
+    print("\nLargest own-time changes (s)")
+    for delta, label, calls_before, calls_after, before, after in result["functions"]:
+        print(f"  {delta:>+9.4f}  {before:.4f} -> {after:.4f}  calls {calls_before} -> {calls_after}  {label}")
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Compare profiles written by --profile runs")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    diff_parser = subcommands.add_parser("diff", help="Compare two profiles")
+    diff_parser.add_argument("before", help="Baseline .prof file")
+    diff_parser.add_argument("after", help="New .prof file")
+    diff_parser.add_argument("--top", type=int, default=20, help="Functions to list")
+    subcommands.add_parser("list", help="List recorded profiles")
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        print_diff(diff_profiles(args.before, args.after, args.top))
+    else:
+        if os.path.isdir(THREADS_PROFILE_DIR):
+            for entry in sorted(os.listdir(THREADS_PROFILE_DIR)):
+                if entry.endswith(".prof"):
+                    print(os.path.join(THREADS_PROFILE_DIR, entry))
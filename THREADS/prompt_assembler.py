@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import llm_client
+import run_history
+from structured_log import get_logger
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+# Optional {"theme name": weight} overrides; themes not listed weigh 1
+PROMPT_THEME_WEIGHTS = os.environ.get('PROMPT_THEME_WEIGHTS', os.path.join(CONTENT_DIR, "prompt_theme_weights.json"))
+# A theme picked within this many previous posts of the same type is not picked again
+PROMPT_RECENT_THEMES = int(os.environ.get('PROMPT_RECENT_THEMES', '3'))
+# Prompts with an example list but no themes send this many examples instead of all of them
+PROMPT_EXAMPLES = int(os.environ.get('PROMPT_EXAMPLES', '6'))
+
+THEME_HEADING = re.compile(r"^\s*\d+\.\s+(?P<name>\S.*?)\s*$")
+EXAMPLE_LINE = re.compile(r"^\s*-\s*Example\s+\d+\s*-\s*(?P<text>.*?)\s*$", re.IGNORECASE)
+PICK_INSTRUCTION = re.compile(r"^.*randomly pick one of the following themes.*$", re.IGNORECASE | re.MULTILINE)
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+log = get_logger("prompt_assembler")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompt_calls (
+    started_at REAL NOT NULL,
+    post_type TEXT NOT NULL,
+    theme TEXT,
+    source TEXT NOT NULL,
+    prompt_tokens INTEGER,
+    estimated_tokens INTEGER NOT NULL,
+    full_estimated_tokens INTEGER NOT NULL,
+    latency_ms INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS prompt_calls_by_type ON prompt_calls (post_type, started_at);
+"""
+
+
+def estimate_tokens(text):
+    """Word and punctuation count; tracks BPE token counts closely enough to compare prompts."""
+    return len(TOKEN.findall(text))
+
+
+class PromptTemplate:
+    """
+    A prompt file split into shared rules and the sections the model used to pick from.
+
+    Attributes:
+        header (str): Rules before the theme list, with the "randomly pick" line removed.
+        themes (dict): Theme name -> its section (heading and examples).
+        examples (list): `- Example N - ...` lines, for prompts without themes.
+        footer (str): Rules after the theme list.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.themes = {}
+        self.examples = []
+        header, footer, current = [], [], None
+        for line in text.splitlines():
+            heading = THEME_HEADING.match(line)
+            if heading and not footer:
+                current = heading.group("name")
+                self.themes[current] = [line]
+            elif current is not None and not footer and (not line.strip() or line.lstrip().startswith("-")):
+                self.themes[current].append(line)
+            elif current is not None:
+                footer.append(line)
+            elif EXAMPLE_LINE.match(line):
+                self.examples.append(line)
+            else:
+                header.append(line)
+        self.themes = {name: "\n".join(lines).strip() for name, lines in self.themes.items()}
+        self.header = PICK_INSTRUCTION.sub("Write the thread in this theme:", "\n".join(header)).strip()
+        self.footer = "\n".join(footer).strip()
+
+    def render(self, theme=None, examples=None):
+        """The prompt with only `theme` (or only `examples`) between the shared rules."""
+        if self.themes:
+            return f"{self.header}\n\n{self.themes[theme]}\n\n{self.footer}"
+        if self.examples:
+            lines = self.text.splitlines()
+            kept = [line for line in lines if not EXAMPLE_LINE.match(line) or line in examples]
+            return "\n".join(kept)
+        return self.text
+
+
+@lru_cache(maxsize=None)
+def parse_prompt(text):
+    """Parses a prompt once per process; threads_bot reuses it for every post in a batch."""
+    return PromptTemplate(text)
+
+
+def load_weights(path=PROMPT_THEME_WEIGHTS):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    return {}
+
+
+def _open_calls():
+    db = run_history.open_history()
+    db.executescript(SCHEMA)
+    return db
+
+
+def recent_themes(post_type, limit):
+    """The themes of the last `limit` prompts of `post_type`, newest first."""
+    if limit <= 0:
+        return []
+    try:
+        db = _open_calls()
+        rows = db.execute(
+            "SELECT theme FROM prompt_calls WHERE post_type = ? AND theme IS NOT NULL "
+            "ORDER BY started_at DESC LIMIT ?", (post_type, limit)
+        ).fetchall()
+        db.close()
+    except sqlite3.Error:
+        return []
+    return [theme for (theme,) in rows]
+
+
+def pick_theme(template, post_type, rng=random, weights=None, recent=PROMPT_RECENT_THEMES):
+    """Weighted pick among the themes not used in the last `recent` prompts of this type."""
+    weights = load_weights() if weights is None else weights
+    names = list(template.themes)
+    excluded = set(recent_themes(post_type, min(recent, len(names) - 1)))
+    candidates = [name for name in names if name not in excluded and weights.get(name, 1.0) > 0] or names
+    return rng.choices(candidates, [max(weights.get(name, 1.0), 0.0) or 1.0 for name in candidates])[0]
+
+
+class AssembledPrompt:
+    """A prompt cut down to one theme, plus what is needed to record its cost."""
+
+    def __init__(self, post_type, template, theme=None, examples=None):
+        self.post_type = post_type
+        self.theme = theme
+        self.text = template.render(theme, examples)
+        self.estimated_tokens = estimate_tokens(self.text)
+        self.full_estimated_tokens = estimate_tokens(template.text)
+        # The theme and example sample change every call, so the LLM cache keys on what they are cut from
+        self.cache_scope = f"{post_type}\n{template.text}"
+
+
+def assemble(user_prompt, post_type, rng=random):
+    """
+    Picks a theme (or a sample of examples) locally and renders the reduced prompt.
+
+    Returns:
+        AssembledPrompt: The prompt text and its token estimates.
+    """
+    template = parse_prompt(user_prompt)
+    if template.themes:
+        return AssembledPrompt(post_type, template, theme=pick_theme(template, post_type, rng))
+    if len(template.examples) > PROMPT_EXAMPLES:
+        return AssembledPrompt(post_type, template, theme="examples",
+                               examples=set(rng.sample(template.examples, PROMPT_EXAMPLES)))
+    return AssembledPrompt(post_type, template)
+
+
+def record_call(prompt, latency):
+    """Stores the theme, token counts and model latency of one caption request."""
+    call = dict(llm_client.last_call)
+    try:
+        db = _open_calls()
+        with db:
+            db.execute(
+                "INSERT INTO prompt_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), prompt.post_type, prompt.theme, call.get("source", "fallback"),
+                 call.get("prompt_tokens"), prompt.estimated_tokens, prompt.full_estimated_tokens,
+                 int(latency * 1000))
+            )
+        db.close()
+    except sqlite3.Error as e:
+        log.warning("Could not record prompt stats", error=str(e))
+
+
+@contextmanager
+def themed_prompt(user_prompt, post_type):
+    """
+    Yields the assembled prompt for one caption request and records the request's
+    latency and token usage when the block ends. A reply served from the cache was
+    written for an earlier pick, so its theme is cleared rather than recorded.
+    """
+    prompt = assemble(user_prompt, post_type)
+    if prompt.theme:
+        log.info("Prompt assembled", post_type=post_type, theme=prompt.theme,
+                 estimated_tokens=prompt.estimated_tokens, full_estimated_tokens=prompt.full_estimated_tokens)
+    start = time.perf_counter()
+    llm_client.cache_scope = prompt.cache_scope
+    try:
+        yield prompt
+    finally:
+        llm_client.cache_scope = None
+    if llm_client.last_call.get("source") == "cache":
+        prompt.theme = None
+    record_call(prompt, time.perf_counter() - start)
+
+
+def theme_report(since):
+    """
+    Returns:
+        list: (post_type, theme, calls, avg API prompt tokens, avg estimated tokens,
+        avg full-prompt estimate, p50 latency ms, p95 latency ms, model calls)
+    """
+    db = _open_calls()
+    rows = db.execute(
+        "SELECT post_type, COALESCE(theme, '-'), prompt_tokens, estimated_tokens, full_estimated_tokens, "
+        "latency_ms, source FROM prompt_calls WHERE started_at >= ? ORDER BY latency_ms", (since,)
+    ).fetchall()
+    db.close()
+    groups = {}
+    for post_type, theme, tokens, estimated, full, latency, source in rows:
+        groups.setdefault((post_type, theme), []).append((tokens, estimated, full, latency, source))
+    report = []
+    for (post_type, theme), calls in sorted(groups.items()):
+        api_tokens = [tokens for tokens, *_ in calls if tokens is not None]
+        model_latencies = [latency for _, _, _, latency, source in calls if source == "model"]
+        report.append((
+            post_type, theme, len(calls),
+            sum(api_tokens) / len(api_tokens) if api_tokens else None,
+            sum(call[1] for call in calls) / len(calls),
+            sum(call[2] for call in calls) / len(calls),
+            run_history.percentile(model_latencies, 50),
+            run_history.percentile(model_latencies, 95),
+            len(model_latencies),
+        ))
+    return report
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Theme-preselected prompts and their token/latency stats")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    show_parser = subcommands.add_parser("show", help="Show the parsed sections and one assembled prompt")
+    show_parser.add_argument("prompt_file")
+    show_parser.add_argument("--type", default="text")
+    stats_parser = subcommands.add_parser("stats", help="Prompt tokens and model latency per theme")
+    stats_parser.add_argument("--since", default="30d", help="7d, 12h, 30m or an ISO date (default: 30d)")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        with open(args.prompt_file, encoding="utf-8") as file:
+            template = parse_prompt(file.read())
+        print(f"{len(template.themes)} themes, {len(template.examples)} examples, "
+              f"~{estimate_tokens(template.text)} tokens in the full prompt")
+        for name, section in template.themes.items():
+            print(f"  {name}: ~{estimate_tokens(section)} tokens")
+        prompt = assemble(template.text, args.type)
+        print(f"\n--- assembled ({prompt.theme}, ~{prompt.estimated_tokens} tokens) ---\n{prompt.text}")
+    else:
+        rows = theme_report(run_history.parse_since(args.since))
+        if not rows:
+            print("No prompts recorded in this window.")
+        print(f"{'type':<7}{'theme':<40}{'calls':>6}{'api tok':>9}{'est tok':>9}{'full':>7}{'p50 ms':>9}{'p95 ms':>9}")
+        for post_type, theme, calls, api_tokens, estimated, full, p50, p95, _ in rows:
+            api = f"{api_tokens:.0f}" if api_tokens is not None else "-"
+            print(f"{post_type:<7}{theme[:39]:<40}{calls:>6}{api:>9}{estimated:>9.0f}{full:>7.0f}{p50:>9}{p95:>9}")
@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import marshal
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+from collections import deque
+
+from structured_log import aflush, get_logger
+from threads_client import Account, GraphAPIError, ThreadsClient
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+MODERATION_KEYWORDS = os.environ.get('MODERATION_KEYWORDS', os.path.join(CONTENT_DIR, "moderation_keywords.txt"))
+MODERATION_EMOJI = os.environ.get('MODERATION_EMOJI', os.path.join(CONTENT_DIR, "moderation_emoji.txt"))
+MODERATION_CACHE = os.environ.get('MODERATION_CACHE', os.path.join(CACHE_DIR, "moderation_automaton.marshal"))
+# Hide-reply calls in flight at once
+MODERATION_CONCURRENCY = int(os.environ.get('MODERATION_CONCURRENCY', '8'))
+# Our own replies (e.g. thread chains) are never hidden
+THREADS_USERNAME = os.environ.get('THREADS_USERNAME', '')
+
+# Bump when normalize() changes so cached automatons are rebuilt
+NORMALIZER_VERSION = 1
+INVISIBLE = "\u00ad\u180e\u200b\u200c\u200d\u2060\ufeff\ufe0e\ufe0f"
+LEETSPEAK = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"}
+_TRANSLATION = str.maketrans({
+    **{char: None for char in INVISIBLE},
+    **{chr(code): None for code in range(0x1F3FB, 0x1F400)},  # skin tone modifiers
+    **LEETSPEAK,
+})
+REPEATS = re.compile(r"(.)\1+")
+WHITESPACE = re.compile(r"\s+")
+
+log = get_logger("reply_moderation")
+
+
+def normalize(text):
+    """
+    Folds the usual evasions onto one spelling: compatibility forms (fullwidth and
+    math-styled letters), case, leetspeak digits, zero-width and variation characters,
+    and repeated letters ("fr33eee" and "ＦＲＥＥ" both become "fre").
+    """
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text)
+    text = text.translate(_TRANSLATION).casefold()
+    return WHITESPACE.sub(" ", REPEATS.sub(r"\1", text))
+
+
+def load_blocklist(path, default_category):
+    """
+    Reads `term[<TAB>category]` lines, skipping blanks and # comments.
+
+    Returns:
+        list: (term, category) pairs.
+    """
+    entries = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                line = line.rstrip("\n")
+                if not line.strip() or line.lstrip().startswith("#"):
+                    continue
+                term, _, category = line.partition("\t")
+                entries.append((term.strip(), category.strip() or default_category))
+    return entries
+
+
+def build_automaton(terms):
+    """
+    Aho-Corasick automaton over `terms`, flattened into a DFA.
+
+    Returns:
+        tuple: (delta, outputs) where delta[state] maps a character to the next state
+        (a missing character goes back to the root) and outputs[state] lists the
+        indexes of the terms ending there.
+    """
+    goto, fail, outputs = [{}], [0], [()]
+    for index, term in enumerate(terms):
+        state = 0
+        for char in term:
+            following = goto[state].get(char)
+            if following is None:
+                following = len(goto)
+                goto[state][char] = following
+                goto.append({})
+                fail.append(0)
+                outputs.append(())
+            state = following
+        outputs[state] += (index,)
+
+    # Breadth-first, so every fail target is complete before the states that use it
+    delta = [None] * len(goto)
+    delta[0] = dict(goto[0])
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        delta[state] = {**delta[fail[state]], **goto[state]}
+        for char, following in goto[state].items():
+            fail[following] = delta[fail[state]].get(char, 0)
+            outputs[following] += outputs[fail[following]]
+            queue.append(following)
+    return delta, outputs
+
+
+class BlocklistMatcher:
+    """
+    Finds blocklisted keywords and emoji in reply text with one pass of a compiled
+    Aho-Corasick automaton.
+
+    Keywords match on word boundaries; emoji match anywhere. The automaton is
+    cached on disk with marshal and rebuilt whenever a blocklist or the normalizer
+    changes.
+
+    Parameters:
+        keywords_path (str): Keyword blocklist.
+        emoji_path (str): Emoji blocklist.
+        cache_path (str): Automaton cache file.
+    """
+
+    def __init__(self, keywords_path=MODERATION_KEYWORDS, emoji_path=MODERATION_EMOJI, cache_path=MODERATION_CACHE):
+        entries = load_blocklist(keywords_path, "keyword") + load_blocklist(emoji_path, "emoji")
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(NORMALIZER_VERSION).encode())
+        for term, category in entries:
+            digest.update(f"{term}\t{category}\n".encode("utf-8"))
+        key = digest.hexdigest()
+
+        cached = self._load(cache_path, key)
+        self.from_cache = cached is not None
+        if cached is None:
+            normalized = {}
+            for term, category in entries:
+                normalized.setdefault(normalize(term), (term, category))
+            terms = [term for term in normalized if term]
+            delta, outputs = build_automaton(terms)
+            bounded = tuple(term[0].isalnum() and term[-1].isalnum() for term in terms)
+            cached = (key, terms, [normalized[term] for term in terms], bounded, delta, outputs)
+            self._save(cache_path, cached)
+        _, self.terms, self.entries, self.bounded, self.delta, self.outputs = cached
+        self.lengths = [len(term) for term in self.terms]
+
+    @staticmethod
+    def _load(path, key):
+        try:
+            with open(path, "rb") as file:
+                cached = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return cached if cached and cached[0] == key else None
+
+    @staticmethod
+    def _save(path, cached):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            marshal.dump(cached, file)
+        os.replace(path + ".tmp", path)
+
+    def search(self, text):
+        """
+        Returns:
+            list: (original term, category) for every blocklist entry found in `text`.
+        """
+        text = normalize(text)
+        delta, outputs, bounded, lengths = self.delta, self.outputs, self.bounded, self.lengths
+        size = len(text)
+        state = 0
+        found = []
+        for end, char in enumerate(text, 1):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    if bounded[index]:
+                        start = end - lengths[index]
+                        if (start and text[start - 1].isalnum()) or (end < size and text[end].isalnum()):
+                            continue
+                    found.append(index)
+        return [self.entries[index] for index in dict.fromkeys(found)]
+
+
+class ReplyModerator:
+    """
+    Streams replies through a BlocklistMatcher and hides the matches with at most
+    `concurrency` hide-reply calls in flight.
+
+    Parameters:
+        matcher (BlocklistMatcher): Compiled blocklists.
+        client (ThreadsClient): Graph API client.
+        account (Account): The account that owns the replied-to posts.
+        concurrency (int): Hide-reply calls in flight at once.
+        dry_run (bool): Only report matches.
+        own_username (str): Replies from this user are never hidden.
+    """
+
+    def __init__(self, matcher, client, account, concurrency=MODERATION_CONCURRENCY, dry_run=False,
+                 own_username=THREADS_USERNAME):
+        self.matcher = matcher
+        self.client = client
+        self.account = account
+        self.dry_run = dry_run
+        self.own_username = own_username
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self.stats = {"scanned": 0, "flagged": 0, "hidden": 0, "hide_errors": 0, "categories": {}}
+
+    async def moderate(self, reply):
+        """
+        Checks one reply ({"id", "text", "username", ...}) and queues a hide call for a match.
+
+        Returns:
+            list: The matched (term, category) pairs.
+        """
+        self.stats["scanned"] += 1
+        text = reply.get("text") or ""
+        if not text or (self.own_username and reply.get("username") == self.own_username):
+            return []
+        matches = self.matcher.search(text)
+        if matches:
+            self.stats["flagged"] += 1
+            for category in dict.fromkeys(category for _, category in matches):
+                self.stats["categories"][category] = self.stats["categories"].get(category, 0) + 1
+            if not self.dry_run:
+                # Wait for a free slot here so a flood of matches applies backpressure to the stream
+                await self._slots.acquire()
+                task = asyncio.create_task(self._hide(reply["id"], matches))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return matches
+
+    async def _hide(self, reply_id, matches):
+        try:
+            await self.client.hide_reply(self.account, reply_id)
+            self.stats["hidden"] += 1
+            log.info("Hid reply", account=self.account.name, reply_id=reply_id,
+                     matches=[f"{term} ({category})" for term, category in matches])
+        except GraphAPIError as e:
+            self.stats["hide_errors"] += 1
+            log.error("Could not hide reply", account=self.account.name, reply_id=reply_id, error=str(e))
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        """Waits for every queued hide call."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+def attach(receiver, moderator):
+    """Moderates every `replies` webhook event the receiver queues."""
+    async def on_reply(event):
+        if isinstance(event.get("value"), dict):
+            await moderator.moderate(event["value"])
+    receiver.on("replies", on_reply)
+
+
+def read_replies(path):
+    """Yields replies from a JSONL file, or stdin for "-"."""
+    file = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+async def moderate_stream(replies, base_url, account, concurrency, dry_run):
+    client = ThreadsClient(base_url, max_connections=concurrency)
+    moderator = ReplyModerator(BlocklistMatcher(), client, account, concurrency, dry_run)
+    try:
+        for reply in replies:
+            await moderator.moderate(reply)
+        await moderator.drain()
+    finally:
+        await client.aclose()
+        await aflush()
+    return moderator.stats
+
+
+def synthetic_replies(count, seed=7):
+    """Reply-like texts, about one in ten containing an obfuscated blocklist term."""
+    rng = random.Random(seed)
+    words = ("love", "this", "so", "true", "omg", "haha", "same", "girl", "you", "are", "cute", "wow", "fr",
+             "no", "way", "❤️", "😂", "🔥", "literally", "me", "when", "he", "texts", "back", "tbh")
+    bad = ("ch3ck my b1o", "FREE  followers", "k\u200bys", "💰💰", "🍆", "idioooot", "ｏｎｌｙｆａｎｓ")
+    replies = []
+    for index in range(count):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(3, 18)))
+        if rng.random() < 0.1:
+            text += " " + rng.choice(bad)
+        replies.append({"id": str(18_000_000_000_000_000 + index), "text": text, "username": f"user{index % 977}"})
+    return replies
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Hide spam and abusive replies using the moderation blocklists")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    check_parser = subcommands.add_parser("check", help="Show what the blocklists match in some text")
+    check_parser.add_argument("texts", nargs="+")
+    moderate_parser = subcommands.add_parser("moderate", help="Moderate replies from a JSONL file or stdin")
+    moderate_parser.add_argument("replies", help="JSONL of {\"id\", \"text\", \"username\"}, or - for stdin")
+    moderate_parser.add_argument("--concurrency", type=int, default=MODERATION_CONCURRENCY)
+    moderate_parser.add_argument("--dry-run", action="store_true", help="Report matches without hiding")
+    moderate_parser.add_argument("--fake-api", action="store_true", help="Hide against a local fake Graph API")
+    bench_parser = subcommands.add_parser("bench", help="Measure matcher throughput on synthetic replies")
+    bench_parser.add_argument("--replies", type=int, default=100_000)
+    subcommands.add_parser("build", help="Rebuild the cached automaton")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        matcher = BlocklistMatcher()
+        for text in args.texts:
+            matches = matcher.search(text)
+            print(f"{'❌' if matches else '✅'} {text!r} -> {normalize(text)!r}"
+                  + (f"  {', '.join(f'{term} ({category})' for term, category in matches)}" if matches else ""))
+    elif args.command == "moderate":
+        server = None
+        if args.fake_api:
+            from load_test import start_fake_api
+            server, base_url = start_fake_api({"sigma": 0.2, "latency_scale": 0.5})
+            account = Account("1000000", "fake-token")
+        else:
+            base_url = f"https://{os.environ['THREADS_BASE_URL']}"
+            account = Account(os.environ['THREADS_USER_ID'], os.environ['THREADS_ACCESS_TOKEN'])
+        start = time.perf_counter()
+        try:
+            stats = asyncio.run(moderate_stream(read_replies(args.replies), base_url, account,
+                                                args.concurrency, args.dry_run))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.join()
+        elapsed = time.perf_counter() - start
+        print(f"✅ Scanned {stats['scanned']} replies in {elapsed:.2f}s: {stats['flagged']} flagged, "
+              f"{stats['hidden']} hidden, {stats['hide_errors']} hide errors")
+        if stats["categories"]:
+            print("   " + ", ".join(f"{name}={count}" for name, count in sorted(stats["categories"].items())))
+    elif args.command == "bench":
+        start = time.perf_counter()
+        matcher = BlocklistMatcher()
+        loaded = time.perf_counter() - start
+        replies = synthetic_replies(args.replies)
+        characters = sum(len(reply["text"]) for reply in replies)
+        start = time.perf_counter()
+        flagged = sum(1 for reply in replies if matcher.search(reply["text"]))
+        elapsed = time.perf_counter() - start
+        print(f"Automaton: {len(matcher.terms)} terms, {len(matcher.delta)} states, "
+              f"{'loaded from cache' if matcher.from_cache else 'built'} in {loaded * 1000:.1f} ms")
+        print(f"✅ {len(replies) / elapsed:,.0f} replies/s ({characters / elapsed / 1e6:.1f} M chars/s), "
+              f"{flagged} of {len(replies)} flagged")
+    else:
+        try:
+            os.remove(MODERATION_CACHE)
+        except FileNotFoundError:
+            pass
+        matcher = BlocklistMatcher()
+        print(f"✅ Built {len(matcher.delta)}-state automaton for {len(matcher.terms)} terms -> {MODERATION_CACHE}")
@@ -0,0 +1,263 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from structured_log import get_logger
+
+# On Actions each workflow restores and saves its own THREADS/.history (actions/cache) and uploads
+# the database as a run-history-<type> artifact, so a report there covers that workflow's runs;
+# a report across post types needs a long-lived host, or THREADS_HISTORY_DB pointed at each artifact.
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".history")
+THREADS_HISTORY_DB = os.environ.get('THREADS_HISTORY_DB', os.path.join(HISTORY_DIR, "run_history.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    post_type TEXT NOT NULL,
+    result TEXT NOT NULL,
+    error_class TEXT,
+    retries INTEGER NOT NULL DEFAULT 0,
+    fallbacks TEXT,
+    total_ms INTEGER NOT NULL,
+    post_id TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (started_at, post_type);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    PRIMARY KEY (run_id, phase)
+) WITHOUT ROWID;
+"""
+
+PERCENTILES = (50, 95, 99)
+
+log = get_logger("run_history")
+
+
+def open_history(path=THREADS_HISTORY_DB):
+    """Opens (and creates if needed) the run history database."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+class RunRecorder:
+    """
+    Collects per-phase durations, retries and fallbacks for one post and stores them on finish.
+
+    Parameters:
+        post_type (str): text, poll, image, video, ...
+    """
+
+    def __init__(self, post_type):
+        self.post_type = post_type
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.phases = {}
+        self.last_phase = None
+        self.retries = 0
+        self.fallbacks = []
+        self.post_id = None
+        # Set by runs that succeed without publishing anything, e.g. origin pre-warming
+        self.ok = False
+
+    @contextmanager
+    def phase(self, name):
+        self.last_phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self, error=None, path=THREADS_HISTORY_DB):
+        """
+        Writes the run. A missing post ID without an exception is classified by the
+        last phase that was entered, e.g. "create_container_failed".
+        """
+        if self.post_id:
+            result, error_class = "published", None
+        elif self.ok and error is None:
+            result, error_class = "ok", None
+        elif error is not None:
+            result, error_class = "error", type(error).__name__
+        else:
+            result, error_class = "failed", f"{self.last_phase or 'run'}_failed"
+        total_ms = int((time.perf_counter() - self._start) * 1000)
+        try:
+            db = open_history(path)
+            with db:
+                cursor = db.execute(
+                    "INSERT INTO runs (started_at, post_type, result, error_class, retries, fallbacks, total_ms, post_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.started_at, self.post_type, result, error_class, self.retries,
+                     ",".join(self.fallbacks) or None, total_ms, self.post_id)
+                )
+                db.executemany(
+                    "INSERT INTO phases (run_id, phase, duration_ms) VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, name, int(seconds * 1000)) for name, seconds in self.phases.items()]
+                )
+            db.close()
+        except sqlite3.Error as e:
+            log.warning("Could not record run history", error=str(e))
+        return result
+
+
+# The run being recorded in this process; phase()/note_*() are no-ops without one.
+current_run = None
+
+
+@contextmanager
+def recorded_run(post_type):
+    """
+    Records everything inside the block as one run of `post_type`.
+    Set `run.post_id` inside the block when the post is published.
+    """
+    global current_run
+    run = current_run = RunRecorder(post_type)
+    try:
+        yield run
+    except BaseException as e:
+        run.finish(error=e)
+        raise
+    else:
+        run.finish()
+    finally:
+        current_run = None
+
+
+@contextmanager
+def phase(name):
+    """Times a phase of the current run."""
+    if current_run is None:
+        yield
+    else:
+        with current_run.phase(name):
+            yield
+
+
+def note_retry():
+    if current_run is not None:
+        current_run.retries += 1
+
+
+def note_fallback(name):
+    if current_run is not None:
+        current_run.fallbacks.append(name)
+
+
+def parse_since(value):
+    """Accepts 7d / 12h / 30m offsets or an ISO date and returns a timestamp."""
+    match = re.fullmatch(r"(\d+)([dhm])", value)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        return time.time() - amount * {"d": 86400, "h": 3600, "m": 60}[unit]
+    return datetime.fromisoformat(value).timestamp()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def report(since, until=None, post_type=None, path=THREADS_HISTORY_DB):
+    """
+    Aggregates the runs in a time window.
+
+    Returns:
+        dict: Per post type: run counts, success rate, phase percentiles,
+        failure and fallback breakdowns.
+    """
+    db = open_history(path)
+    where, params = ["started_at >= ?"], [since]
+    if until is not None:
+        where.append("started_at < ?")
+        params.append(until)
+    if post_type:
+        where.append("post_type = ?")
+        params.append(post_type)
+    clause = " AND ".join(where)
+
+    summary = {}
+    for kind, result, count in db.execute(
+        f"SELECT post_type, result, COUNT(*) FROM runs WHERE {clause} GROUP BY post_type, result", params
+    ):
+        entry = summary.setdefault(kind, {"runs": 0, "published": 0, "phases": {}, "errors": {}, "fallbacks": {}, "retries": 0})
+        entry["runs"] += count
+        if result in ("published", "ok"):
+            entry["published"] += count
+
+    durations = {}
+    for kind, name, duration in db.execute(
+        f"SELECT r.post_type, p.phase, p.duration_ms FROM phases p JOIN runs r ON r.id = p.run_id "
+        f"WHERE {clause.replace('started_at', 'r.started_at').replace('post_type', 'r.post_type')} "
+        f"ORDER BY p.duration_ms", params
+    ):
+        durations.setdefault((kind, name), []).append(duration)
+    for kind, total in db.execute(
+        f"SELECT post_type, total_ms FROM runs WHERE {clause} ORDER BY total_ms", params
+    ):
+        durations.setdefault((kind, "total"), []).append(total)
+    for (kind, name), values in durations.items():
+        summary[kind]["phases"][name] = {"n": len(values), **{f"p{p}": percentile(values, p) for p in PERCENTILES}}
+
+    for kind, error_class, count in db.execute(
+        f"SELECT post_type, error_class, COUNT(*) FROM runs WHERE {clause} AND error_class IS NOT NULL "
+        f"GROUP BY post_type, error_class ORDER BY COUNT(*) DESC", params
+    ):
+        summary[kind]["errors"][error_class] = count
+    for kind, fallbacks, retries in db.execute(
+        f"SELECT post_type, fallbacks, retries FROM runs WHERE {clause}", params
+    ):
+        summary[kind]["retries"] += retries
+        for name in (fallbacks or "").split(","):
+            if name:
+                summary[kind]["fallbacks"][name] = summary[kind]["fallbacks"].get(name, 0) + 1
+    db.close()
+    return summary
+
+
+def print_report(summary):
+    if not summary:
+        print("No runs recorded in this window.")
+        return
+    for kind, entry in sorted(summary.items()):
+        rate = entry["published"] / entry["runs"] if entry["runs"] else 0.0
+        print(f"\n== {kind}: {entry['runs']} runs, {rate:.1%} published, {entry['retries']} retries ==")
+        print(f"  {'phase':<18}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        phases = sorted(entry["phases"].items(), key=lambda item: (item[0] == "total", item[0]))
+        for name, stats in phases:
+            print(f"  {name:<18}{stats['n']:>6}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}")
+        if entry["errors"]:
+            print("  failures: " + ", ".join(f"{name}={count}" for name, count in entry["errors"].items()))
+        if entry["fallbacks"]:
+            print("  fallbacks: " + ", ".join(f"{name}={count}" for name, count in entry["fallbacks"].items()))
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Report latency percentiles and success rates of past runs")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    report_parser = subcommands.add_parser("report")
+    report_parser.add_argument("--since", default="30d", help="7d, 12h, 30m or an ISO date (default: 30d)")
+    report_parser.add_argument("--until", help="ISO date or offset; default now")
+    report_parser.add_argument("--type", help="Only this post type")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        start = time.perf_counter()
+        summary = report(parse_since(args.since), parse_since(args.until) if args.until else None, args.type)
+        print_report(summary)
+        print(f"\n(query took {(time.perf_counter() - start) * 1000:.1f} ms)")
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+
+from backfill import prepare_slot
+from content_planner import read_prompts
+from load_test import POST_TYPES, run_post, start_fake_api
+from run_history import RunRecorder
+from threads_client import Account, GraphAPIError, ThreadsClient
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+VIRTUAL_NODES = 160
+# Posts a shard asks the coordinator for at a time; larger batches mean fewer round trips
+GRANT_BATCH = 32
+
+
+def _ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring mapping account IDs to shards.
+
+    Adding or removing a shard only moves the accounts on its arcs, so per-shard
+    caches and connection pools stay warm when the pool is resized.
+
+    Parameters:
+        shards (int): Number of shards.
+        vnodes (int): Virtual nodes per shard; more means a more even split.
+    """
+
+    __slots__ = ("hashes", "owners")
+
+    def __init__(self, shards, vnodes=VIRTUAL_NODES):
+        points = sorted((_ring_hash(f"shard-{shard}#{node}"), shard) for shard in range(shards) for node in range(vnodes))
+        self.hashes = array("Q", (point for point, _ in points))
+        self.owners = array("H", (shard for _, shard in points))
+
+    def shard_for(self, key):
+        index = bisect.bisect(self.hashes, _ring_hash(key))
+        return self.owners[index % len(self.owners)]
+
+
+class AccountTable:
+    """
+    Column-oriented per-account state.
+
+    Numeric fields live in typed arrays (one machine word or less per account)
+    instead of one object per account, which keeps 100k accounts to a few MB and
+    makes shards cheap to pickle to worker processes.
+    """
+
+    __slots__ = ("user_ids", "tokens", "counters", "published", "failed", "last_post_at")
+
+    def __init__(self):
+        self.user_ids = array("Q")
+        self.tokens = []
+        self.counters = array("I")
+        self.published = array("I")
+        self.failed = array("H")
+        self.last_post_at = array("d")
+
+    def append(self, user_id, access_token, counter=0):
+        self.user_ids.append(int(user_id))
+        self.tokens.append(access_token)
+        self.counters.append(counter)
+        self.published.append(0)
+        self.failed.append(0)
+        self.last_post_at.append(0.0)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def account(self, index):
+        return Account(str(self.user_ids[index]), self.tokens[index])
+
+    def nbytes(self):
+        arrays = (self.user_ids, self.counters, self.published, self.failed, self.last_post_at)
+        return (sum(column.itemsize * len(column) for column in arrays)
+                + sys.getsizeof(self.tokens) + sum(sys.getsizeof(token) for token in self.tokens))
+
+    def partition(self, ring, shards):
+        """Splits the table into one AccountTable per shard."""
+        parts = [AccountTable() for _ in range(shards)]
+        for index in range(len(self)):
+            part = parts[ring.shard_for(str(self.user_ids[index]))]
+            part.append(self.user_ids[index], self.tokens[index], self.counters[index])
+        return parts
+
+    @classmethod
+    def load_jsonl(cls, path):
+        """Reads {"user_id", "access_token", "counter"} lines."""
+        table = cls()
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    row = json.loads(line)
+                    table.append(row["user_id"], row["access_token"], row.get("counter", 0))
+        return table
+
+    @classmethod
+    def synthetic(cls, count):
+        table = cls()
+        for i in range(count):
+            table.append(1_000_000 + i, f"load-test-token-{i}")
+        return table
+
+
+async def run_production_post(client, account, post_type, counter, prompts, media_bases):
+    """
+    One post for a real account, the way the posting scripts make it: a model
+    caption (local fallback), media from RENDER_BASE_*_URL checked against Threads'
+    limits, a container polled until it is ready, then a single publish.
+    """
+    slot = {"slot": datetime.now(timezone.utc).isoformat(), "type": post_type, "counter": counter}
+    # posted_media.tsv is the main account's history; sharded accounts are not checked against it
+    container_id, _, _ = await prepare_slot(client, account, slot, RunRecorder(post_type), prompts, media_bases,
+                                            dedup=False)
+    return await client.publish(account, container_id)
+
+
+class QuotaCoordinator:
+    """
+    Hands out posting quota to shards from one global budget.
+
+    Shards ask for a batch of posts and get back at most what is left of
+    `total` and what the `rate` token bucket allows; 0 tells a shard to stop.
+    The bucket holds at least one post, so rates below 1/s still grant one
+    post at a time. A negative request hands unused posts back.
+
+    Parameters:
+        total (int): Posts allowed across all shards, None for unlimited.
+        rate (float): Posts per second across all shards, None for unlimited.
+    """
+
+    def __init__(self, total=None, rate=None):
+        self.remaining = total
+        self.rate = rate
+        self.capacity = max(1.0, rate) if rate else None
+        self.tokens = self.capacity or 0.0
+        self.refilled_at = time.monotonic()
+        self.granted = 0
+
+    def grant(self, wanted):
+        if self.remaining is not None:
+            wanted = min(wanted, self.remaining)
+        if wanted and self.rate:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                if self.tokens >= 1:
+                    break
+                time.sleep((1 - self.tokens) / self.rate)
+            wanted = min(wanted, int(self.tokens))
+            self.tokens -= wanted
+        if self.remaining is not None:
+            self.remaining -= wanted
+        self.granted += wanted
+        return wanted
+
+    def release(self, unused):
+        """Takes back posts a shard was granted but had no job left for."""
+        if self.remaining is not None:
+            self.remaining += unused
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + unused)
+        self.granted -= unused
+
+    def serve(self, requests, replies):
+        """Answers (shard, wanted) requests until a None sentinel arrives; negative `wanted` is a release."""
+        while True:
+            message = requests.get()
+            if message is None:
+                return
+            shard, wanted = message
+            if wanted < 0:
+                self.release(-wanted)
+            else:
+                replies[shard].put(self.grant(wanted))
+
+
+async def _run_shard(shard, table, options, requests, replies):
+    client = ThreadsClient(options["base_url"], max_connections=options["connections"], backoff=0.2)
+    types = options["types"]
+    # Load-test content only ever goes to the fake API
+    prompts = read_prompts(set(types)) if options["real"] else None
+    loop = asyncio.get_running_loop()
+    budget = 0
+    exhausted = False
+    budget_lock = asyncio.Lock()
+    jobs = asyncio.Queue()
+    for round_index in range(options["posts_per_account"]):
+        for index in range(len(table)):
+            jobs.put_nowait((index, types[(index + round_index) % len(types)]))
+    errors = {}
+
+    async def acquire():
+        nonlocal budget, exhausted
+        async with budget_lock:
+            if budget == 0 and not exhausted:
+                requests.put((shard, GRANT_BATCH))
+                granted = await loop.run_in_executor(None, replies.get)
+                # A worker may have handed a post back while this one waited
+                budget += granted
+                exhausted = granted == 0
+            if budget == 0:
+                return False
+            budget -= 1
+            return True
+
+    async def worker():
+        nonlocal budget
+        while not jobs.empty():
+            # Quota first, so a job is only taken off the queue once it can run
+            if not await acquire():
+                return
+            if jobs.empty():
+                budget += 1
+                return
+            index, post_type = jobs.get_nowait()
+            try:
+                if options["real"]:
+                    post_id = await run_production_post(client, table.account(index), post_type,
+                                                        table.counters[index] + 1, prompts, options["media_bases"])
+                else:
+                    post_id = await run_post(client, table.account(index), post_type,
+                                             table.counters[index] + 1, options["processing_wait"])
+            except GraphAPIError as e:
+                errors[f"http_{e.status}"] = errors.get(f"http_{e.status}", 0) + 1
+                post_id = None
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                post_id = None
+            if post_id:
+                table.published[index] += 1
+                table.counters[index] += 1
+                table.last_post_at[index] = time.time()
+            else:
+                table.failed[index] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(options["concurrency"])))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    if budget:
+        requests.put((shard, -budget))
+    return {
+        "shard": shard,
+        "accounts": len(table),
+        "published": sum(table.published),
+        "failed": sum(table.failed),
+        # Jobs left when the quota ran out
+        "skipped": jobs.qsize(),
+        "elapsed_s": elapsed,
+        "errors": errors,
+        "client": dict(client.stats),
+        "state_bytes": table.nbytes(),
+    }
+
+
+def shard_worker(shard, table, options, requests, replies, results):
+    """Process entry point: one asyncio event loop per shard."""
+    try:
+        summary = asyncio.run(_run_shard(shard, table, options, requests, replies[shard]))
+    except Exception as e:
+        summary = {"shard": shard, "accounts": len(table), "published": 0, "failed": len(table), "skipped": 0,
+                   "elapsed_s": 0.0, "errors": {type(e).__name__: 1}, "client": {}, "state_bytes": table.nbytes()}
+    results.put(summary)
+
+
+def run_sharded(table, shards, options, total=None, rate=None):
+    """
+    Partitions `table` across `shards` worker processes and runs them under one quota.
+
+    Returns:
+        dict: Aggregate and per-shard results.
+    """
+    ring = HashRing(shards)
+    parts = table.partition(ring, shards)
+    context = multiprocessing.get_context()
+    requests = context.Queue()
+    replies = [context.Queue() for _ in range(shards)]
+    results = context.Queue()
+    coordinator = QuotaCoordinator(total, rate)
+    coordinator_thread = threading.Thread(target=coordinator.serve, args=(requests, replies), daemon=True)
+    coordinator_thread.start()
+
+    start = time.perf_counter()
+    workers = [
+        context.Process(target=shard_worker, args=(shard, parts[shard], options, requests, replies, results))
+        for shard in range(shards)
+    ]
+    for worker in workers:
+        worker.start()
+    shard_results = []
+    while len(shard_results) < shards:
+        try:
+            shard_results.append(results.get(timeout=1.0))
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    requests.put(None)
+    coordinator_thread.join()
+
+    published = sum(result["published"] for result in shard_results)
+    return {
+        "shards": sorted(shard_results, key=lambda result: result["shard"]),
+        "published": published,
+        "failed": sum(result["failed"] for result in shard_results),
+        "skipped": sum(result["skipped"] for result in shard_results),
+        "granted": coordinator.granted,
+        "elapsed_s": elapsed,
+        "posts_per_s": published / elapsed if elapsed else 0.0,
+        "state_bytes": table.nbytes(),
+        "accounts": len(table),
+    }
+
+
+def print_summary(summary):
+    print(f"\n{'shard':>6}{'accounts':>10}{'published':>11}{'failed':>8}{'posts/s':>9}{'retries':>9}  errors")
+    for result in summary["shards"]:
+        rate = result["published"] / result["elapsed_s"] if result["elapsed_s"] else 0.0
+        errors = ", ".join(f"{name}={count}" for name, count in result["errors"].items()) or "-"
+        print(f"{result['shard']:>6}{result['accounts']:>10}{result['published']:>11}{result['failed']:>8}"
+              f"{rate:>9.1f}{result['client'].get('retries', 0):>9}  {errors}")
+    print(f"\nPublished {summary['published']} posts ({summary['granted']} granted, {summary['skipped']} skipped) "
+          f"in {summary['elapsed_s']:.1f}s: {summary['posts_per_s']:.1f} posts/s")
+    print(f"Account state: {summary['state_bytes'] / 1024 / 1024:.1f} MiB for {summary['accounts']} accounts "
+          f"({summary['state_bytes'] / max(1, summary['accounts']):.0f} B/account)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run account workloads across a process pool")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--accounts-file", help="JSONL with user_id, access_token and optional counter")
+    source.add_argument("--synthetic", type=int, help="Generate this many synthetic accounts (fake API only)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Shard processes")
+    parser.add_argument("--concurrency", type=int, default=128, help="Concurrent posts per shard")
+    parser.add_argument("--connections", type=int, default=128, help="Connections per shard")
+    parser.add_argument("--posts-per-account", type=int, default=1)
+    parser.add_argument("--types", default="text,poll", help="Comma separated post types")
+    parser.add_argument("--quota", type=int, help="Total posts allowed across all shards")
+    parser.add_argument("--rate", type=float, help="Posts per second allowed across all shards")
+    parser.add_argument("--processing-wait", type=float, default=30.0,
+                        help="Video processing wait in seconds (fake API; real posts poll the container)")
+    parser.add_argument("--url", default="https://graph.threads.net", help="Graph API origin")
+    parser.add_argument("--fake-api", action="store_true", help="Start a local fake Graph API and post to it")
+    args = parser.parse_args()
+
+    types = [t.strip() for t in args.types.split(",") if t.strip() in POST_TYPES]
+    real = not (args.fake_api or args.synthetic)
+    media_bases = {"image": os.environ.get('RENDER_BASE_IMAGE_URL'), "video": os.environ.get('RENDER_BASE_VIDEO_URL')}
+    missing = [f"RENDER_BASE_{kind.upper()}_URL" for kind in ("image", "video") if kind in types and not media_bases[kind]]
+    if real and missing:
+        parser.error(f"Real accounts post the day's media; set {', '.join(missing)}")
+
+    table = AccountTable.load_jsonl(args.accounts_file) if args.accounts_file else AccountTable.synthetic(args.synthetic)
+    server = None
+    base_url = args.url
+    if not real:
+        server, base_url = start_fake_api({"latency_scale": 0.2, "rate_429": 0.01, "rate_5xx": 0.005, "retry_after": 0.5})
+
+    options = {
+        "base_url": base_url,
+        "real": real,
+        "media_bases": media_bases,
+        "types": types,
+        "posts_per_account": args.posts_per_account,
+        "concurrency": args.concurrency,
+        "connections": args.connections,
+        "processing_wait": args.processing_wait,
+    }
+    print(f"Sharding {len(table)} accounts across {args.workers} workers against {base_url}")
+    try:
+        print_summary(run_sharded(table, args.workers, options, args.quota, args.rate))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
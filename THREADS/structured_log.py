@@ -0,0 +1,283 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+# debug, info, warning or error
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info').lower()
+# json (one object per line) or text (for reading a terminal)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+# Append to this file instead of stderr
+LOG_FILE = os.environ.get('LOG_FILE')
+# Records are written in batches of this size, or after LOG_FLUSH_SECONDS, whichever comes first
+LOG_BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', '256'))
+LOG_FLUSH_SECONDS = float(os.environ.get('LOG_FLUSH_SECONDS', '0.5'))
+# Share of debug events kept; debug calls may pass their own `sample=`
+LOG_DEBUG_SAMPLE = float(os.environ.get('LOG_DEBUG_SAMPLE', '0.1'))
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+REDACTED = "[REDACTED]"
+# Query parameters and JSON keys whose values are credentials
+SECRET_NAMES = r"access_token|input_token|fb_exchange_token|client_secret|app_secret|api_key|password|verify_token"
+SECRET_PATTERNS = (
+    re.compile(rf"(?i)((?:{SECRET_NAMES})=)[^&\s\"'#\\]+"),
+    # "key": "value" in JSON, also when escaped inside another string, and 'key': 'value' in reprs
+    re.compile(rf"(?i)(\\?[\"'](?:{SECRET_NAMES})\\?[\"']\s*:\s*\\?[\"'])[^\"'\\]*"),
+    re.compile(r"(?i)(\bBearer\s+)[\w.~+/-]+=*"),
+)
+# Environment variables whose values are masked wherever they appear
+SECRET_ENV = re.compile(r"TOKEN|SECRET|KEY|PASSWORD")
+MIN_SECRET_LENGTH = 8
+
+_secrets = set()
+_secret_pattern = None
+
+
+def register_secret(value):
+    """Masks `value` in every later log line, e.g. a token obtained at runtime."""
+    global _secret_pattern
+    if value and len(value) >= MIN_SECRET_LENGTH and value not in _secrets:
+        _secrets.add(value)
+        _secret_pattern = re.compile("|".join(re.escape(secret) for secret in sorted(_secrets, key=len, reverse=True)))
+
+
+def register_env_secrets(environ=os.environ):
+    for name, value in environ.items():
+        if SECRET_ENV.search(name):
+            register_secret(value)
+
+
+def redact(text):
+    """Masks credential query parameters, JSON fields, bearer tokens and registered secrets."""
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(rf"\g<1>{REDACTED}", text)
+    if _secret_pattern is not None:
+        text = _secret_pattern.sub(REDACTED, text)
+    return text
+
+
+def format_json(record):
+    created, level, name, message, fields, exc = record
+    entry = {
+        "ts": datetime.fromtimestamp(created, timezone.utc).isoformat(timespec="milliseconds"),
+        "level": LEVEL_NAMES[level],
+        "logger": name,
+        "msg": message,
+    }
+    entry.update(fields)
+    if exc:
+        entry["exc"] = exc
+    return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def format_text(record):
+    created, level, name, message, fields, exc = record
+    line = f"{datetime.fromtimestamp(created):%H:%M:%S} {LEVEL_NAMES[level].upper():<7} {name}: {message}"
+    if fields:
+        line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+    if exc:
+        line += "\n" + exc.rstrip()
+    return line
+
+
+class LogWriter:
+    """
+    Formats and writes log records on a background thread.
+
+    Callers only append a tuple to a queue, so logging from the event loop or from
+    many posting threads never waits on JSON encoding, redaction or the terminal.
+    Records are written in batches of `buffer_size` or every `interval` seconds;
+    warnings and errors are written right away.
+
+    Parameters:
+        stream: Binary stream to write UTF-8 lines to.
+        formatter (callable): record -> str.
+        buffer_size (int): Records per write.
+        interval (float): Longest time a record waits in the buffer.
+    """
+
+    def __init__(self, stream, formatter=format_json, buffer_size=LOG_BUFFER_SIZE, interval=LOG_FLUSH_SECONDS):
+        self.stream = stream
+        self.formatter = formatter
+        self.buffer_size = buffer_size
+        self.interval = interval
+        self.stats = {"records": 0, "writes": 0, "sampled_out": 0}
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def put(self, record):
+        # A forked child (sharded_runner) inherits the queue but not the thread
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(record)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        pending, deadline = [], None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, threading.Event):
+                self._write(pending)
+                pending, deadline = [], None
+                item.set()
+                continue
+            if item is not None:
+                pending.append(item)
+                deadline = deadline or time.monotonic() + self.interval
+                if len(pending) < self.buffer_size and item[1] < WARNING:
+                    continue
+            self._write(pending)
+            pending, deadline = [], None
+
+    def _write(self, records):
+        if not records:
+            return
+        lines = []
+        for record in records:
+            try:
+                lines.append(redact(self.formatter(record)) + "\n")
+            except Exception as e:
+                lines.append(f"log record could not be formatted: {type(e).__name__}\n")
+        try:
+            self.stream.write("".join(lines).encode("utf-8"))
+            self.stream.flush()
+        except (OSError, ValueError):
+            return
+        self.stats["records"] += len(records)
+        self.stats["writes"] += 1
+
+    def flush(self, timeout=5.0):
+        """Blocks until every record queued so far is written."""
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    async def aflush(self, timeout=5.0):
+        """`flush` for coroutines; the event loop keeps running while the writer drains."""
+        await asyncio.to_thread(self.flush, timeout)
+
+
+class Logger:
+    """
+    Leveled logger with structured fields: `log.info("Post published", post_id=post_id)`.
+
+    Parameters:
+        name (str): Component name written with every record.
+        writer (LogWriter): Shared writer.
+        fields (dict): Fields added to every record, see `bind`.
+    """
+
+    __slots__ = ("name", "writer", "fields", "level")
+
+    def __init__(self, name, writer, fields=None, level=LEVELS.get(LOG_LEVEL, INFO)):
+        self.name = name
+        self.writer = writer
+        self.fields = fields or {}
+        self.level = level
+
+    def bind(self, **fields):
+        """A logger that adds `fields` (e.g. account=name) to every record."""
+        return Logger(self.name, self.writer, {**self.fields, **fields}, self.level)
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, message, exc=None, **fields):
+        if level < self.level:
+            return
+        if self.fields:
+            fields = {**self.fields, **fields}
+        self.writer.put((time.time(), level, self.name, message, fields, exc))
+
+    def debug(self, message, sample=None, **fields):
+        """Sampled: only `sample` (default LOG_DEBUG_SAMPLE) of the calls are kept."""
+        if DEBUG < self.level:
+            return
+        rate = LOG_DEBUG_SAMPLE if sample is None else sample
+        if rate < 1.0:
+            if random.random() >= rate:
+                self.writer.stats["sampled_out"] += 1
+                return
+            fields["sample_rate"] = rate
+        self.log(DEBUG, message, **fields)
+
+    def info(self, message, **fields):
+        self.log(INFO, message, **fields)
+
+    def warning(self, message, **fields):
+        self.log(WARNING, message, **fields)
+
+    def error(self, message, **fields):
+        self.log(ERROR, message, **fields)
+
+    def exception(self, message, **fields):
+        """`error` with the traceback of the exception being handled."""
+        self.log(ERROR, message, exc=traceback.format_exc(), **fields)
+
+
+class ForwardHandler(logging.Handler):
+    """Sends records of libraries using the logging module (httpx, openai) through the writer."""
+
+    def __init__(self, writer, level=logging.WARNING):
+        super().__init__(level)
+        self.writer = writer
+
+    def emit(self, record):
+        exc = self.formatter.formatException(record.exc_info) if record.exc_info and self.formatter else None
+        level = min(max(record.levelno // 10 * 10, DEBUG), ERROR)
+        self.writer.put((record.created, level, record.name, record.getMessage(), {}, exc))
+
+
+def _open_stream():
+    if LOG_FILE:
+        os.makedirs(os.path.dirname(os.path.abspath(LOG_FILE)), exist_ok=True)
+        return open(LOG_FILE, "ab", buffering=0)
+    return getattr(sys.stderr, "buffer", sys.stderr)
+
+
+writer = LogWriter(_open_stream(), format_text if LOG_FORMAT == "text" else format_json)
+register_env_secrets()
+_forward = ForwardHandler(writer)
+_forward.setFormatter(logging.Formatter())
+logging.getLogger().addHandler(_forward)
+atexit.register(writer.flush)
+
+
+def get_logger(name, **fields):
+    return Logger(name, writer, fields)
+
+
+def flush(timeout=5.0):
+    writer.flush(timeout)
+
+
+async def aflush(timeout=5.0):
+    await writer.aflush(timeout)
@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import profiling
+import run_history
+from caption_filter import normalize_caption
+from crosspost import CROSSPOST_POLL_INTERVAL, CROSSPOST_PROCESSING_TIMEOUT
+from structured_log import get_logger
+from threads_client import Account, ThreadsClient, wait_until_ready
+
+sys.stdout.reconfigure(encoding='utf-8')
+log = get_logger("chain")
+
+PART_TYPES = ("text", "image", "carousel")
+# Parts whose containers must finish processing before they can be published
+MEDIA_PART_TYPES = ("image", "carousel")
+
+
+def load_parts(path):
+    """
+    Reads chain parts from a JSON list or JSONL file.
+
+    Each part is {"type": "text"|"image"|"carousel", "text": ..., "image_url": ...,
+    "image_urls": [...]}; the type defaults to text.
+    """
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+    stripped = content.lstrip()
+    parts = json.loads(content) if stripped.startswith("[") else [json.loads(line) for line in content.splitlines() if line.strip()]
+    for index, part in enumerate(parts):
+        part.setdefault("type", "text")
+        if part["type"] not in PART_TYPES:
+            raise ValueError(f"Part {index + 1}: unknown type {part['type']!r}")
+        if part["type"] == "image" and not part.get("image_url"):
+            raise ValueError(f"Part {index + 1}: image parts need image_url")
+        if part["type"] == "carousel" and len(part.get("image_urls") or []) < 2:
+            raise ValueError(f"Part {index + 1}: carousel parts need at least two image_urls")
+        if part["type"] == "text" and not part.get("text"):
+            raise ValueError(f"Part {index + 1}: text parts need text")
+    return parts
+
+
+async def _create_part_container(client, account, part, reply_to_id=None):
+    media_type = {"text": "TEXT", "image": "IMAGE", "carousel": "CAROUSEL"}[part["type"]]
+    return await client.create_container(
+        account, media_type, text=part.get("text"), image_url=part.get("image_url"),
+        children=part.get("children"), reply_to_id=reply_to_id
+    )
+
+
+async def _wait_ready(client, account, container_id):
+    await wait_until_ready(client, account, container_id, CROSSPOST_POLL_INTERVAL, CROSSPOST_PROCESSING_TIMEOUT)
+
+
+async def prepare_part(client, account, part, first):
+    """
+    Does everything for a part that doesn't depend on the previous post: normalizes the
+    text, creates carousel item containers and waits for them to process and, for the
+    first part, creates its own container and waits until it can be published.
+    """
+    prepared = dict(part)
+    if prepared.get("text"):
+        prepared["text"] = normalize_caption(prepared["text"])
+    if prepared["type"] == "carousel":
+        prepared["children"] = list(await asyncio.gather(*(
+            client.create_container(account, "IMAGE", image_url=url, is_carousel_item=True)
+            for url in prepared["image_urls"]
+        )))
+        await asyncio.gather(*(_wait_ready(client, account, child) for child in prepared["children"]))
+    if first:
+        prepared["container_id"] = await _create_part_container(client, account, prepared)
+        if prepared["type"] in MEDIA_PART_TYPES:
+            await _wait_ready(client, account, prepared["container_id"])
+    return prepared
+
+
+async def publish_chain(client, account, parts):
+    """
+    Publishes `parts` as a chain of self-replies.
+
+    reply_to_id is a container creation parameter, so each reply's top-level container
+    is created right after its parent is published; everything else (text
+    normalization, carousel items, the root container) is created concurrently up
+    front. A text part costs one create and one publish round trip; image and
+    carousel containers are polled until FINISHED first, since Threads refuses to
+    publish a media container that is still processing.
+
+    Returns:
+        list: Post IDs in chain order.
+    """
+    with run_history.phase("prepare"):
+        prepared = await asyncio.gather(*(
+            prepare_part(client, account, part, index == 0) for index, part in enumerate(parts)
+        ))
+
+    post_ids = []
+    with run_history.phase("publish"):
+        for index, part in enumerate(prepared):
+            start = time.perf_counter()
+            container_id = part.get("container_id")
+            if container_id is None:
+                container_id = await _create_part_container(client, account, part, reply_to_id=post_ids[-1])
+                if part["type"] in MEDIA_PART_TYPES:
+                    await _wait_ready(client, account, container_id)
+            post_ids.append(await client.publish(account, container_id))
+            log.info("Part published", part=f"{index + 1}/{len(prepared)}", post_id=post_ids[-1],
+                     seconds=round(time.perf_counter() - start, 2))
+    return post_ids
+
+
+async def run_chain(base_url, account, parts):
+    client = ThreadsClient(base_url, max_connections=16)
+    try:
+        return await publish_chain(client, account, parts)
+    finally:
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish a multi-part thread chain of self-replies")
+    parser.add_argument("parts", help="JSON list or JSONL file of parts")
+    parser.add_argument("--fake-api", action="store_true", help="Publish to a local fake Graph API instead")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write cProfile and tracemalloc artifacts next to the run history")
+    args = parser.parse_args()
+
+    parts = load_parts(args.parts)
+    server = None
+    if args.fake_api:
+        from load_test import start_fake_api
+        server, base_url = start_fake_api({"sigma": 0.2})
+        account = Account("1000000", "fake-token")
+    else:
+        base_url = f"https://{os.environ['THREADS_BASE_URL']}"
+        account = Account(os.environ['THREADS_USER_ID'], os.environ['THREADS_ACCESS_TOKEN'])
+
+    start = time.perf_counter()
+    try:
+        with profiling.profiled("chain", args.profile), run_history.recorded_run("chain") as run:
+            post_ids = asyncio.run(run_chain(base_url, account, parts))
+            run.post_id = post_ids[0] if len(post_ids) == len(parts) else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+    print(f"✅ Published {len(post_ids)}-part chain in {time.perf_counter() - start:.2f}s, root post {post_ids[0]}")
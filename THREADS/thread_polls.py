@@ -1,16 +1,21 @@
-import http.client
+import argparse
 import urllib.parse
 import json
 import time
-import sys
-import io
 import os
-import random
-from openai import OpenAI
+from llm_client import complete_chat, mark_caption_used
+from caption_grammar import generate_poll
+from content_catalog import random_poll
+from content_planner import claim_slot, finish_slot
+from graph_transport import open_connection
+from poll_schema import POLL_REPAIR_MAX_TOKENS, POLL_RESPONSE_FORMAT, parse_poll, poll_json
+from prompt_assembler import themed_prompt
+from structured_log import get_logger, register_secret
+import profiling
+import run_history
 from datetime import datetime
 
-# Set the standard output to handle UTF-8
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+log = get_logger("poll")
 
 # Define your access token, Instagram account ID, and the video details
 # Get All required Tokens and Ids,
@@ -22,119 +27,9 @@ THREADS_ACCESS_TOKEN = os.environ['THREADS_ACCESS_TOKEN']
 BASE_URL = os.environ['THREADS_BASE_URL']
 THREADS_POLL_CAPTION_KEY = os.environ['THREADS_POLL_CAPTION_KEY']
 
-# Default polls list
-default_polls = [
-    {
-        "question": "Would you rather cuddle all night or kiss all night? 🛌💋",
-        "options": {
-            "option_a": "Cuddle 🛌",
-            "option_b": "Kiss 💋",
-        },
-    },
-    {
-        "question": "Guess what I’m wearing right now… 🤔",
-        "options": {
-            "option_a": "Something comfy 🩳",
-            "option_b": "Nothing at all 😏",
-            "option_c": "Your favorite color 🎨",
-        },
-    },
-    {
-        "question": "Be honest: You like it naughty or nice? 😈😇",
-        "options": {
-            "option_a": "Naughty 😈",
-            "option_b": "Nice 😇",
-        },
-    },
-    {
-        "question": "Who wants to help me pick tonight’s lingerie? 👀",
-        "options": {
-            "option_a": "Lace 🩲",
-            "option_b": "Silk 🧵",
-            "option_c": "Nothing 😏",
-        },
-    },
-    {
-        "question": "If I were your naughty secretary… what would you make me do? 🖋️📂",
-        "options": {
-            "option_a": "Take notes 📝",
-            "option_b": "Stay late 🕒",
-            "option_c": "Break all the rules 🚫",
-        },
-    },
-    {
-        "question": "Finish this: If we were on a date… 💑",
-        "options": {
-            "option_a": "We’d laugh all night 😂",
-            "option_b": "We’d get into trouble 😜",
-            "option_c": "We’d never want it to end ❤️",
-        },
-    },
-    {
-        "question": "Is it a red flag if a guy texts back too quickly? 🚩📱",
-        "options": {
-            "option_a": "Yes ✅",
-            "option_b": "No ❌",
-            "option_c": "Depends 🤔",
-        },
-    },
-    {
-        "question": "Big chest or big heart? ❤️💪",
-        "options": {
-            "option_a": "Big chest 💪",
-            "option_b": "Big heart ❤️",
-        },
-    },
-    {
-        "question": "Lace or leather tonight? 🩲🖤",
-        "options": {
-            "option_a": "Lace 🩲",
-            "option_b": "Leather 🖤",
-        },
-    },
-    {
-        "question": "Woke up feeling like trouble today. What should I do? 😈",
-        "options": {
-            "option_a": "Stay in bed 🛌",
-            "option_b": "Go out and slay 💃",
-        },
-    },
-    {
-        "question": "Truth or dare in comments? 🤔🎲",
-        "options": {
-            "option_a": "Truth 🗣️",
-            "option_b": "Dare 🎯",
-        },
-    },
-    {
-        "question": "What’s your favorite type of kiss? 😘",
-        "options": {
-            "option_a": "Soft and slow 💞",
-            "option_b": "Passionate 🔥",
-            "option_c": "Playful 😜",
-        },
-    },
-    {
-        "question": "What’s your ideal Friday night? 🎉🍷",
-        "options": {
-            "option_a": "Netflix & chill 📺🍿",
-            "option_b": "Party all night 🎉",
-            "option_c": "Dinner date 🍽️",
-        },
-    },
-    {
-        "question": "What’s your favorite way to flirt? 😉",
-        "options": {
-            "option_a": "Eye contact 👀",
-            "option_b": "Playful teasing 😏",
-            "option_c": "Compliments 💬",
-        },
-    }
-]
-
 def initialize_connection():
     """Initialize the HTTP connection to Instagram Graph API."""
-    return http.client.HTTPSConnection(BASE_URL)
+    return open_connection(BASE_URL)
 
 def get_gemini_caption(
     prompt: str,
@@ -142,7 +37,9 @@ def get_gemini_caption(
     base_url: str = "https://openrouter.ai/api/v1",
     model: str = "google/gemini-2.0-flash-exp:free",
     extra_headers: dict = None,
-    extra_body: dict = None
+    extra_body: dict = None,
+    max_tokens: int = 500,
+    response_format: dict = None
 ) -> str:
     """
     Uses OpenAI's SDK to get a text-only response from OpenRouter Gemini model.
@@ -154,39 +51,28 @@ def get_gemini_caption(
         model (str): Model name (default Gemini).
         extra_headers (dict): Optional extra headers for OpenRouter.
         extra_body (dict): Optional extra body for OpenRouter.
+        max_tokens (int): Maximum tokens in the reply.
+        response_format (dict): Structured output format, POLL_RESPONSE_FORMAT for polls.
 
     Returns:
         str: The model's reply.
     """
     try:
-        client = OpenAI(base_url=base_url, api_key=api_key)
-        response = client.chat.completions.create(
+        return complete_chat(
+            prompt,
+            api_key,
+            base_url=base_url,
             model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt}
-                    ]
-                }
-            ],
             temperature=0.7,
-            max_tokens=500,
-            extra_headers=extra_headers or {},
-            extra_body=extra_body or {}
+            max_tokens=max_tokens,
+            extra_headers=extra_headers,
+            extra_body=extra_body,
+            response_format=response_format
         )
-        return response.choices[0].message.content.strip()
     except Exception as e:
-        return f"Error: {e}"
-
-def filter_generated_text(text):
-    """
-    Filters the generated text to remove any unwanted content, such as special characters like * or **.
-    """
-    # Remove all occurrences of * and ** from the text
-    filtered_text = text.replace("*", "")
-    filtered_text = filtered_text.replace("\"", "")
-    return filtered_text
+        log.warning("Poll model unavailable, generating one locally.", error=str(e))
+        run_history.note_fallback("local_poll")
+        return poll_json(*generate_poll())
 
 def check_access_token(conn):
     """
@@ -198,23 +84,18 @@ def check_access_token(conn):
     conn.request("GET", endpoint)
     response = conn.getresponse()
     data = json.loads(response.read().decode('utf-8'))
-    print("check_access_token_response = ", data)
 
     expires_at = data["data"]["expires_at"]
-    print("expires_at = ",data["data"]["expires_at"])  
     token_expires_one = datetime.fromtimestamp(expires_at).strftime('%Y-%m-%d %H:%M:%S')
-    print("Token expires on:", token_expires_one)
     current_time = datetime.now().timestamp()  # Current timestamp in UTC
-    print("current_time = ",current_time)
     remaining_days = (expires_at - current_time) / 86400  # Convert seconds to days
-    print("remaining_days = ",int(remaining_days))
+    log.info("Access token checked", valid=data["data"].get("is_valid"), expires_on=token_expires_one,
+             remaining_days=int(remaining_days))
     
     # Check the token's validity
     if int(remaining_days) == 2:
-        print("Access token is invalid or expired. Refreshing...")
+        log.warning("Access token is invalid or expired. Refreshing...")
         refresh_access_token(conn)
-    else:
-        print("Access token is valid.")
 
 def refresh_access_token(conn):
     """Refresh the access token using the App credentials."""
@@ -228,16 +109,16 @@ def refresh_access_token(conn):
     conn.request("GET", f"/{THREADS_API_VERSION}/oauth/access_token?{params}")
     response = conn.getresponse()
     data = json.loads(response.read().decode("utf-8"))
-    print("refresh_access_token_response = ", data)
     if 'access_token' in data:
         new_access_token = data['access_token']
+        register_secret(new_access_token)
         update_env_file("INSTAGRAM_ACCESS_TOKEN", new_access_token)
-        print("Access token refreshed and updated in the .env file.")
+        log.info("Access token refreshed and updated in the .env file.")
         # Reload environment variables to update the token for the current session
         os.environ['INSTAGRAM_ACCESS_TOKEN'] = new_access_token
         ACCESS_TOKEN = new_access_token  # Update in-memory token
     else:
-        print("Failed to refresh access token:", data.get('error', 'Unknown error'))
+        log.error("Failed to refresh access token", error=data.get('error', 'Unknown error'))
 
 def update_env_file(key, value):
     """
@@ -265,7 +146,7 @@ def update_env_file(key, value):
     # Write back the updated content to the file
     with open(env_file, "w") as file:
         file.writelines(updated_lines)
-    print(f"Updated {key} in .env file.")
+    log.info("Updated .env file", key=key)
 
 
 
@@ -299,14 +180,13 @@ def create_poll_container(conn, TEXT, poll_options):
         data = res.read()
 
         if res.status != 200:
-            print(f"Error creating poll container: {res.status} {res.reason}")
-            print(data.decode("utf-8"))
+            log.error("Error creating poll container", status=res.status, reason=res.reason, body=data.decode("utf-8"))
             return None
 
         result = json.loads(data.decode("utf-8"))
         return result.get("id")
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        log.exception("Unexpected error creating poll container", error=str(e))
         return None
 
 def publish_media_container(conn, poll_container_id):
@@ -321,15 +201,14 @@ def publish_media_container(conn, poll_container_id):
     data = res.read()
 
     if res.status != 200:
-        print(f"Error publishing post: {res.status} {res.reason}")
-        print(data.decode("utf-8"))
+        log.error("Error publishing post", status=res.status, reason=res.reason, body=data.decode("utf-8"))
         return None
 
     result = json.loads(data.decode("utf-8"))
     return result.get("id")
 
 def read_prompt(prompt_file):
-    print (prompt_file)
+    log.info("Reading prompt", prompt_file=prompt_file)
     try:
         with open(prompt_file, "r", encoding="utf-8") as file:
             prompt = file.read()
@@ -339,101 +218,127 @@ def read_prompt(prompt_file):
     except Exception as e:
         return f"An error occurred: {e}"
     
-def parse_poll_output(text):
+def parse_poll_output(text, replies):
     """
-    Parses the OpenAI output to extract the question and options.
+    Validates the model's poll JSON, asking the model once to fix the fields that
+    break the schema.
 
     Parameters:
-        text (str): The text generated by OpenAI in the polling format.
+        text (str): The model's reply.
+        replies (list): Receives the repair reply, so it can be marked as used.
 
     Returns:
-        tuple: A tuple containing the question (str) and a dictionary of options.
+        tuple: The question (str) and a dictionary of options.
+
+    Raises:
+        ValueError: When the poll is still unusable after the repair.
     """
-    lines = text.splitlines()
-    question = None
-    options = {}
-
-    for line in lines:
-        if line.startswith("Question:"):
-            question = line.replace("Question:", "").strip()
-        elif line.startswith("Option A:"):
-            options["option_a"] = line.replace("Option A:", "").strip()
-        elif line.startswith("Option B:"):
-            options["option_b"] = line.replace("Option B:", "").strip()
-        elif line.startswith("Option C:"):
-            options["option_c"] = line.replace("Option C:", "").strip()
-        elif line.startswith("Option D:"):
-            options["option_d"] = line.replace("Option D:", "").strip()
-
-    if not question or len(options) < 2:
-        raise ValueError("Invalid poll format. Ensure at least a question and two options are provided.")
-
-    return question, options
+    def repair(prompt):
+        log.warning("Generated poll breaks the schema, asking for a repair", prompt=prompt)
+        run_history.note_fallback("poll_repair")
+        with run_history.phase("repair"):
+            reply = get_gemini_caption(prompt, THREADS_POLL_CAPTION_KEY, max_tokens=POLL_REPAIR_MAX_TOKENS,
+                                       response_format=POLL_RESPONSE_FORMAT)
+        replies.append(reply)
+        log.info("Poll repaired", text=reply)
+        return reply
+
+    return parse_poll(text, repair)
 
 def get_random_default_poll():
-    """Returns a random poll from the default polls list."""
-    poll = random.choice(default_polls)
-    return poll["question"], poll["options"]
-
-if __name__ == "__main__":
-    conn = initialize_connection()
-    prompt_file = 'THREADS/prompt_polls.txt'
-    user_prompt = read_prompt(prompt_file)
+    """Returns a rarely used poll from the polls catalog."""
+    return random_poll()
 
-    # Check and refresh access token before proceeding
-    print("ACCESS TOKEN = ", THREADS_ACCESS_TOKEN)
-    check_access_token(conn)
-    print("ACCESS TOKEN = ", THREADS_ACCESS_TOKEN)
+def create_and_publish_poll(conn, question, poll_options):
+    """
+    Creates a poll container and publishes it.
 
-    TEXT = get_gemini_caption(user_prompt, THREADS_POLL_CAPTION_KEY)
-    print("Generated TEXT:", TEXT)
-    TEXT = filter_generated_text(TEXT)
-    print("Filtered TEXT:", TEXT)
+    Returns:
+        str: The published post ID, or None on failure.
+    """
+    log.info("Creating poll container...")
+    with run_history.phase("create_container"):
+        poll_container_id = create_poll_container(conn, question, poll_options)
+    if not poll_container_id:
+        log.error("Failed to create poll container.")
+        return None
 
-    post_id = None
+    log.info("Poll container created", container_id=poll_container_id)
+    log.info("Publishing poll container...")
+    with run_history.phase("publish"):
+        post_id = publish_media_container(conn, poll_container_id)
+    if post_id:
+        log.info("Poll post published successfully", post_id=post_id)
+    else:
+        log.error("Failed to publish the poll post.")
+    return post_id
 
-    # Parse the OpenAI output
-    try:
-        question, poll_options = parse_poll_output(TEXT)
-        print("Parsed Question:", question)
-        print("Parsed Options:", poll_options)
+def publish_poll_post(conn, user_prompt, slot=None):
+    """
+    Generates a poll and publishes it, falling back to a default poll when the output can't be parsed.
 
-        # Create poll container
-        print("Creating poll container...")
-        poll_container_id = create_poll_container(conn, question, poll_options)
-        if poll_container_id:
-            print(f"Poll container created: {poll_container_id}")
-
-            print("Publishing poll container...")
-            post_id = publish_media_container(conn, poll_container_id)
-            if post_id:
-                print(f"✅ Poll post published successfully! Post ID: {post_id}")
-            else:
-                print("❌ Failed to publish the poll post.")
-        else:
-            print("❌ Failed to create poll container.")
+    Parameters:
+        conn: HTTP connection object.
+        user_prompt (str): Prompt sent to the caption model.
+        slot (dict): Planned calendar slot whose pre-generated poll is published instead.
 
+    Returns:
+        str: The published post ID, or None on failure.
+    """
+    if slot is not None:
+        log.info("Using planned poll", slot=slot["slot"], question=slot["caption"], options=slot["options"])
+        post_id = create_and_publish_poll(conn, slot["caption"], slot["options"])
+        if post_id:
+            mark_caption_used(slot["generated"])
+        return post_id
+
+    with run_history.phase("caption"), themed_prompt(user_prompt, "poll") as prompt:
+        generated_text = get_gemini_caption(prompt.text, THREADS_POLL_CAPTION_KEY,
+                                            response_format=POLL_RESPONSE_FORMAT)
+    log.info("Caption generated", text=generated_text)
+    replies = [generated_text]
+
+    # Parse and validate the poll JSON, then normalize the question and options
+    try:
+        with run_history.phase("normalize"):
+            question, poll_options = parse_poll_output(generated_text, replies)
+        log.info("Poll parsed", question=question, options=poll_options)
     except ValueError as e:
-        print(f"Error parsing poll output: {e}")
-        print("Using a default poll instead.")
+        log.warning("Error parsing poll output", error=str(e))
+        run_history.note_fallback("default_poll")
+        # Unparseable output must not be served from the cache again
+        for reply in replies:
+            mark_caption_used(reply)
+        log.info("Using a default poll instead.")
         question, poll_options = get_random_default_poll()
-        print("Default Question:", question)
-        print("Default Options:", poll_options)
-
-        # Create poll container with default poll
-        print("Creating poll container with default poll...")
-        poll_container_id = create_poll_container(conn, question, poll_options)
-        if poll_container_id:
-            print(f"Poll container created: {poll_container_id}")
-
-            print("Publishing poll container...")
-            post_id = publish_media_container(conn, poll_container_id)
-            if post_id:
-                print(f"✅ Poll post published successfully! Post ID: {post_id}")
-            else:
-                print("❌ Failed to publish the poll post.")
-        else:
-            print("❌ Failed to create poll container.")
+        log.info("Default poll", question=question, options=poll_options)
+        return create_and_publish_poll(conn, question, poll_options)
 
+    post_id = create_and_publish_poll(conn, question, poll_options)
     if post_id:
-        conn.close()
+        for reply in replies:
+            mark_caption_used(reply)
+    return post_id
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish a poll to Threads")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write cProfile and tracemalloc artifacts next to the run history")
+    args = parser.parse_args()
+
+    conn = initialize_connection()
+    prompt_file = 'THREADS/prompt_polls.txt'
+    user_prompt = read_prompt(prompt_file)
+
+    with profiling.profiled("poll", args.profile), run_history.recorded_run("poll") as run:
+        # Check and refresh access token before proceeding
+        with run_history.phase("token_check"):
+            check_access_token(conn)
+
+        with run_history.phase("calendar"):
+            slot = claim_slot("poll")
+        try:
+            run.post_id = publish_poll_post(conn, user_prompt, slot)
+        finally:
+            finish_slot(slot, run.post_id)
+    conn.close()
@@ -1,16 +1,21 @@
+import argparse
 import http.client
 import urllib.parse
 import json
 import time
-import sys
-import io
 import os
-import random
-from openai import OpenAI
+from llm_client import complete_chat, mark_caption_used
+from caption_grammar import generate_caption
+from caption_filter import normalize_caption, CaptionRejected
+from content_planner import claim_slot, finish_slot
+from graph_transport import open_connection
+from prompt_assembler import themed_prompt
+from structured_log import get_logger, register_secret
+import profiling
+import run_history
 from datetime import datetime
 
-# Set the standard output to handle UTF-8
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+log = get_logger("text")
 
 # Define your access token, Instagram account ID, and the video details
 # Get All required Tokens and Ids,
@@ -24,89 +29,7 @@ THREADS_TEXT_CAPTION_KEY = os.environ['THREADS_TEXT_CAPTION_KEY']
 
 def initialize_connection():
     """Initialize the HTTP connection to Instagram Graph API."""
-    return http.client.HTTPSConnection(BASE_URL)
-
-DEFAULT_THREADS = [
-    "Guess what I’m wearing right now… hint: it’s not much 😏🔥",
-    "Naughty or nice? Which version of me do you like more? 😉💋",
-    "If I whispered 'come over'… how fast would you be here? 🫣⏳",
-    "Which is more dangerous… my smile or my mind? 😈🖤",
-    "Honest answer: First thing you’d do if I invited you over? 👀",
-    "Would you kiss me first… or let me make the first move? 💋",
-    "Morning hugs or midnight cuddles — which is hotter? 🌅🛏️",
-    "If I sent you one flirty selfie right now… what would you do? 📸😉",
-    "Is teasing more fun… or giving in? 😏🔥",
-    "What’s more tempting — my voice or my eyes? 👀🎙️",
-    "Just got out of the shower… my towel is doing a terrible job 😅🛁",
-    "My bed feels too big tonight… anyone wanna fix that? 😏🛏️",
-    "Who wants to help me pick tonight’s lingerie? Lace or satin? 👙💭",
-    "My DMs are getting a little wild today… should I share? 👀💌",
-    "Currently eating strawberries… but they’d taste better off you 🍓💋",
-    "This dress is way too short… not that I’m complaining 😉👗",
-    "Sitting here bored… someone distract me 😈📱",
-    "Feeling cute tonight… maybe too cute 😏✨",
-    "About to take a bubble bath… care to join? 🛁🫧",
-    "Wearing his hoodie… and nothing else 🖤👀",
-    "Red flag if he replies 'k'? 🚩 or ❤️?",
-    "Lace or leather? Which is sexier on me? 👗🔥",
-    "Morning cuddles or midnight kisses? 🌅💋🌙",
-    "Sweet talker or rough talker — what gets you going? 🥵🗣️",
-    "Chocolate in bed… delicious or dangerous? 🍫🛏️",
-    "Texting or calling — which gets you more excited? 📱💬",
-    "Long slow kiss or quick heated one? 💋🔥",
-    "Soft hands or strong hands? 🫣✋",
-    "Beach date or rooftop drinks? 🏖️🍸",
-    "First kiss on the lips or the neck? 😏💋",
-    "Good morning, troublemakers 😈☀️ Who’s ready to misbehave today?",
-    "Woke up feeling dangerous… and I’m blaming you 😏🌅",
-    "Good night babes… or should I say bad night? 😉🌙",
-    "About to sleep… unless you text me something fun 🫣📱",
-    "Morning kisses >>> morning coffee 😘☕ Agree or not?",
-    "Good night… but my mind is still wide awake 😉🛏️",
-    "Woke up in your hoodie… and your scent’s still on it 🖤",
-    "Sun’s out, legs out ☀️💃",
-    "Who’s taking me out for brunch today? 🥞🥂",
-    "Sweet dreams… if you can after thinking of me 😈💭",
-    "I have a secret… but it’s not safe for Threads 😏🫢",
-    "Last night’s dream? Let’s just say I woke up blushing 😳💭",
-    "I once sent the wrong photo to the wrong person… and it was 🔥🙈",
-    "I have a habit of biting my lip when I’m thinking of something naughty…",
-    "Sometimes I wear his shirt to bed… sometimes I wear nothing at all 😏",
-    "My guilty pleasure? Late-night flirty chats 🖤📱",
-    "Once, I skipped a meeting for… let’s just say, more fun plans 😈",
-    "I’ve been thinking about someone all day… it might be you 😉",
-    "My heart races faster when I’m up to no good 😏💓",
-    "Not all my secrets are meant to be kept… some are meant to be found out 👀",
-    "If I were your naughty secretary… what would you make me do? 📎💼",
-    "POV: You walk in and see me wearing your hoodie and nothing else 👀",
-    "Imagine me as your personal trainer… what’s our first 'workout'? 🏋️‍♀️🔥",
-    "If I was the girl next door… you’d never sleep early 😉🏠",
-    "Tonight’s fantasy: me, you, candlelight, and no rules 😈🕯️",
-    "If I was your roommate… things would get interesting fast 😏",
-    "POV: I’m stuck at home… and you’re the only one who can keep me entertained 🖤",
-    "Imagine I’m your photographer… what’s our first shoot like? 📸🔥",
-    "You + me + rain outside = ? 🌧️💋",
-    "If I was your date tonight, what would we be doing right now? 😉",
-    "Finish this: If we were on a date…",
-    "Describe me using only 3 emojis 👀🔥💋",
-    "First word that comes to mind when you think of me? 🫣",
-    "If you could ask me anything… what would it be? 🖤",
-    "Tell me your favorite compliment you’ve ever given 👄",
-    "Describe your ideal night in 5 words 🛋️🍷🔥💋",
-    "What song reminds you of me? 🎶💭",
-    "Which emoji fits me best? 😈😉🖤",
-    "Tell me your go-to flirting line 😏💬",
-    "Truth or dare in comments — I’m playing 😏",
-    "First one to comment gets a personal question 👄",
-    "Dare me to post my next pic with no filter? 😜📸",
-    "Tell me your wildest fantasy… I won’t judge 😉",
-    "Comment a color… and I’ll tell you what I’d wear in it 💃",
-    "Double tap if you’d kiss me right now 💋",
-    "Dare me to text you something spicy? 🔥📱",
-    "I dare you to DM me your favorite emoji for me 😏",
-    "Tell me something you’ve never told anyone 👀",
-    "If you could spend 24 hours with me… dare or truth? 😉"
-]
+    return open_connection(BASE_URL)
 
 def get_gemini_caption(
     prompt: str,
@@ -131,34 +54,30 @@ def get_gemini_caption(
         str: The model's reply.
     """
     try:
-        client = OpenAI(base_url=base_url, api_key=api_key)
-        response = client.chat.completions.create(
+        return complete_chat(
+            prompt,
+            api_key,
+            base_url=base_url,
             model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt}
-                    ]
-                }
-            ],
             temperature=0.7,
             max_tokens=500,
-            extra_headers=extra_headers or {},
-            extra_body=extra_body or {}
+            extra_headers=extra_headers,
+            extra_body=extra_body
         )
-        return response.choices[0].message.content.strip()
     except Exception as e:
-        return random.choice(DEFAULT_THREADS)
+        log.warning("Caption model unavailable, generating one locally.", error=str(e))
+        run_history.note_fallback("local_caption")
+        return generate_caption("thread")
 
 def filter_generated_text(text):
     """
-    Filters the generated text to remove any unwanted content, such as special characters like * or **.
+    Normalizes the generated text before any network call: strips markdown, quotes and
+    model chatter, trims to the Threads length limit without splitting emoji.
+
+    Raises:
+        CaptionRejected: For refusals, leaked prompt text or empty output.
     """
-    # Remove all occurrences of * and ** from the text
-    filtered_text = text.replace("*", "")
-    filtered_text = filtered_text.replace("\"", "")
-    return filtered_text
+    return normalize_caption(text)
 
 def check_access_token(conn):
     """
@@ -170,23 +89,18 @@ def check_access_token(conn):
     conn.request("GET", endpoint)
     response = conn.getresponse()
     data = json.loads(response.read().decode('utf-8'))
-    print("check_access_token_response = ", data)
 
     expires_at = data["data"]["expires_at"]
-    print("expires_at = ",data["data"]["expires_at"])  
     token_expires_one = datetime.fromtimestamp(expires_at).strftime('%Y-%m-%d %H:%M:%S')
-    print("Token expires on:", token_expires_one)
     current_time = datetime.now().timestamp()  # Current timestamp in UTC
-    print("current_time = ",current_time)
     remaining_days = (expires_at - current_time) / 86400  # Convert seconds to days
-    print("remaining_days = ",int(remaining_days))
+    log.info("Access token checked", valid=data["data"].get("is_valid"), expires_on=token_expires_one,
+             remaining_days=int(remaining_days))
     
     # Check the token's validity
     if int(remaining_days) == 2:
-        print("Access token is invalid or expired. Refreshing...")
+        log.warning("Access token is invalid or expired. Refreshing...")
         refresh_access_token(conn)
-    else:
-        print("Access token is valid.")
 
 def refresh_access_token(conn):
     """Refresh the access token using the App credentials."""
@@ -200,16 +114,16 @@ def refresh_access_token(conn):
     conn.request("GET", f"/{THREADS_API_VERSION}/oauth/access_token?{params}")
     response = conn.getresponse()
     data = json.loads(response.read().decode("utf-8"))
-    print("refresh_access_token_response = ", data)
     if 'access_token' in data:
         new_access_token = data['access_token']
+        register_secret(new_access_token)
         update_env_file("INSTAGRAM_ACCESS_TOKEN", new_access_token)
-        print("Access token refreshed and updated in the .env file.")
+        log.info("Access token refreshed and updated in the .env file.")
         # Reload environment variables to update the token for the current session
         os.environ['INSTAGRAM_ACCESS_TOKEN'] = new_access_token
         ACCESS_TOKEN = new_access_token  # Update in-memory token
     else:
-        print("Failed to refresh access token:", data.get('error', 'Unknown error'))
+        log.error("Failed to refresh access token", error=data.get('error', 'Unknown error'))
 
 def update_env_file(key, value):
     """
@@ -237,16 +151,17 @@ def update_env_file(key, value):
     # Write back the updated content to the file
     with open(env_file, "w") as file:
         file.writelines(updated_lines)
-    print(f"Updated {key} in .env file.")
+    log.info("Updated .env file", key=key)
 
 def create_text_container_with_retry(conn, TEXT, retries=5):
     for attempt in range(retries):
         try:
             return create_text_container(conn, TEXT)
         except http.client.RemoteDisconnected:
-            print(f"Attempt {attempt + 1} failed. Retrying...")
+            log.warning("Container creation failed, retrying", attempt=attempt + 1)
+            run_history.note_retry()
             time.sleep(10)  # Wait before retrying
-    print("All retry attempts failed.")
+    log.error("All retry attempts failed.")
     return None
 
 def create_text_container(conn, TEXT):
@@ -264,8 +179,7 @@ def create_text_container(conn, TEXT):
     data = res.read()
 
     if res.status != 200:
-        print(f"Error creating media container: {res.status} {res.reason}")
-        print(data.decode("utf-8"))
+        log.error("Error creating media container", status=res.status, reason=res.reason, body=data.decode("utf-8"))
         return None
 
     result = json.loads(data.decode("utf-8"))
@@ -284,8 +198,7 @@ def publish_media_container(conn, media_container_id):
     data = res.read()
 
     if res.status != 200:
-        print(f"Error publishing post: {res.status} {res.reason}")
-        print(data.decode("utf-8"))
+        log.error("Error publishing post", status=res.status, reason=res.reason, body=data.decode("utf-8"))
         return None
 
     result = json.loads(data.decode("utf-8"))
@@ -293,7 +206,7 @@ def publish_media_container(conn, media_container_id):
     return result.get("id")
 
 def read_prompt(prompt_file):
-    print (prompt_file)
+    log.info("Reading prompt", prompt_file=prompt_file)
     try:
         with open(prompt_file, "r", encoding="utf-8") as file:
             prompt = file.read()
@@ -303,35 +216,84 @@ def read_prompt(prompt_file):
     except Exception as e:
         return f"An error occurred: {e}"
     
-if __name__ == "__main__":
-    conn = initialize_connection()
-    prompt_file = 'THREADS/prompt_text.txt'
-    user_prompt = read_prompt(prompt_file)
+def generate_text_caption(user_prompt):
+    """
+    Generates and normalizes a caption, falling back to a local one when it is rejected.
 
-    # Check and refresh access token before proceeding
-    print("ACCESS TOKEN = ",THREADS_ACCESS_TOKEN)
-    check_access_token(conn)    
-    print("ACCESS TOKEN = ",THREADS_ACCESS_TOKEN)
+    Returns:
+        tuple: (generated text, normalized caption)
+    """
+    with run_history.phase("caption"), themed_prompt(user_prompt, "text") as prompt:
+        generated_text = get_gemini_caption(prompt.text, THREADS_TEXT_CAPTION_KEY)
+    log.info("Caption generated", text=generated_text)
+    with run_history.phase("normalize"):
+        try:
+            TEXT = filter_generated_text(generated_text)
+        except CaptionRejected as e:
+            log.warning("Generated caption rejected", reason=str(e))
+            run_history.note_fallback("rejected_caption")
+            mark_caption_used(generated_text)
+            TEXT = filter_generated_text(generate_caption("thread"))
+    log.info("Caption normalized", text=TEXT)
+    return generated_text, TEXT
 
-    TEXT = get_gemini_caption(user_prompt, THREADS_TEXT_CAPTION_KEY)
-    print("Generated TEXT:", TEXT)
-    TEXT = filter_generated_text(TEXT)
-    print("Filtered TEXT:", TEXT)
+def publish_text_post(conn, user_prompt, slot=None):
+    """
+    Generates a caption and publishes it as a text post.
 
-    print("Creating text media container...")
-    container_id = create_text_container_with_retry(conn, TEXT)
+    Parameters:
+        conn: HTTP connection object.
+        user_prompt (str): Prompt sent to the caption model.
+        slot (dict): Planned calendar slot whose pre-generated caption is used instead.
 
-    if container_id:
-        print(f"Text container created: {container_id}")
-        print("Publishing media container...")
-        post_id = publish_media_container(conn, container_id)
-        
-        if post_id:
-            print(f"✅ Post published successfully! Post ID: {post_id}")
-        else:
-            print("❌ Failed to publish the post.")
+    Returns:
+        str: The published post ID, or None on failure.
+    """
+    if slot is not None:
+        generated_text, TEXT = slot["generated"], slot["caption"]
+        log.info("Using planned caption", slot=slot["slot"], text=TEXT)
     else:
-        print("❌ Failed to create media container.")
-    
+        generated_text, TEXT = generate_text_caption(user_prompt)
+
+    log.info("Creating text media container...")
+    with run_history.phase("create_container"):
+        container_id = create_text_container_with_retry(conn, TEXT)
+
+    if not container_id:
+        log.error("Failed to create media container.")
+        return None
+
+    log.info("Text container created", container_id=container_id)
+    log.info("Publishing media container...")
+    with run_history.phase("publish"):
+        post_id = publish_media_container(conn, container_id)
+
     if post_id:
-        conn.close()
+        log.info("Post published successfully", post_id=post_id)
+        mark_caption_used(generated_text)
+    else:
+        log.error("Failed to publish the post.")
+    return post_id
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish a text post to Threads")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write cProfile and tracemalloc artifacts next to the run history")
+    args = parser.parse_args()
+
+    conn = initialize_connection()
+    prompt_file = 'THREADS/prompt_text.txt'
+    user_prompt = read_prompt(prompt_file)
+
+    with profiling.profiled("text", args.profile), run_history.recorded_run("text") as run:
+        # Check and refresh access token before proceeding
+        with run_history.phase("token_check"):
+            check_access_token(conn)
+
+        with run_history.phase("calendar"):
+            slot = claim_slot("text")
+        try:
+            run.post_id = publish_text_post(conn, user_prompt, slot)
+        finally:
+            finish_slot(slot, run.post_id)
+    conn.close()
@@ -0,0 +1,161 @@
+import argparse
+import importlib
+import itertools
+import sys
+import time
+
+import profiling
+import run_history
+import structured_log
+
+sys.stdout.reconfigure(encoding='utf-8')
+log = structured_log.get_logger("bot")
+
+# Post type -> (module, publish function, prompt file, counter file)
+POST_TYPES = {
+    "text": ("thread_text", "publish_text_post", "THREADS/prompt_text.txt", None),
+    "poll": ("thread_polls", "publish_poll_post", "THREADS/prompt_polls.txt", None),
+    "image": ("thread_image", "publish_image_post", "THREADS/prompt_image_video.txt", "counter_image.txt"),
+    "video": ("thread_video", "publish_video_post", "THREADS/prompt_image_video.txt", "counter_video.txt"),
+}
+
+
+def parse_types(value):
+    """Parse a comma separated list of post types."""
+    types = [t.strip() for t in value.split(",") if t.strip()]
+    unknown = [t for t in types if t not in POST_TYPES]
+    if not types or unknown:
+        raise argparse.ArgumentTypeError(
+            f"Unknown post type(s): {', '.join(unknown) or value}. Choose from {', '.join(POST_TYPES)}."
+        )
+    return types
+
+
+def write_counter(counter_file, count):
+    """Write the counter value to the file."""
+    with open(counter_file, 'w') as file:
+        file.write(str(count))
+
+
+def publish_batch(types, count, start_counters=None, pause=0.0):
+    """
+    Publishes `count` posts, cycling through `types`, in one process.
+
+    One Graph API connection, one access-token check and one LLM client (per caption key)
+    are shared by every post in the batch. Each post is recorded in the run history.
+    Image and video posts consume consecutive media counters starting at the value in
+    their counter file; a counter only advances when its post is published, and the
+    counter after the last published post is written back so the next run doesn't
+    repost the same media or skip the media of a failed post.
+    Counters passed in `start_counters` are left out of the counter files.
+
+    Parameters:
+        types (list): Post types to cycle through, e.g. ["text", "poll", "image"].
+        count (int): Total number of posts to publish.
+        start_counters (dict): Optional starting counter per media type.
+        pause (float): Seconds to wait between posts.
+
+    Returns:
+        dict: Aggregate results and throughput.
+    """
+    modules = {t: importlib.import_module(POST_TYPES[t][0]) for t in dict.fromkeys(types)}
+    first = modules[types[0]]
+
+    conn = first.initialize_connection()
+    log.info("Checking access token once for the whole batch...")
+    first.check_access_token(conn)
+
+    prompts = {t: first.read_prompt(POST_TYPES[t][2]) for t in modules}
+    counters = {}
+    for t in modules:
+        counter_file = POST_TYPES[t][3]
+        if counter_file:
+            counters[t] = (start_counters or {}).get(t, modules[t].read_counter(counter_file))
+
+    results = {t: {"published": 0, "failed": 0, "seconds": 0.0} for t in modules}
+    posts = []
+    batch_start = time.perf_counter()
+
+    for index, post_type in zip(range(count), itertools.cycle(types)):
+        _, function_name, _, _ = POST_TYPES[post_type]
+        publish = getattr(modules[post_type], function_name)
+        log.info("Publishing post", post=f"{index + 1}/{count}", post_type=post_type,
+                 counter=counters.get(post_type))
+
+        start = time.perf_counter()
+        try:
+            with run_history.recorded_run(post_type) as run:
+                if post_type in counters:
+                    run.post_id = publish(conn, prompts[post_type], counters[post_type])
+                    if run.post_id:
+                        counters[post_type] += 1
+                else:
+                    run.post_id = publish(conn, prompts[post_type])
+            post_id = run.post_id
+        except Exception as e:
+            log.exception("Post raised", post_type=post_type, error=f"{type(e).__name__}: {e}")
+            post_id = None
+        elapsed = time.perf_counter() - start
+
+        results[post_type]["seconds"] += elapsed
+        results[post_type]["published" if post_id else "failed"] += 1
+        posts.append((post_type, post_id, elapsed))
+
+        if pause and index + 1 < count:
+            time.sleep(pause)
+
+    conn.close()
+    for t, counter in counters.items():
+        if t not in (start_counters or {}):
+            write_counter(POST_TYPES[t][3], counter)
+    total_elapsed = time.perf_counter() - batch_start
+    published = sum(r["published"] for r in results.values())
+    return {
+        "requested": count,
+        "published": published,
+        "failed": count - published,
+        "elapsed_s": total_elapsed,
+        "posts_per_min": published / total_elapsed * 60 if total_elapsed else 0.0,
+        "by_type": results,
+        "posts": posts,
+        "next_counters": counters,
+    }
+
+
+def print_summary(summary):
+    print("\n===== Batch summary =====")
+    print(f"Published {summary['published']}/{summary['requested']} posts "
+          f"in {summary['elapsed_s']:.1f}s ({summary['posts_per_min']:.2f} posts/min)")
+    for post_type, result in summary["by_type"].items():
+        done = result["published"] + result["failed"]
+        average = result["seconds"] / done if done else 0.0
+        print(f"  {post_type:<6} ✅ {result['published']}  ❌ {result['failed']}  avg {average:.1f}s/post")
+    for post_type, counter in summary["next_counters"].items():
+        print(f"  next {post_type} counter: {counter}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="threads-bot", description="Threads publishing bot")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = subcommands.add_parser("publish", help="Publish several posts in one process")
+    publish_parser.add_argument("--type", type=parse_types, default=["text"],
+                                help="Comma separated post types: text,poll,image,video")
+    publish_parser.add_argument("--count", type=int, default=1, help="Total number of posts")
+    publish_parser.add_argument("--image-counter", type=int, help="First image counter (default: counter_image.txt)")
+    publish_parser.add_argument("--video-counter", type=int, help="First video counter (default: counter_video.txt)")
+    publish_parser.add_argument("--pause", type=float, default=0.0, help="Seconds to wait between posts")
+    publish_parser.add_argument("--profile", action="store_true",
+                                help="Write cProfile and tracemalloc artifacts next to the run history")
+
+    args = parser.parse_args()
+    if args.command == "publish":
+        start_counters = {}
+        if args.image_counter is not None:
+            start_counters["image"] = args.image_counter
+        if args.video_counter is not None:
+            start_counters["video"] = args.video_counter
+        with profiling.profiled("batch", args.profile):
+            summary = publish_batch(args.type, args.count, start_counters, args.pause)
+        structured_log.flush()
+        print_summary(summary)
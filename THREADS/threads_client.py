@@ -0,0 +1,502 @@
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.parse
+
+from graph_transport import THREADS_HTTP_TIMEOUT
+from mini_http import ConnectFailed, ConnectionPool
+
+THREADS_GRAPH_URL = "https://graph.threads.net"
+# Batchable calls queued within this window share one batch POST; 0 sends every call on its own
+THREADS_BATCH_WINDOW_MS = float(os.environ.get('THREADS_BATCH_WINDOW_MS', '5'))
+# The Graph API accepts at most 50 operations per batch
+BATCH_MAX_SIZE = 50
+# Batch endpoint answers meaning the host doesn't support batching at all
+BATCH_UNSUPPORTED = (400, 404, 405, 501)
+# How far before a lost publish call the account's post list is searched for the post
+PUBLISH_CLOCK_SKEW = 60
+# Container media_type -> media_type of the published post in the account's post list
+LISTED_MEDIA_TYPES = {"TEXT": "TEXT_POST", "CAROUSEL": "CAROUSEL_ALBUM", "REELS": "VIDEO"}
+
+TRANSPORT_ERRORS = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError)
+
+
+class GraphAPIError(Exception):
+    """A Graph API call that failed after retries."""
+
+    def __init__(self, status, payload):
+        super().__init__(f"Graph API error {status}: {payload}")
+        self.status = status
+        self.payload = payload
+
+
+class OutcomeUnknown(GraphAPIError):
+    """A call that must not be sent twice (publishing) failed after the request may have reached the server."""
+
+
+class ContainerFailed(GraphAPIError):
+    """A media container that ended in ERROR or EXPIRED instead of becoming publishable."""
+
+    def __init__(self, container_id, status, message=None):
+        super().__init__(status, message or f"Container {container_id} is {status}")
+        self.container_id = container_id
+
+
+class Account:
+    """
+    One Threads account the client can post as.
+
+    Parameters:
+        user_id (str): Threads user ID.
+        access_token (str): Long-lived access token.
+        name (str): Label used in logs and reports.
+    """
+
+    __slots__ = ("user_id", "access_token", "name")
+
+    def __init__(self, user_id, access_token, name=None):
+        self.user_id = user_id
+        self.access_token = access_token
+        self.name = name or user_id
+
+
+class ThreadsClient:
+    """
+    Async Graph API client that can post for any number of accounts over one keep-alive
+    connection pool per origin.
+
+    429 responses are retried after their Retry-After delay and 5xx/connection errors
+    with exponential backoff and jitter. Publish calls are the exception: they are
+    only re-sent when the request can't have reached the server (429, connect
+    failures), or after the account's post list shows it didn't go out.
+
+    Batchable calls (container creation and reads) issued within `batch_window`
+    seconds of each other are coalesced into one Graph batch request of up to
+    `batch_size` operations, each keeping its own access token, and the results are
+    handed back to the individual callers. Operations the batch didn't complete or
+    that hit a 429/5xx are re-sent on their own with the usual retries; a host that
+    rejects batch requests turns batching off for the rest of the client's life.
+
+    Parameters:
+        base_url (str): Graph API origin, e.g. https://graph.threads.net.
+        api_version (str): Version path segment.
+        max_connections (int): Connections per origin shared by every account.
+        max_retries (int): Retries per request before GraphAPIError is raised.
+        backoff (float): First backoff delay in seconds.
+        timeout (float): Per-request timeout in seconds.
+        batch_window (float): Seconds to collect batchable calls; 0 disables batching.
+        batch_size (int): Operations per batch request.
+    """
+
+    # Publish and post list edges and the post's text field; InstagramClient points them at Instagram's
+    PUBLISH_EDGE = "threads_publish"
+    POSTS_EDGE = "threads"
+    TEXT_FIELD = "text"
+
+    def __init__(self, base_url=THREADS_GRAPH_URL, api_version="v1.0", max_connections=100,
+                 max_retries=4, backoff=0.5, timeout=THREADS_HTTP_TIMEOUT,
+                 batch_window=THREADS_BATCH_WINDOW_MS / 1000, batch_size=BATCH_MAX_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.api_version = api_version
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.pools = {}
+        self.batch_window = batch_window
+        self.batch_size = min(batch_size, BATCH_MAX_SIZE)
+        self.batching = batch_window > 0
+        self._queued = []
+        self._flush_handle = None
+        self._batch_tasks = set()
+        # container ID -> (media_type, text) until it is published, and the post IDs publish returned,
+        # so a lost publish is matched to its own post rather than to any recent one
+        self._unpublished = {}
+        self._published_ids = set()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "server_errors": 0,
+                      "batches": 0, "batched_operations": 0, "batch_fallbacks": 0}
+
+    def _pool(self, url):
+        """Returns (pool, target) for an absolute URL or a path on base_url."""
+        if not url.startswith("http"):
+            url = self.base_url + url
+        parsed = urllib.parse.urlsplit(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        pool = self.pools.get(origin)
+        if pool is None:
+            pool = self.pools[origin] = ConnectionPool(origin, self.max_connections, self.timeout)
+        target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        return pool, target
+
+    async def request(self, method, path, params=None, account=None, batchable=False, idempotent=True):
+        """
+        Sends one Graph API call with retries.
+
+        Parameters:
+            batchable (bool): Allow the call to travel in a batch request.
+            idempotent (bool): False for calls that must not take effect twice; they
+                are only retried when the request can't have reached the server.
+
+        Returns:
+            dict: Decoded JSON body.
+
+        Raises:
+            GraphAPIError: On a 4xx other than 429, or when retries are exhausted.
+            OutcomeUnknown: When a non-idempotent call failed after it may have been received.
+        """
+        params = dict(params or {})
+        if account is not None:
+            params["access_token"] = account.access_token
+        query = urllib.parse.urlencode(params)
+        if path.startswith("http"):
+            return await self._send(method, f"{path}?{query}", idempotent)
+        relative_url = f"{self.api_version}{path}?{query}"
+        if batchable and idempotent and self.batching:
+            return await self._enqueue(method, relative_url)
+        return await self._send(method, f"/{relative_url}", idempotent)
+
+    async def _send(self, method, url, idempotent=True):
+        pool, target = self._pool(url)
+        for attempt in range(self.max_retries + 1):
+            self.stats["requests"] += 1
+            try:
+                response = await pool.request(method, target, idempotent=idempotent)
+            except ConnectFailed as e:
+                status, payload, delay = None, repr(e), self._backoff(attempt)
+            except TRANSPORT_ERRORS as e:
+                if not idempotent:
+                    raise OutcomeUnknown(None, repr(e)) from e
+                status, payload, delay = None, repr(e), self._backoff(attempt)
+            else:
+                if response.status < 400:
+                    return response.json()
+                status, payload = response.status, response.text
+                if status == 429:
+                    self.stats["rate_limited"] += 1
+                    delay = float(response.headers.get("retry-after", 0) or 0) or self._backoff(attempt)
+                elif status >= 500:
+                    self.stats["server_errors"] += 1
+                    if not idempotent:
+                        raise OutcomeUnknown(status, payload)
+                    delay = self._backoff(attempt)
+                else:
+                    raise GraphAPIError(status, payload)
+            if attempt == self.max_retries:
+                raise GraphAPIError(status, payload)
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def _enqueue(self, method, relative_url):
+        future = asyncio.get_running_loop().create_future()
+        self._queued.append((method, relative_url, future))
+        if len(self._queued) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        operations, self._queued = self._queued, []
+        if operations:
+            task = asyncio.create_task(self._send_batch(operations))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _send_operation(self, method, relative_url, future):
+        try:
+            result = await self._send(method, f"/{relative_url}")
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def _send_batch(self, operations):
+        """Sends queued operations as one batch and resolves each caller's future."""
+        leftover = operations
+        if len(operations) > 1 and self.batching:
+            results = await self._post_batch(operations)
+            if results is not None:
+                self.stats["batches"] += 1
+                self.stats["batched_operations"] += len(operations)
+                leftover = []
+                for operation, item in zip(operations, results):
+                    future = operation[2]
+                    code = item.get("code") if isinstance(item, dict) else None
+                    if future.done():
+                        continue  # the caller was cancelled
+                    if code is None or code == 429 or code >= 500:
+                        leftover.append(operation)
+                    elif code < 400:
+                        future.set_result(json.loads(item.get("body") or "{}"))
+                    else:
+                        future.set_exception(GraphAPIError(code, item.get("body")))
+                self.stats["batch_fallbacks"] += len(leftover)
+        await asyncio.gather(*(self._send_operation(*operation) for operation in leftover))
+
+    async def _post_batch(self, operations):
+        """
+        Returns the per-operation results, or None when the batch call itself failed.
+        """
+        # Every relative_url carries its own access_token; the top-level one only authorizes the batch
+        token = urllib.parse.parse_qs(urllib.parse.urlsplit(operations[0][1]).query).get("access_token", [""])[0]
+        batch = [{"method": method, "relative_url": relative_url} for method, relative_url, _ in operations]
+        body = urllib.parse.urlencode({"access_token": token, "batch": json.dumps(batch)}).encode("utf-8")
+        pool, target = self._pool("/")
+        self.stats["requests"] += 1
+        try:
+            response = await pool.request("POST", target, {"Content-Type": "application/x-www-form-urlencoded"}, body)
+        except TRANSPORT_ERRORS:
+            return None
+        if response.status in BATCH_UNSUPPORTED:
+            self.batching = False
+            return None
+        if response.status >= 400:
+            return None
+        try:
+            results = response.json()
+        except ValueError:
+            results = None
+        if not isinstance(results, list) or len(results) != len(operations):
+            self.batching = False
+            return None
+        return results
+
+    def _backoff(self, attempt):
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def create_container(self, account, media_type, text=None, image_url=None, video_url=None,
+                               is_carousel_item=False, children=None, poll_options=None, reply_to_id=None):
+        """
+        Creates a media container.
+
+        Returns:
+            str: The container ID.
+        """
+        params = {"media_type": media_type}
+        if text:
+            params["text"] = text
+        if image_url:
+            params["image_url"] = image_url
+        if video_url:
+            params["video_url"] = video_url
+        if is_carousel_item:
+            params["is_carousel_item"] = "true"
+        if children:
+            params["children"] = ",".join(children)
+        if poll_options:
+            params["poll_attachment"] = poll_options
+        if reply_to_id:
+            params["reply_to_id"] = reply_to_id
+        result = await self.request("POST", f"/{account.user_id}/threads", params, account, batchable=True)
+        if not is_carousel_item:
+            self._unpublished[result["id"]] = (media_type, text)
+        return result["id"]
+
+    async def publish(self, account, creation_id):
+        """
+        Publishes a container and returns the post ID.
+
+        Never batched and never blindly re-sent: after a failure the server may have
+        seen, the container status and the account's post list decide whether the
+        post went out before the call is tried again.
+
+        Raises:
+            OutcomeUnknown: When it can't be told whether the post went out.
+        """
+        started = time.time()
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self.request("POST", f"/{account.user_id}/{self.PUBLISH_EDGE}",
+                                            {"creation_id": creation_id}, account, idempotent=False)
+                return self._published(creation_id, result["id"])
+            except OutcomeUnknown:
+                post_id = await self._published_post(account, creation_id, started)
+                if post_id is not None:
+                    return self._published(creation_id, post_id)
+                if attempt == self.max_retries:
+                    raise
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _published(self, creation_id, post_id):
+        self._unpublished.pop(creation_id, None)
+        self._published_ids.add(post_id)
+        return post_id
+
+    async def _published_post(self, account, creation_id, since):
+        """
+        After a lost publish call: the post ID if the container was published, None
+        when it is safe to publish again.
+
+        A listed post only counts when this client hasn't returned it already and
+        its media type and text match the container's, so a neighbouring post on
+        the same account (the previous part of a chain, a concurrent run) is never
+        taken for this one.
+
+        Raises:
+            OutcomeUnknown: The container is published (or can't be checked) but no
+                single listed post matches it.
+        """
+        try:
+            result = await self.container_status(account, creation_id)
+        except GraphAPIError:
+            result = {}  # Some hosts drop containers once they are published
+        status = result.get("status_code") or result.get("status")
+        if status in ("IN_PROGRESS", "FINISHED", "ERROR", "EXPIRED"):
+            return None
+        try:
+            posts = await self.published_posts(account, since - PUBLISH_CLOCK_SKEW,
+                                               fields=f"id,timestamp,media_type,{self.TEXT_FIELD}")
+        except GraphAPIError as e:
+            raise OutcomeUnknown(e.status, f"Could not check whether {creation_id} was published: {e.payload}") from e
+        media_type, text = self._unpublished.get(creation_id, (None, None))
+        matches = [
+            post for post in posts
+            if post["id"] not in self._published_ids
+            and (media_type is None or post.get("media_type") == LISTED_MEDIA_TYPES.get(media_type, media_type))
+            and (not text or (post.get(self.TEXT_FIELD) or "").strip() == text.strip())
+        ]
+        if len(matches) == 1 and media_type is not None:
+            return matches[0]["id"]
+        if matches or status == "PUBLISHED":
+            raise OutcomeUnknown(None, f"Container {creation_id} may be published but no single listed post matches it")
+        return None
+
+    async def container_status(self, account, container_id):
+        """
+        Returns:
+            dict: The container's status (IN_PROGRESS, FINISHED, PUBLISHED, ERROR, EXPIRED) and error_message.
+        """
+        return await self.request("GET", f"/{container_id}", {"fields": "status,error_message"}, account, batchable=True)
+
+    async def insights(self, account, media_id, metrics=("views", "likes", "replies", "reposts", "quotes")):
+        """
+        Returns:
+            dict: metric name -> value for a published post.
+        """
+        result = await self.request("GET", f"/{media_id}/insights", {"metric": ",".join(metrics)}, account, batchable=True)
+        return {entry["name"]: entry["values"][0]["value"] for entry in result.get("data", [])}
+
+    async def publishing_limit(self, account):
+        """
+        Returns:
+            dict: quota_usage (posts published in the current window) and config
+            with quota_total and quota_duration (seconds).
+        """
+        result = await self.request("GET", f"/{account.user_id}/threads_publishing_limit",
+                                    {"fields": "quota_usage,config"}, account, batchable=True)
+        return result["data"][0]
+
+    async def published_posts(self, account, since, fields="id,timestamp,media_type"):
+        """
+        The account's posts published since the Unix time `since`, newest first.
+
+        Returns:
+            list: Post dicts with `fields`, all pages followed.
+        """
+        params = {"fields": fields, "since": int(since), "limit": 100}
+        posts = []
+        while True:
+            result = await self.request("GET", f"/{account.user_id}/{self.POSTS_EDGE}", params, account, batchable=True)
+            posts.extend(result.get("data", []))
+            paging = result.get("paging", {})
+            # `next` is only present while there are more pages
+            if "next" not in paging or not result.get("data"):
+                return posts
+            params = {**params, "after": paging["cursors"]["after"]}
+
+    async def hide_reply(self, account, reply_id, hide=True):
+        """Hides (or unhides) a reply to one of the account's posts."""
+        result = await self.request("POST", f"/{reply_id}/manage_reply", {"hide": "true" if hide else "false"}, account)
+        return result.get("success", False)
+
+    async def media_exists(self, url):
+        """HEAD probe used to find the day's media files."""
+        pool, target = self._pool(url)
+        try:
+            response = await pool.request("HEAD", target)
+        except TRANSPORT_ERRORS:
+            return False
+        return response.status == 200
+
+    async def aclose(self):
+        self._flush()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        for pool in self.pools.values():
+            await pool.aclose()
+
+
+async def publish_text(client, account, text, reply_to_id=None):
+    """Text post: create container, publish."""
+    container_id = await client.create_container(account, "TEXT", text=text, reply_to_id=reply_to_id)
+    return await client.publish(account, container_id)
+
+
+async def publish_poll(client, account, question, options):
+    """Poll post; `options` are the option_a..option_d fields from normalize_poll."""
+    container_id = await client.create_container(account, "TEXT", text=question, poll_options=json.dumps(options))
+    return await client.publish(account, container_id)
+
+
+async def publish_images(client, account, image_urls, text):
+    """Single image or carousel post; carousel items are created concurrently."""
+    if len(image_urls) == 1:
+        container_id = await client.create_container(account, "IMAGE", text=text, image_url=image_urls[0])
+        return await client.publish(account, container_id)
+    children = await asyncio.gather(*(
+        client.create_container(account, "IMAGE", image_url=url, is_carousel_item=True) for url in image_urls
+    ))
+    container_id = await client.create_container(account, "CAROUSEL", text=text, children=children)
+    return await client.publish(account, container_id)
+
+
+async def publish_video(client, account, video_url, text, processing_wait=30.0):
+    """Video post; waits `processing_wait` seconds for the container to finish processing."""
+    container_id = await client.create_container(account, "VIDEO", text=text, video_url=video_url)
+    await asyncio.sleep(processing_wait)
+    return await client.publish(account, container_id)
+
+
+async def wait_until_ready(client, account, container_id, interval=5.0, timeout=300.0):
+    """
+    Polls a container until it can be published.
+
+    Threads reports `status` and Instagram `status_code`; both use IN_PROGRESS,
+    FINISHED, ERROR and EXPIRED.
+
+    Raises:
+        ContainerFailed: The container ended in ERROR or EXPIRED, or was still
+        processing after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        result = await client.container_status(account, container_id)
+        status = result.get("status_code") or result.get("status")
+        if status in ("FINISHED", "PUBLISHED"):
+            return status
+        if status in ("ERROR", "EXPIRED"):
+            # Instagram puts the error description in `status`
+            detail = result.get("error_message") or (result.get("status") if "status_code" in result else None)
+            raise ContainerFailed(container_id, status, detail)
+        if time.monotonic() + interval > deadline:
+            raise ContainerFailed(container_id, "TIMEOUT", f"Container {container_id} still {status} after {timeout:g}s")
+        await asyncio.sleep(interval)
+
+
+async def probe_media(client, urls):
+    """Returns the leading run of `urls` that exist, probing them concurrently."""
+    found = await asyncio.gather(*(client.media_exists(url) for url in urls))
+    existing = []
+    for url, exists in zip(urls, found):
+        if not exists:
+            break
+        existing.append(url)
+    return existing
@@ -0,0 +1,141 @@
+import asyncio
+import argparse
+import json
+import random
+import sys
+import os
+import time
+import urllib.parse
+
+from webhook_server import sign_payload
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+APP_SECRET = os.environ['APP_SECRET']
+
+SAMPLE_FIELDS = ["replies", "mentions", "publish", "delete"]
+
+
+def synthetic_payload(seq):
+    """Build a Threads-style webhook payload for load testing."""
+    field = SAMPLE_FIELDS[seq % len(SAMPLE_FIELDS)]
+    return {
+        "app_id": "1234567890",
+        "topic": "moderate",
+        "target_id": str(10_000_000 + seq % 5000),
+        "time": int(time.time()),
+        "subscription_id": "987654321",
+        "has_uid_field": False,
+        "values": {
+            "field": field,
+            "value": {
+                "id": str(20_000_000 + seq),
+                "username": f"user_{seq % 997}",
+                "text": random.choice(["🔥🔥", "so cute", "dm me", "check my profile 💸", "👀"]),
+                "media_type": "TEXT_POST",
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime()),
+            },
+        },
+    }
+
+
+def load_payloads(path):
+    """Read captured deliveries (one JSON object per line) for replay."""
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def build_requests(url, payloads, secret=APP_SECRET):
+    """Pre-serialize signed POST requests so the sender spends no time on JSON or HMAC."""
+    parsed = urllib.parse.urlsplit(url)
+    path = parsed.path or "/"
+    requests = []
+    for payload in payloads:
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        head = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {parsed.netloc}\r\n"
+            "Content-Type: application/json\r\n"
+            f"X-Hub-Signature-256: {sign_payload(body, secret)}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        requests.append(head.encode("latin-1") + body)
+    return requests
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def _sender(host, port, requests, counter, total, results, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            seq = counter[0]
+            if seq >= total:
+                break
+            counter[0] += 1
+            start = time.perf_counter()
+            writer.write(requests[seq % len(requests)])
+            await writer.drain()
+            status = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            results[status] = results.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def replay(url, total, concurrency, payloads):
+    """
+    Fire `total` signed deliveries at the webhook over `concurrency` keep-alive connections.
+
+    Returns:
+        dict: Throughput, status counts and latency percentiles.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    requests = build_requests(url, payloads)
+    counter, results, latencies = [0], {}, []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _sender(parsed.hostname, parsed.port or 80, requests, counter, total, results, latencies)
+        for _ in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "sent": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "events_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "status": results,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay signed webhook events against a local receiver")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--file", help="JSON-lines file of captured deliveries to replay")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.file) if args.file else [synthetic_payload(i) for i in range(512)]
+    print(f"Replaying {args.events} events to {args.url} over {args.concurrency} connections...")
+    summary = asyncio.run(replay(args.url, args.events, args.concurrency, payloads))
+    print(json.dumps(summary, indent=2))
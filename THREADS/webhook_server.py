@@ -0,0 +1,223 @@
+import asyncio
+import argparse
+import hashlib
+import hmac
+import json
+import sys
+import os
+
+from mini_http import Response, serve
+from structured_log import get_logger
+
+sys.stdout.reconfigure(encoding='utf-8')
+log = get_logger("webhook_server")
+
+# Meta signs every webhook delivery with the app secret
+APP_SECRET = os.environ['APP_SECRET']
+WEBHOOK_VERIFY_TOKEN = os.environ.get('WEBHOOK_VERIFY_TOKEN', '')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/webhook')
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', '10000'))
+# How long a delivery may wait for queue space before we answer 503 and let Meta retry
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.environ.get('WEBHOOK_ENQUEUE_TIMEOUT', '2.0'))
+
+SIGNATURE_HEADER = "x-hub-signature-256"
+
+
+def sign_payload(body, secret=APP_SECRET):
+    """Return the `X-Hub-Signature-256` header value for a raw body."""
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify_signature(body, header_value, secret=APP_SECRET):
+    """Constant-time check of an `X-Hub-Signature-256` header against the raw body."""
+    if not header_value or not header_value.isascii() or not header_value.startswith("sha256="):
+        return False
+    return hmac.compare_digest(sign_payload(body, secret).encode("ascii"), header_value.encode("ascii"))
+
+
+def parse_events(payload):
+    """
+    Flattens a webhook delivery into a list of events.
+
+    Handles both the Threads shape ({"values": {"field", "value"}}) and the
+    classic Graph shape ({"entry": [{"changes": [...]}]}).
+
+    Returns:
+        list: Dicts with field, value, target_id and time keys.
+    """
+    events = []
+    if "values" in payload:
+        values = payload["values"]
+        if isinstance(values, dict):
+            values = [values]
+        for item in values:
+            events.append({
+                "field": item.get("field", payload.get("topic")),
+                "value": item.get("value"),
+                "target_id": payload.get("target_id"),
+                "time": payload.get("time"),
+            })
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            events.append({
+                "field": change.get("field"),
+                "value": change.get("value"),
+                "target_id": entry.get("id"),
+                "time": entry.get("time"),
+            })
+    return events
+
+
+class WebhookReceiver:
+    """
+    Verifies, parses and queues webhook deliveries for in-process handlers.
+
+    Parameters:
+        app_secret (str): Secret used to validate `X-Hub-Signature-256`.
+        verify_token (str): Token expected in the subscription handshake.
+        queue_size (int): Maximum number of queued events before backpressure kicks in.
+        enqueue_timeout (float): Seconds a delivery waits for queue space before a 503.
+        path (str): URL path the endpoint listens on.
+    """
+
+    def __init__(self, app_secret=APP_SECRET, verify_token=WEBHOOK_VERIFY_TOKEN,
+                 queue_size=WEBHOOK_QUEUE_SIZE, enqueue_timeout=WEBHOOK_ENQUEUE_TIMEOUT,
+                 path=WEBHOOK_PATH):
+        self.app_secret = app_secret
+        self.verify_token = verify_token
+        self.enqueue_timeout = enqueue_timeout
+        self.path = path
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # Notified whenever a worker takes an event, so deliveries can wait for room for all their events
+        self.space = asyncio.Condition()
+        self.handlers = {}
+        self.stats = {"received": 0, "events": 0, "rejected": 0, "throttled": 0,
+                      "handled": 0, "handler_errors": 0}
+
+    def on(self, field, handler):
+        """Register a coroutine handler for an event field ("*" matches every field)."""
+        self.handlers.setdefault(field, []).append(handler)
+
+    async def handle(self, request):
+        """HTTP entry point passed to mini_http.serve."""
+        if request.path != self.path:
+            return Response(404, "Not Found")
+        if request.method == "GET":
+            return self._handshake(request)
+        if request.method != "POST":
+            return Response(405, "Method Not Allowed")
+
+        self.stats["received"] += 1
+        if not verify_signature(request.body, request.headers.get(SIGNATURE_HEADER), self.app_secret):
+            self.stats["rejected"] += 1
+            return Response(401, "Invalid signature")
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            self.stats["rejected"] += 1
+            return Response(400, "Invalid JSON")
+
+        events = parse_events(payload)
+        # Meta redelivers the whole batch after a 503, so a delivery is queued entirely or not at all
+        reserved = min(len(events), self.queue.maxsize) if self.queue.maxsize > 0 else 0
+        try:
+            async with self.space:
+                await asyncio.wait_for(self.space.wait_for(lambda: self._free() >= reserved), self.enqueue_timeout)
+                for event in events[:reserved]:
+                    self.queue.put_nowait(event)
+        except asyncio.TimeoutError:
+            self.stats["throttled"] += 1
+            return Response(503, "Queue full", {"Retry-After": "5"})
+        # Only a delivery larger than the whole queue gets here; it waits instead of answering 503
+        for event in events[reserved:]:
+            await self.queue.put(event)
+        self.stats["events"] += len(events)
+        return Response(200, "EVENT_RECEIVED")
+
+    def _free(self):
+        return self.queue.maxsize - self.queue.qsize()
+
+    def _handshake(self, request):
+        mode = request.query.get("hub.mode")
+        token = request.query.get("hub.verify_token", "")
+        if mode == "subscribe" and self.verify_token and hmac.compare_digest(token, self.verify_token):
+            log.info("Webhook subscription verified.")
+            return Response(200, request.query.get("hub.challenge", ""))
+        log.warning("Webhook verification failed.")
+        return Response(403, "Forbidden")
+
+    async def _worker(self):
+        while True:
+            event = await self.queue.get()
+            async with self.space:
+                self.space.notify_all()
+            handlers = self.handlers.get(event["field"], []) + self.handlers.get("*", [])
+            for handler in handlers:
+                try:
+                    await handler(event)
+                except Exception as e:
+                    self.stats["handler_errors"] += 1
+                    log.exception("Webhook handler error", field=event['field'], error=str(e))
+            self.stats["handled"] += 1
+            self.queue.task_done()
+
+    async def start(self, host="0.0.0.0", port=8080, workers=4):
+        """
+        Start the HTTP endpoint and the dispatch workers.
+
+        Returns:
+            tuple: (asyncio.Server, list of worker tasks).
+        """
+        server = await serve(self.handle, host, port)
+        tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        return server, tasks
+
+
+async def log_event(event):
+    """Default handler: a sampled debug record per event; LOG_LEVEL=debug shows them."""
+    log.debug("Webhook event", field=event['field'], target=event['target_id'], time=event['time'])
+
+
+async def _report_loop(receiver, interval):
+    last = dict(receiver.stats)
+    while True:
+        await asyncio.sleep(interval)
+        current = dict(receiver.stats)
+        rate = (current["events"] - last["events"]) / interval
+        log.info("Webhook stats", events_per_s=round(rate), queued=receiver.queue.qsize(), **current)
+        last = current
+
+
+async def main(args):
+    receiver = WebhookReceiver()
+    if not args.quiet:
+        receiver.on("*", log_event)
+    if args.moderate:
+        from reply_moderation import BlocklistMatcher, ReplyModerator, attach
+        from threads_client import Account, ThreadsClient
+        client = ThreadsClient(f"https://{os.environ['THREADS_BASE_URL']}")
+        account = Account(os.environ['THREADS_USER_ID'], os.environ['THREADS_ACCESS_TOKEN'])
+        attach(receiver, ReplyModerator(BlocklistMatcher(), client, account, dry_run=args.moderate == "dry-run"))
+    server, _ = await receiver.start(args.host, args.port, args.workers)
+    log.info("Listening for webhooks", url=f"http://{args.host}:{args.port}{receiver.path}")
+    asyncio.create_task(_report_loop(receiver, args.report_interval))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Threads webhook receiver")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get('WEBHOOK_PORT', '8080')))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    parser.add_argument("--quiet", action="store_true", help="Do not print every event")
+    parser.add_argument("--moderate", nargs="?", const="hide", choices=("hide", "dry-run"),
+                        help="Hide replies that match the moderation blocklists")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass